@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import history
+from room import LETTERS, choice_index
+
+# Question analytics over the game history files (history.py): how often each
+# question is answered correctly, how long it takes, how often each wrong
+# choice is picked, and how well it separates strong players from weak ones.
+#
+# Everything kept per question is a count or a sum, so new games are simply
+# added on top: update() reads each history file from where the last update
+# stopped, turns the games it finds into columns (one entry per answer) and
+# folds those in with np.bincount.
+#
+#     python analytics.py --state stats.npz HISTORY_DIR [...]
+
+# Time-to-answer histogram: LATENCY_BIN seconds per bucket, the last bucket
+# takes everything slower.
+LATENCY_BIN = 0.5
+LATENCY_BINS = 61
+
+# Discrimination index: correct rate among each game's top players minus the
+# rate among its bottom players, taking this fraction from either end.
+GROUP_FRACTION = 0.27
+
+NO_ANSWER = len(LETTERS)   # choice column used for "no valid choice"
+
+EASY = 0.9
+HARD = 0.2
+MIN_ANSWERS = 20           # fewer answers than this aren't flagged
+
+
+class QuestionStats:
+    def __init__(self):
+        self.keys = {}        # (question, choices) -> question id
+        self.questions = []   # question id -> [question, choices, answer]
+        self.read_to = {}     # history file -> byte offset past the last game counted
+        self.answers = np.zeros(0, np.int64)
+        self.correct = np.zeros(0, np.int64)
+        self.choices = np.zeros((0, NO_ANSWER + 1), np.int64)
+        self.latency = np.zeros((0, LATENCY_BINS), np.int64)
+        self.latency_sum = np.zeros(0, np.float64)
+        self.upper = np.zeros((0, 2), np.int64)   # answers, correct
+        self.lower = np.zeros((0, 2), np.int64)
+
+    # -------- question ids --------
+    def _qid(self, question, choices, answer):
+        key = (question, tuple(choices))
+        qid = self.keys.get(key)
+        if qid is None:
+            qid = self.keys[key] = len(self.questions)
+            self.questions.append([question, list(choices), answer])
+        return qid
+
+    def _grow(self):
+        n = len(self.questions)
+        if n <= len(self.answers):
+            return
+        extra = max(n, 2 * len(self.answers)) - len(self.answers)
+        for name in ("answers", "correct", "choices", "latency", "latency_sum", "upper", "lower"):
+            a = getattr(self, name)
+            setattr(self, name, np.concatenate([a, np.zeros((extra,) + a.shape[1:], a.dtype)]))
+
+    # -------- reading games --------
+    def update(self, paths):
+        # Adds games finished since the last update. Returns how many.
+        cols = {"qid": [], "choice": [], "correct": [], "latency": [], "group": []}
+        added = 0
+        for path in history.history_files(paths):
+            key = os.path.abspath(path)
+            start = self.read_to.get(key, 0)
+            if os.path.getsize(path) < start:
+                start = 0  # shorter than last time: a new file under the same name
+            for end, game in _games(path, start):
+                self._columns(game, cols)
+                self.read_to[key] = end
+                added += 1
+        if cols["qid"]:
+            self._fold({k: np.asarray(v) for k, v in cols.items()})
+        return added
+
+    def _columns(self, game, cols):
+        # One entry per answer. group: 1 top players, -1 bottom, 0 neither.
+        questions, answers = game
+        if not answers:
+            return
+        players = {}
+        for _, username, _ in answers:
+            players.setdefault(username, len(players))
+        player = np.fromiter((players[u] for _, u, _ in answers), np.int64, len(answers))
+        right = np.fromiter((a[2]["correct"] for a in answers), bool, len(answers))
+
+        group = np.zeros(len(answers), np.int8)
+        n = len(players)
+        if n >= 2:
+            k = max(1, int(round(n * GROUP_FRACTION)))
+            k = min(k, n // 2)
+            totals = np.bincount(player, weights=right, minlength=n)
+            # Stable sort so ties don't depend on anything but join order.
+            order = np.argsort(-totals, kind="stable")
+            rank = np.empty(n, np.int64)
+            rank[order] = np.arange(n)
+            group = np.where(rank[player] < k, 1, np.where(rank[player] >= n - k, -1, 0)).astype(np.int8)
+
+        for (index, _, a), g in zip(answers, group):
+            q = questions.get(index)
+            if q is None:
+                continue
+            cols["qid"].append(self._qid(*q))
+            cols["choice"].append(a["choice"] if 0 <= a["choice"] < NO_ANSWER else NO_ANSWER)
+            cols["correct"].append(a["correct"])
+            cols["latency"].append(a["latency"])
+            cols["group"].append(g)
+
+    def _fold(self, c):
+        self._grow()
+        size = len(self.answers)
+        qid, correct = c["qid"], c["correct"].astype(bool)
+        self.answers += np.bincount(qid, minlength=size)
+        self.correct += np.bincount(qid[correct], minlength=size)
+
+        width = self.choices.shape[1]
+        self.choices += np.bincount(qid * width + c["choice"], minlength=size * width).reshape(size, width)
+
+        latency = c["latency"].astype(np.float64)
+        bins = np.minimum((np.maximum(latency, 0) / LATENCY_BIN).astype(np.int64), LATENCY_BINS - 1)
+        self.latency += np.bincount(qid * LATENCY_BINS + bins,
+                                    minlength=size * LATENCY_BINS).reshape(size, LATENCY_BINS)
+        self.latency_sum += np.bincount(qid, weights=latency, minlength=size)
+
+        for value, target in ((1, self.upper), (-1, self.lower)):
+            sel = c["group"] == value
+            target[:, 0] += np.bincount(qid[sel], minlength=size)
+            target[:, 1] += np.bincount(qid[sel & correct], minlength=size)
+
+    # -------- results --------
+    def report(self):
+        # One dict per question, in question id order.
+        n = len(self.questions)
+        answers = self.answers[:n]
+        seen = np.maximum(answers, 1)
+        rate = self.correct[:n] / seen
+        mean = self.latency_sum[:n] / seen
+        cum = np.cumsum(self.latency[:n], axis=1)
+        # Upper edge of the bucket holding the median / 90th percentile.
+        median = (np.argmax(cum >= 0.5 * answers[:, None], axis=1) + 1) * LATENCY_BIN
+        p90 = (np.argmax(cum >= 0.9 * answers[:, None], axis=1) + 1) * LATENCY_BIN
+        picks = self.choices[:n] / seen[:, None]
+        upper = self.upper[:n, 1] / np.maximum(self.upper[:n, 0], 1)
+        lower = self.lower[:n, 1] / np.maximum(self.lower[:n, 0], 1)
+        discrimination = upper - lower
+
+        rows = []
+        for qid, (question, choices, answer) in enumerate(self.questions):
+            correct = choice_index({"choices": choices}, answer, prefer_text=True)
+            distractors = {LETTERS[i]: float(picks[qid, i]) for i in range(min(len(choices), NO_ANSWER))
+                           if i != correct}
+            row = {
+                "question": question,
+                "answers": int(answers[qid]),
+                "correct_rate": float(rate[qid]),
+                "mean_time": float(mean[qid]),
+                "median_time": float(median[qid]),
+                "p90_time": float(p90[qid]),
+                "distractors": distractors,
+                "no_answer": float(picks[qid, NO_ANSWER]),
+                "discrimination": float(discrimination[qid]),
+            }
+            row["flags"] = _flags(row)
+            rows.append(row)
+        return rows
+
+    # -------- saving --------
+    def save(self, path):
+        meta = {"questions": self.questions, "read_to": self.read_to}
+        n = len(self.questions)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, meta=np.array(json.dumps(meta)), answers=self.answers[:n], correct=self.correct[:n],
+                choices=self.choices[:n], latency=self.latency[:n], latency_sum=self.latency_sum[:n],
+                upper=self.upper[:n], lower=self.lower[:n])
+
+    @classmethod
+    def load(cls, path):
+        stats = cls()
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            for name in ("answers", "correct", "choices", "latency", "latency_sum", "upper", "lower"):
+                setattr(stats, name, data[name])
+        stats.questions = meta["questions"]
+        stats.keys = {(q, tuple(choices)): i for i, (q, choices, _) in enumerate(stats.questions)}
+        stats.read_to = meta["read_to"]
+        return stats
+
+
+def _games(path, start=0):
+    # Finished games in one history file from byte offset `start`, as
+    # (offset past the game's last record, ({index: (question, choices,
+    # answer)}, [(index, username, answer fields), ...])). A game still being
+    # played is left for a later update.
+    questions, answers = {}, []
+    playing = False
+    for end, kind, _, values in history.records(path, ("start", "question", "answer", "end", "close"), start):
+        e = history.event(kind, values)
+        if kind == "start":
+            questions, answers = {}, []
+            playing = True
+        elif kind == "question":
+            questions[e["index"]] = (e["question"], e["choices"], e["answer"])
+        elif kind == "answer":
+            answers.append((e["index"], e["username"], e))
+        elif playing:
+            # Game over, or the room closed in the middle of it.
+            playing = False
+            yield end, (questions, answers)
+
+
+def _flags(row):
+    if row["answers"] < MIN_ANSWERS:
+        return []
+    flags = []
+    if row["correct_rate"] >= EASY:
+        flags.append("too easy")
+    elif row["correct_rate"] <= HARD:
+        flags.append("too hard")
+    if any(rate > row["correct_rate"] for rate in row["distractors"].values()):
+        flags.append("distractor beats answer")
+    if row["discrimination"] < 0:
+        flags.append("weak players do better")
+    return flags
+
+
+def print_report(rows, flagged_only=False):
+    for row in sorted(rows, key=lambda r: (not r["flags"], r["correct_rate"])):
+        if flagged_only and not row["flags"]:
+            continue
+        picks = " ".join(f"{letter}:{rate:.0%}" for letter, rate in row["distractors"].items())
+        print(f"{row['question'][:60]:<60} n={row['answers']:<6} correct {row['correct_rate']:.0%}  "
+              f"median {row['median_time']:.1f}s p90 {row['p90_time']:.1f}s  "
+              f"D={row['discrimination']:+.2f}  wrong picks {picks}"
+              + (f"  [{', '.join(row['flags'])}]" if row["flags"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Question analytics from Trivia history files")
+    parser.add_argument("paths", nargs="+", help="history files or directories")
+    parser.add_argument("--state", metavar="FILE",
+                        help="keep totals in FILE and only read games added since the last run")
+    parser.add_argument("--flagged", action="store_true", help="only list questions with a flag")
+    args = parser.parse_args()
+
+    stats = QuestionStats.load(args.state) if args.state and os.path.exists(args.state) else QuestionStats()
+    added = stats.update(args.paths)
+    if args.state:
+        stats.save(args.state)
+    print(f"{added} new games, {len(stats.questions)} questions")
+    print_report(stats.report(), args.flagged)
@@ -0,0 +1,214 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import question_import
+
+# Compiled question banks (.tqb): a library of any size that the server
+# memory-maps instead of holding as Python dicts. Every room and every process
+# using the same file shares the one mapping through the page cache.
+#
+#     header   HEADER
+#     heap     UTF-8 text of all questions, back to back
+#     index    one RECORD per question: heap offset of its first field and
+#              the byte length of each field in FIELDS order
+#     columns  category codes (u16 each), difficulty codes (u16), weights (f32)
+#     names    JSON {"category": [...], "difficulty": [...]}; code 0 is ""
+#
+# Question i is a fixed-size read at index + i * RECORD.size plus slices of
+# the heap, so fetching one never touches the rest of the file. Category and
+# difficulty are stored as codes so the server can index a whole library
+# without decoding any text.
+#
+#     python bankfile.py compile questions.csv [more.csv|.xlsx ...] -o library.tqb
+#     python bankfile.py info library.tqb
+
+MAGIC = b"TQB1"
+VERSION = 1
+FIELDS = ("question", "choice1", "choice2", "choice3", "choice4", "answer")
+CODED = ("category", "difficulty")
+SUFFIX = ".tqb"
+
+HEADER = struct.Struct("<4sHHQQQQQ")  # magic, version, field count, questions, then the
+                                      # offsets of heap, index, columns, names
+RECORD = struct.Struct("<Q6H")        # heap offset, field lengths
+MAX_FIELD = 0xFFFF                    # bytes per field
+MAX_NAMES = 0xFFFF                    # distinct categories / difficulties
+
+
+class BankFileError(ValueError):
+    pass
+
+
+class BankFile:
+    """Read-only view of a compiled bank. Sequence of question dicts."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # mmap refuses empty files with a plain ValueError.
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise BankFileError(f"{path}: not a question bank")
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise BankFileError(f"{path}: {e}") from None
+        self._buf = memoryview(self._mm)
+        (magic, version, nfields, self.count,
+         self._heap, index, columns, names) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION or nfields != len(FIELDS):
+            raise BankFileError(f"{path}: not a version {VERSION} question bank")
+        n = self.count
+        if names > len(self._mm) or columns + n * 8 != names or index + n * RECORD.size > columns:
+            raise BankFileError(f"{path}: truncated")
+        self._index = self._buf[index:index + n * RECORD.size]
+        self._codes = {
+            "category": self._column(columns, n, "H"),
+            "difficulty": self._column(columns + 2 * n, n, "H"),
+        }
+        self._weights = self._column(columns + 4 * n, n, "f")
+        try:
+            self.names = json.loads(str(self._buf[names:], "utf-8"))
+        except ValueError as e:  # JSONDecodeError, UnicodeDecodeError
+            raise BankFileError(f"{path}: bad names block: {e}") from None
+        if not isinstance(self.names, dict) or not all(isinstance(self.names.get(f), list) for f in CODED):
+            raise BankFileError(f"{path}: bad names block")
+
+    def _column(self, offset, n, typecode):
+        view = self._buf[offset:offset + n * array(typecode).itemsize]
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        column = array(typecode, view)  # stored little-endian
+        column.byteswap()
+        return column
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, index):
+        # Zero-copy: one memoryview per text field.
+        start, *lengths = RECORD.unpack_from(self._index, index * RECORD.size)
+        pos = self._heap + start
+        fields = []
+        for n in lengths:
+            fields.append(self._buf[pos:pos + n])
+            pos += n
+        return fields
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("question index out of range")
+        question, a, b, c, d, answer = (str(f, "utf-8") for f in self.raw(index))
+        q = {"question": question, "choices": [a, b, c, d], "answer": answer}
+        for field in CODED:
+            value = self.names[field][self._codes[field][index]]
+            if value:
+                q[field] = value
+        weight = self._weights[index]
+        if weight != 1.0:
+            q["weight"] = weight
+        return q
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def codes(self, field):
+        # (names, code per question) for "category" or "difficulty"; the
+        # codes are a view straight onto the file.
+        return self.names[field], self._codes[field]
+
+    def weights(self):
+        return self._weights
+
+
+# ───────────────────────────────────────────────
+# COMPILING
+# ───────────────────────────────────────────────
+def read_source(path):
+    # Any layout question_import understands.
+    if path.lower().endswith((".xlsx", ".xls")):
+        return question_import.read_xlsx(path)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        header = f.readline().lower()
+    if header.startswith("question,") and "answer" in header:
+        return question_import.iter_csv_with_header(path)
+    return question_import.iter_csv_rows(path)
+
+
+def compile_bank(sources, out_path):
+    # Streams the heap straight to disk; only the index and columns are
+    # kept in memory (24 bytes per question). Returns the question count.
+    index = bytearray()
+    names = {field: {"": 0} for field in CODED}
+    codes = {field: array("H") for field in CODED}
+    weights = array("f")
+    heap_size = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(bytes(HEADER.size))
+        for source in sources:
+            for q in read_source(source):
+                choices = list(q["choices"])[:4]
+                values = [q["question"], *choices, *[""] * (4 - len(choices)), q["answer"]]
+                encoded = [str(v).encode("utf-8") for v in values]
+                if any(len(e) > MAX_FIELD for e in encoded):
+                    raise BankFileError(f"{source}: field longer than {MAX_FIELD} bytes: {values[0][:40]!r}")
+                for field in CODED:
+                    table = names[field]
+                    value = str(q.get(field, "")).strip()
+                    code = table.get(value)
+                    if code is None:
+                        if len(table) > MAX_NAMES:
+                            raise BankFileError(f"{source}: more than {MAX_NAMES} {field} values")
+                        code = table[value] = len(table)
+                    codes[field].append(code)
+                weights.append(float(q.get("weight", 1.0)))
+                index += RECORD.pack(heap_size, *map(len, encoded))
+                chunk = b"".join(encoded)
+                f.write(chunk)
+                heap_size += len(chunk)
+
+        count = len(weights)
+        index_offset = HEADER.size + heap_size
+        columns_offset = index_offset + len(index)
+        names_offset = columns_offset + 8 * count
+        f.write(index)
+        for column in (codes["category"], codes["difficulty"], weights):
+            if sys.byteorder != "little":
+                column.byteswap()
+            f.write(column.tobytes())
+        f.write(json.dumps({field: list(names[field]) for field in CODED}).encode("utf-8"))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(FIELDS), count,
+                            HEADER.size, index_offset, columns_offset, names_offset))
+    os.replace(tmp, out_path)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile and inspect Trivia question banks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("compile", help="build a .tqb file from CSV/XLSX question files")
+    p.add_argument("sources", nargs="+")
+    p.add_argument("-o", "--output", required=True)
+    p = commands.add_parser("info", help="summarise a .tqb file")
+    p.add_argument("file")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        n = compile_bank(args.sources, args.output)
+        print(f"{n} questions written to {args.output}")
+    else:
+        bank = BankFile(args.file)
+        categories = [c for c in bank.names["category"] if c]
+        print(f"{len(bank)} questions, {os.path.getsize(args.file)} bytes")
+        print(f"categories: {', '.join(categories) or '-'}")
+        if len(bank):
+            print(f"first: {bank[0]}")
@@ -1,12 +1,13 @@
+import startup  # first, so the startup report covers every other import
 import sys
 import json
 import socket
 import threading
-import csv
-import pandas as pd
+from chatlog import ChatLog
+from scoreboard import Scoreboard
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QTextEdit, QListWidget, QMessageBox, QFileDialog
+    QPushButton, QMessageBox, QFileDialog
 )
 from PyQt6.QtCore import Qt, QTimer
 
@@ -94,17 +95,18 @@ class ChatWindow(QWidget):
         left_layout = QVBoxLayout()
         right_layout = QVBoxLayout()
 
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
+        self.chat_display = ChatLog()
+        self.timer_label = QLabel("")
         self.chat_input = QLineEdit()
         self.chat_input.returnPressed.connect(self.send_message)
 
         left_layout.addWidget(QLabel(f"Logged in as: {username}"))
         left_layout.addWidget(self.chat_display)
+        left_layout.addWidget(self.timer_label)
         left_layout.addWidget(self.chat_input)
 
         self.player_list_label = QLabel("Players:")
-        self.player_list = QListWidget()
+        self.player_list = Scoreboard()
         right_layout.addWidget(self.player_list_label)
         right_layout.addWidget(self.player_list)
 
@@ -170,24 +172,12 @@ class ChatWindow(QWidget):
         if not file_path:
             return
         try:
-            questions = []
+            # Loaded on first upload; the XLSX path pulls in pandas
+            import question_import
             if file_path.lower().endswith(".csv"):
-                with open(file_path, newline="", encoding="utf-8") as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    for row in reader:
-                        q = row.get("question", "").strip()
-                        choices = [row.get(f"choice{i}", "").strip() for i in range(1, 5)]
-                        answer = row.get("answer", "").strip()
-                        if q and all(choices) and answer:
-                            questions.append({"question": q, "choices": choices, "answer": answer})
+                questions = question_import.read_csv_with_header(file_path)
             else:
-                df = pd.read_excel(file_path, header=None)
-                for _, row in df.iterrows():
-                    q = str(row.iloc[0]).strip() if not pd.isna(row.iloc[0]) else ""
-                    choices = [str(row.iloc[i]).strip() for i in range(1, 5) if not pd.isna(row.iloc[i])]
-                    answer = str(row.iloc[5]).strip() if len(row) > 5 and not pd.isna(row.iloc[5]) else ""
-                    if q and len(choices) == 4 and answer:
-                        questions.append({"question": q, "choices": choices, "answer": answer})
+                questions = question_import.read_xlsx(file_path)
 
             if not questions:
                 QMessageBox.warning(self, "No Data", "No valid questions found.")
@@ -215,20 +205,17 @@ class ChatWindow(QWidget):
         self.timer.start(1000)
 
     def update_timer(self):
+        # Ticks update a label in place; only the end of the round is logged.
         if self.time_remaining > 0:
             self.time_remaining -= 1
-            self.chat_display.append(f"[Timer] {self.time_remaining}s left...")
+            self.timer_label.setText(f"[Timer] {self.time_remaining}s left...")
         else:
             self.timer.stop()
+            self.timer_label.setText("")
             self.chat_display.append("[Timer] Time’s up!")
 
     def update_scoreboard(self, players):
-        self.player_list.clear()
-        for p in players:
-            label = f"{p['username']}: {p['score']}"
-            if p.get("is_host"):
-                label += " (HOST)"
-            self.player_list.addItem(label)
+        self.player_list.apply(players)
 
 
 # ---------------- CLIENT LISTENER ----------------
@@ -256,6 +243,9 @@ class ClientListener(threading.Thread):
             self.chat_window.chat_display.append(f"[System] {msg}")
         elif t == "chat":
             self.chat_window.chat_display.append(f"{message.get('username')}: {message.get('message')}")
+        elif t == "chat_batch":
+            for m in message.get("messages", []):
+                self.chat_window.chat_display.append(f"{m.get('username')}: {m.get('message')}")
         elif t == "player_list":
             self.chat_window.update_scoreboard(message.get("players", []))
         elif t in ("question_start", "question"):
@@ -277,4 +267,6 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     win = LoginWindow()
     win.show()
+    if startup.enabled():
+        QTimer.singleShot(0, lambda: startup.report_and_quit(app, "login window shown"))
     sys.exit(app.exec())
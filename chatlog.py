@@ -0,0 +1,101 @@
+import threading
+from collections import deque
+
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, pyqtSignal
+
+# Lines kept in memory. Older lines fall off the top, so a multi-hour session
+# costs the same as a five-minute one.
+CAPACITY = 5000
+
+
+# ───────────────────────────────────────────────
+# MODEL: fixed-capacity ring buffer of lines
+# ───────────────────────────────────────────────
+class ChatLogModel(QAbstractListModel):
+    def __init__(self, capacity=CAPACITY, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.lines = deque(maxlen=capacity)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self.lines[index.row()]
+        return None
+
+    def append_lines(self, new_lines):
+        if not new_lines:
+            return
+        new_lines = new_lines[-self.capacity:]
+
+        # Evict from the front first so the view sees one remove + one insert
+        # per batch, however many lines arrived.
+        overflow = len(self.lines) + len(new_lines) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.lines.popleft()
+            self.endRemoveRows()
+
+        start = len(self.lines)
+        self.beginInsertRows(QModelIndex(), start, start + len(new_lines) - 1)
+        self.lines.extend(new_lines)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.lines.clear()
+        self.endResetModel()
+
+
+# ───────────────────────────────────────────────
+# VIEW: drop-in for a read-only QTextEdit log
+# ───────────────────────────────────────────────
+class ChatLog(QListView):
+    _flush_requested = pyqtSignal()
+
+    def __init__(self, capacity=CAPACITY, parent=None):
+        super().__init__(parent)
+        self.log_model = ChatLogModel(capacity, self)
+        self.setModel(self.log_model)
+
+        # Uniform rows let the view lay out and paint only what's visible.
+        self.setUniformItemSizes(True)
+        self.setWordWrap(False)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+
+        # append() may be called from any thread; lines are collected here and
+        # inserted on the GUI thread once per event-loop cycle.
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_requested.connect(self._flush, Qt.ConnectionType.QueuedConnection)
+
+    def append(self, text):
+        lines = str(text).split("\n")
+        with self._pending_lock:
+            first = not self._pending
+            self._pending.extend(lines)
+        if first:
+            self._flush_requested.emit()
+
+    def clear(self):
+        with self._pending_lock:
+            self._pending = []
+        self.log_model.clear()
+
+    def _flush(self):
+        with self._pending_lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return
+
+        bar = self.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+        self.log_model.append_lines(lines)
+        if at_bottom:
+            self.scrollToBottom()
@@ -0,0 +1,195 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Time, timers and threads for the round engine. The server normally runs on
+# RealClock; simulate.py swaps in a SimClock so whole games play out on a
+# virtual clock, as fast as the CPU allows and the same way every run.
+#
+# A clock provides:
+#     time()                  seconds, like time.time()
+#     monotonic()             like time.monotonic()
+#     sleep(seconds)
+#     event()                 a threading.Event work-alike
+#     spawn(target, *args)    start target(*args) on a new thread
+
+# Virtual time starts here (2024-01-01 UTC) so timestamps look like real ones.
+SIM_EPOCH = 1704067200.0
+
+
+class RealClock:
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def event(self):
+        return threading.Event()
+
+    def spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+
+class SimulationStalled(RuntimeError):
+    pass
+
+
+class _Task:
+    # A simulated thread. `gate` is held locked while it waits for its turn;
+    # `episode` counts the times it blocked, so wake-ups left over from an
+    # earlier wait (a timeout that lost to the event, say) are ignored.
+    __slots__ = ("gate", "episode")
+
+    def __init__(self):
+        self.gate = threading.Lock()
+        self.gate.acquire()
+        self.episode = 0
+
+
+class SimClock:
+    """Virtual time. Threads started with spawn() (and the one in run()) take
+    turns: exactly one runs at a time, until it sleeps, waits on an event or
+    returns. Then virtual time jumps to the earliest pending wake-up and
+    that thread runs; ties go in the order they were scheduled. Nothing
+    waits in real time, and a run depends only on its inputs.
+
+    Simulated threads must only block through the clock (sleep, event
+    waits, reads on simulate.MemoryConn) and never while holding a lock
+    another simulated thread might need.
+    """
+
+    def __init__(self, start=SIM_EPOCH):
+        self.now = float(start)
+        self.switches = 0
+        self.errors = []   # exceptions that ended a simulated thread
+        self._heap = []    # (time, seq, task, episode)
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._main = None
+        self._finished = False
+        self._stalled = False
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def event(self):
+        return SimEvent(self)
+
+    def sleep(self, seconds):
+        task = self._current()
+        self._wake(task, self.now + max(0.0, seconds))
+        self._block(task)
+
+    def spawn(self, target, *args):
+        task = _Task()
+        self._wake(task, self.now)
+        thread = threading.Thread(target=self._run_task, args=(task, target, args), daemon=True)
+        thread.start()
+        return thread
+
+    def run(self, main, *args):
+        # Runs main(*args) as the first simulated thread and returns its
+        # result. Whatever is still scheduled when it returns never runs.
+        if self._main is not None:
+            raise RuntimeError("a SimClock runs once")
+        task = self._main = _Task()
+        self._local.task = task
+        try:
+            return main(*args)
+        finally:
+            self._finished = True
+            self._local.task = None
+
+    # -------- scheduling --------
+    def _current(self):
+        task = getattr(self._local, "task", None)
+        if task is None:
+            raise RuntimeError("SimClock used from a thread it didn't start")
+        return task
+
+    def _wake(self, task, at):
+        heapq.heappush(self._heap, (at, next(self._seq), task, task.episode))
+
+    def _next(self):
+        while self._heap:
+            at, _, task, episode = heapq.heappop(self._heap)
+            if episode == task.episode:
+                task.episode += 1
+                self.now = max(self.now, at)
+                return task
+        return None
+
+    def _block(self, task):
+        self._pass(task)
+        if self._stalled and task is self._main:
+            raise SimulationStalled(f"every simulated thread is waiting (t={self.now - SIM_EPOCH:.3f})")
+
+    def _pass(self, task):
+        # Gives the turn to whatever is due next and, unless `task` is
+        # finishing (None), waits for it to come back.
+        nxt = self._next()
+        if nxt is None:
+            # Nothing will ever wake anyone: hand the main thread the news.
+            self._stalled = True
+            if task is self._main or self._finished:
+                return
+            nxt = self._main
+        elif nxt is task:
+            return
+        self.switches += 1
+        nxt.gate.release()
+        if task is not None:
+            task.gate.acquire()
+
+    def _run_task(self, task, target, args):
+        task.gate.acquire()
+        self._local.task = task
+        try:
+            target(*args)
+        except BaseException as e:
+            self.errors.append(e)
+        finally:
+            self._pass(None)
+
+
+class SimEvent:
+    """threading.Event on a SimClock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.flag = False
+        self.waiters = []   # (task, episode)
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        self.flag = True
+        for task, episode in self.waiters:
+            if episode == task.episode:
+                self.clock._wake(task, self.clock.now)
+        self.waiters.clear()
+
+    def clear(self):
+        self.flag = False
+
+    def wait(self, timeout=None):
+        if self.flag:
+            return True
+        clock = self.clock
+        task = clock._current()
+        self.waiters.append((task, task.episode))
+        if timeout is not None:
+            clock._wake(task, clock.now + max(0.0, timeout))
+        clock._block(task)
+        return self.flag
@@ -0,0 +1,172 @@
+from PyQt6.QtWidgets import QLabel
+from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, pyqtProperty
+from PyQt6.QtGui import QColor, QFont, QPalette
+
+# ───────────────────────────────────────────────
+# ANSWER BUTTON STATES
+# ───────────────────────────────────────────────
+# Parsed once, on the game frame. Buttons switch look by changing their
+# "answerState" property and re-polishing; the sheet itself is never rebuilt.
+NORMAL = "normal"
+SELECTED = "selected"
+DIMMED = "dimmed"
+
+GAME_FRAME_STYLE = """
+    QFrame {
+        background-color: #1e1e1e;
+        border-radius: 12px;
+    }
+    QPushButton {
+        border: 2px solid #00c8ff;
+        border-radius: 20px;
+        padding: 10px;
+        background-color: #2b2b2b;
+        color: #00c8ff;
+        font-size: 16px;
+        text-align: left;
+    }
+    QPushButton[answerState="normal"]:hover { background-color: #3a3a3a; }
+    QPushButton[answerState="normal"]:pressed { background-color: #444444; }
+    QPushButton[answerState="normal"]:disabled { border-color: #555555; color: #555555; }
+    QPushButton[answerState="selected"] { background-color: #005f7f; }
+    QPushButton[answerState="dimmed"] {
+        border-color: #444444;
+        background-color: #1c1c1c;
+        color: #444444;
+    }
+"""
+
+
+def set_answer_state(button, state):
+    if button.property("answerState") == state:
+        return
+    button.setProperty("answerState", state)
+    style = button.style()
+    style.unpolish(button)
+    style.polish(button)
+
+
+# ───────────────────────────────────────────────
+# COUNTDOWN LABEL
+# ───────────────────────────────────────────────
+BASE_COLOR = QColor("#00c8ff")
+BLINK_COLORS = (QColor("#ffd93b"), QColor("#ff3b3b"))
+BLINK_PERIOD_MS = 700
+GROW_MS = 250
+
+
+def font_size_for(remaining):
+    if remaining <= 1:
+        return 140
+    if remaining == 2:
+        return 120
+    if remaining == 3:
+        return 100
+    if remaining == 4:
+        return 80
+    if remaining == 5:
+        return 60
+    return 40
+
+
+class CountdownLabel(QLabel):
+    """Timer label driven by property animations instead of stylesheets.
+
+    Fonts and palettes for each step are built once and reused; the blink
+    only touches the palette when the colour actually flips.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.setContentsMargins(0, 40, 0, 0)
+
+        self._fonts = {}
+        self._palettes = {}
+        self._size = 0
+        self._color = None
+        self._phase = 0.0
+
+        self._grow = QPropertyAnimation(self, b"pixelSize", self)
+        self._grow.setDuration(GROW_MS)
+        self._grow.setEasingCurve(QEasingCurve.Type.OutBack)
+
+        self._blink = QPropertyAnimation(self, b"blinkPhase", self)
+        self._blink.setDuration(BLINK_PERIOD_MS)
+        self._blink.setStartValue(0.0)
+        self._blink.setEndValue(1.0)
+        self._blink.setLoopCount(-1)
+
+        self._apply_size(font_size_for(99))
+        self._apply_color(BASE_COLOR)
+
+    # -------- cached fonts / palettes --------
+    def _apply_size(self, size):
+        if size == self._size:
+            return
+        self._size = size
+        font = self._fonts.get(size)
+        if font is None:
+            font = QFont(self.font())
+            font.setBold(True)
+            font.setPixelSize(size)
+            self._fonts[size] = font
+        self.setFont(font)
+
+    def _apply_color(self, color):
+        if color is self._color:
+            return
+        self._color = color
+        palette = self._palettes.get(color.name())
+        if palette is None:
+            palette = QPalette(self.palette())
+            palette.setColor(QPalette.ColorRole.WindowText, color)
+            self._palettes[color.name()] = palette
+        self.setPalette(palette)
+
+    # -------- animated properties --------
+    def _get_pixel_size(self):
+        return self._size
+
+    def _set_pixel_size(self, size):
+        self._apply_size(int(size))
+
+    pixelSize = pyqtProperty(int, _get_pixel_size, _set_pixel_size)
+
+    def _get_blink_phase(self):
+        return self._phase
+
+    def _set_blink_phase(self, phase):
+        self._phase = phase
+        self._apply_color(BLINK_COLORS[0] if phase < 0.5 else BLINK_COLORS[1])
+
+    blinkPhase = pyqtProperty(float, _get_blink_phase, _set_blink_phase)
+
+    # -------- public API --------
+    def set_remaining(self, remaining):
+        self.setText(str(remaining))
+        target = font_size_for(remaining)
+        if target != self._size:
+            self._grow.stop()
+            self._grow.setStartValue(self._size)
+            self._grow.setEndValue(target)
+            self._grow.start()
+
+        if remaining <= 5:
+            self.start_blinking()
+        else:
+            self.stop_blinking()
+
+    def start_blinking(self):
+        if self._blink.state() != QPropertyAnimation.State.Running:
+            self._blink.start()
+
+    def stop_blinking(self):
+        self._blink.stop()
+        self._apply_color(BASE_COLOR)
+
+    def reset(self):
+        self.stop_blinking()
+        self._grow.stop()
+        self._apply_size(font_size_for(99))
+        self.setText("")
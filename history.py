@@ -0,0 +1,236 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+import wire
+
+# Game history: what happened in each room, kept for looking back at past
+# games (the journal only keeps what's needed to carry on). One file per room:
+#
+#     <DIR>/<YYYYmmdd-HHMMSS>-<code>.hist
+#
+# A file is MAGIC followed by records of [length][kind][time][body]. body is
+# wire.pack() of the values listed in FIELDS for that kind, so every record
+# of one kind has the same columns. The fixed header lets a scan skip the
+# kinds it doesn't care about without unpacking them.
+#
+# The server only appends to a queue; a writer thread turns everything queued
+# since its last pass into one write per file.
+#
+#     python history.py replay FILE          timeline of one room
+#     python history.py scan PATH [PATH...]   totals over many files / dirs
+
+MAGIC = b"TRIVHIST1\n"
+SUFFIX = ".hist"
+
+# Append-only: the position is the kind id on disk.
+KINDS = ("create", "join", "leave", "start", "question", "answer", "round_end", "end", "close")
+KIND_IDS = {k: i for i, k in enumerate(KINDS)}
+CLOSE = KIND_IDS["close"]
+
+FIELDS = {
+    "create": ("host",),
+    "join": ("username",),
+    "leave": ("username",),
+    "start": ("index", "questions"),                    # first question, question count
+    "question": ("index", "question", "choices", "answer"),
+    "answer": ("index", "username", "choice", "latency", "correct"),  # choice index, -1 = none
+    "round_end": ("index", "scores"),                   # [[username, score], ...]
+    "end": ("reason",),                                 # "finished" or "host"
+    "close": (),
+}
+
+_REC = struct.Struct(">IBd")  # body length, kind id, time
+
+FLUSH_INTERVAL = 0.2
+
+
+class HistoryLog:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.queue = deque()
+        self.paths = {}   # code -> file of the room's current run
+        self.files = {}   # code -> open file (writer thread only)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, code, kind, *values):
+        # values in FIELDS[kind] order. Only appends: deque.append is atomic,
+        # and the values are packed on the writer thread.
+        self.queue.append((code, KIND_IDS[kind], time.time(), values))
+
+    def adopt(self, paths):
+        # Keep writing to the files of a server we took over from.
+        self.paths.update(paths)
+
+    def close(self):
+        # Writes out what's queued. Returns {code: path} of rooms still open.
+        self.stopping.set()
+        self.thread.join()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        return dict(self.paths)
+
+    def _run(self):
+        while not self.stopping.wait(FLUSH_INTERVAL):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        batches = defaultdict(list)
+        for _ in range(len(self.queue)):
+            code, kind, t, values = self.queue.popleft()
+            body = wire.pack(list(values))
+            batches[code].append(_REC.pack(len(body), kind, t) + body)
+            if kind == CLOSE:
+                # The code may be handed to a new room later in this batch.
+                self._write(code, batches.pop(code))
+                self.files.pop(code).close()
+                del self.paths[code]
+        for code, chunks in batches.items():
+            self._write(code, chunks)
+
+    def _write(self, code, chunks):
+        f = self._file(code)
+        f.write(b"".join(chunks))
+        f.flush()
+
+    def _file(self, code):
+        f = self.files.get(code)
+        if f is None:
+            path = self.paths.get(code)
+            if path is None:
+                stem = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{code}")
+                path, n = stem + SUFFIX, 1
+                while os.path.exists(path):
+                    n += 1
+                    path = f"{stem}.{n}{SUFFIX}"
+                self.paths[code] = path
+            f = self.files[code] = open(path, "ab")
+            if f.tell() == 0:
+                f.write(MAGIC)
+        return f
+
+
+# ───────────────────────────────────────────────
+# READING
+# ───────────────────────────────────────────────
+def read(path, kinds=None):
+    # Yields (kind, time, values) in file order. The file is memory-mapped
+    # and only records of the wanted kinds are unpacked. A torn last record
+    # (server killed mid-write) ends the file.
+    for _, kind, t, values in records(path, kinds):
+        yield kind, t, values
+
+
+def records(path, kinds=None, start=0):
+    # read() from byte offset `start` (0: the first record), yielding
+    # (offset just past the record, kind, time, values), so a later pass can
+    # carry on where this one stopped.
+    wanted = None if kinds is None else {KIND_IDS[k] for k in kinds}
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path}: not a history file")
+            i = max(start, len(MAGIC))
+            while i + _REC.size <= size:
+                n, kind, t = _REC.unpack_from(m, i)
+                body = i + _REC.size
+                i = body + n
+                if i > size:
+                    return
+                # Kinds added by a newer server are skipped.
+                if kind < len(KINDS) and (wanted is None or kind in wanted):
+                    yield i, KINDS[kind], t, wire.unpack(m[body:i])
+
+
+def event(kind, values):
+    return dict(zip(FIELDS[kind], values))
+
+
+def history_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(SUFFIX):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def replay(path, out=sys.stdout):
+    letters = "ABCD"
+    first = None
+    for kind, t, values in read(path):
+        if first is None:
+            first = t
+        e = event(kind, values)
+        if kind == "create":
+            text = f"room created by {e['host']}"
+        elif kind in ("join", "leave"):
+            text = f"{e['username']} {kind}s"
+        elif kind == "start":
+            text = f"game starts at question {e['index'] + 1} of {e['questions']}"
+        elif kind == "question":
+            text = f"Q{e['index'] + 1}: {e['question']}  [answer: {e['answer']}]"
+        elif kind == "answer":
+            choice = letters[e["choice"]] if 0 <= e["choice"] < len(letters) else "-"
+            mark = "right" if e["correct"] else "wrong"
+            text = f"  {e['username']} answers {choice} ({mark}) after {e['latency']:.2f} s"
+        elif kind == "round_end":
+            text = "  scores: " + ", ".join(f"{name} {score}" for name, score in e["scores"])
+        elif kind == "end":
+            text = f"game over ({e['reason']})"
+        else:
+            text = "room closed"
+        print(f"{t - first:9.2f}  {text}", file=out)
+
+
+def scan(paths, out=sys.stdout):
+    # Totals across files; question/round records are never unpacked.
+    files = games = 0
+    answers = correct = 0
+    latency = 0.0
+    per_player = Counter()
+    for path in history_files(paths):
+        files += 1
+        for kind, _, values in read(path, ("start", "answer")):
+            if kind == "start":
+                games += 1
+                continue
+            e = event(kind, values)
+            answers += 1
+            latency += e["latency"]
+            if e["correct"]:
+                correct += 1
+                per_player[e["username"]] += 1
+    print(f"{files} files, {games} games, {answers} answers", file=out)
+    if answers:
+        print(f"{correct / answers:.1%} correct, mean time to answer {latency / answers:.2f} s", file=out)
+    for name, n in per_player.most_common(10):
+        print(f"  {name:<20} {n} correct", file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect Trivia game history files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("replay", help="print one room's timeline")
+    p.add_argument("file")
+    p = commands.add_parser("scan", help="totals over history files and directories")
+    p.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    if args.command == "replay":
+        replay(args.file)
+    else:
+        scan(args.paths)
@@ -0,0 +1,210 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import wire
+
+# Append-only journal of room state changes, so a restarted server can put
+# its rooms back. Layout of the journal directory:
+#
+#     snapshot.bin         latest full state, plus the generation it covers up to
+#     journal-<gen>.log    records written after that snapshot, oldest first
+#
+# Every record is [length][crc32][wire.pack body]. A torn tail from a crash
+# fails the length or CRC check and replay stops there.
+#
+# Writes are group-committed: callers only enqueue, and a writer thread
+# writes everything queued since its last pass with one fsync.
+
+SNAPSHOT_FILE = "snapshot.bin"
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".log"
+
+# A snapshot is taken once this many records have piled up, or after
+# SNAPSHOT_INTERVAL seconds if anything was written at all.
+SNAPSHOT_EVERY = 5000
+SNAPSHOT_INTERVAL = 30.0
+
+_REC = struct.Struct(">II")
+
+
+def _record(message):
+    body = wire.pack(message)
+    return _REC.pack(len(body), zlib.crc32(body)) + body
+
+
+def _read_records(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    records = []
+    i = 0
+    while i + _REC.size <= len(data):
+        n, crc = _REC.unpack_from(data, i)
+        body = data[i + _REC.size:i + _REC.size + n]
+        if len(body) < n or zlib.crc32(body) != crc:
+            break
+        records.append(wire.unpack(body))
+        i += _REC.size + n
+    return records
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _Snapshot:
+    __slots__ = ("state",)
+
+    def __init__(self, state):
+        self.state = state
+
+
+class Journal:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.pending = 0       # queued but not yet on disk
+        self.since_snapshot = 0
+        self.last_snapshot = time.monotonic()
+
+        # Never append to a segment left by a previous run: its tail may be torn.
+        gens = self._generations()
+        self.gen = (gens[-1] + 1) if gens else 1
+        self.file = open(self._segment(self.gen), "ab")
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # -------- files --------
+    def _segment(self, gen):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{gen:08d}{SEGMENT_SUFFIX}")
+
+    def _generations(self):
+        gens = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    gens.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    pass
+        return sorted(gens)
+
+    def load(self):
+        # (snapshot state or None, records written after it). Cost depends on
+        # the snapshot plus what came after it, not on the whole history.
+        snap = _read_records(os.path.join(self.directory, SNAPSHOT_FILE))
+        state = snap[0] if snap else None
+        first = state["gen"] if state else 0
+        records = []
+        for gen in self._generations():
+            if first <= gen < self.gen:
+                records.extend(_read_records(self._segment(gen)))
+        return state, records
+
+    # -------- writing --------
+    def append(self, message):
+        with self.cond:
+            self.queue.append(message)
+            self.pending += 1
+            self.since_snapshot += 1
+            self.cond.notify()
+
+    def snapshot(self, state):
+        # state must be taken at the same point as the last append(); the
+        # server does both under its lock.
+        with self.cond:
+            self.queue.append(_Snapshot(state))
+            self.pending += 1
+            self.since_snapshot = 0
+            self.last_snapshot = time.monotonic()
+            self.cond.notify()
+
+    def snapshot_due(self):
+        if self.since_snapshot >= SNAPSHOT_EVERY:
+            return True
+        return self.since_snapshot > 0 and time.monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL
+
+    def sync(self, timeout=None):
+        # Wait until everything appended so far is on disk.
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.file.close()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                batch = list(self.queue)
+                self.queue.clear()
+
+            chunk = []
+            for item in batch:
+                if isinstance(item, _Snapshot):
+                    self._commit(chunk)
+                    chunk = []
+                    self._write_snapshot(item.state)
+                else:
+                    chunk.append(_record(item))
+            self._commit(chunk)
+
+            with self.cond:
+                self.pending -= len(batch)
+                self.cond.notify_all()
+
+    def _commit(self, chunk):
+        if not chunk:
+            return
+        self.file.write(b"".join(chunk))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _write_snapshot(self, state):
+        # New segment first: the snapshot covers everything before it.
+        self.file.close()
+        old = self.gen
+        self.gen += 1
+        self.file = open(self._segment(self.gen), "ab")
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_record({**state, "gen": self.gen}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.directory)
+
+        for gen in self._generations():
+            if gen <= old:
+                try:
+                    os.remove(self._segment(gen))
+                except OSError:
+                    pass
@@ -1,13 +1,19 @@
+import startup  # first, so the startup report covers every other import
 import sys
-import json
-import socket
-import csv
+import time
+import asyncio
+from trivia_client import TriviaClient, LoginError, Disconnected, Reconnected
+from chatlog import ChatLog
+from scoreboard import Scoreboard
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QTextEdit, QListWidget, QMessageBox, QFileDialog, QFrame
+    QPushButton, QMessageBox, QFileDialog, QFrame
 )
 from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
 
+SERVER_ADDR = ("127.0.0.1", 65432)
+LOGIN_TIMEOUT = 5.0
+
 
 # ───────────────────────────────────────────────
 # LOGIN WINDOW
@@ -49,79 +55,100 @@ class LoginWindow(QWidget):
             QMessageBox.warning(self, "Missing Info", "Please enter a username.")
             return
 
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect(("127.0.0.1", 65432))
-
-            msg = {"action": "login", "username": username}
-            sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
-            data = sock.recv(4096).decode("utf-8")
-            res = json.loads(data)
-
-            if res.get("status") == "success":
-                is_host = self.host_button.isChecked()
-                self.hide()
-                self.chat_window = ChatWindow(sock, username, is_host)
-                self.chat_window.show()
-            else:
-                QMessageBox.critical(self, "Login Failed", "Unable to connect.")
-        except Exception as e:
-            QMessageBox.critical(self, "Connection Error", str(e))
+        # Connect + handshake run on a worker so the window stays responsive
+        self.button_login.setEnabled(False)
+        self.button_login.setText("Connecting...")
+        self.net = ClientThread(username)
+        self.net.logged_in.connect(self.on_login_succeeded)
+        self.net.login_failed.connect(self.on_login_failed)
+        self.net.start()
+
+    def on_login_succeeded(self, res):
+        is_host = self.host_button.isChecked()
+        self.hide()
+        self.chat_window = ChatWindow(self.net, self.net.username, is_host)
+        self.chat_window.show()
+
+    def on_login_failed(self, title, reason):
+        self.button_login.setEnabled(True)
+        self.button_login.setText("Login")
+        QMessageBox.critical(self, title, reason)
 
 
 # ───────────────────────────────────────────────
-# LISTENER THREAD (QThread)
+# NETWORK THREAD (QThread around trivia_client)
 # ───────────────────────────────────────────────
-class ListenerThread(QThread):
+class ClientThread(QThread):
+    logged_in = pyqtSignal(dict)
+    login_failed = pyqtSignal(str, str)
     message_received = pyqtSignal(dict)
+    connection_lost = pyqtSignal(str)
 
-    def __init__(self, conn):
+    def __init__(self, username):
         super().__init__()
-        self.conn = conn
+        self.username = username
+        self.loop = None
+        self.client = None
 
     def run(self):
-        decoder = json.JSONDecoder()
-        buffer = ""
-
-        while True:
-            try:
-                data = self.conn.recv(4096)
-                if not data:
-                    break
+        # All protocol work lives in TriviaClient; this thread just hosts
+        # its event loop and forwards events to the GUI as signals.
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = TriviaClient(*SERVER_ADDR, login_timeout=LOGIN_TIMEOUT)
+        self.client.on(self.forward_event)
 
-                buffer += data.decode("utf-8")
-
-                # Try to peel off as many complete JSON objects as we can
-                while True:
-                    buffer = buffer.lstrip()
-                    if not buffer:
-                        break
+        try:
+            res = self.loop.run_until_complete(self.client.login(self.username))
+        except asyncio.TimeoutError:
+            self.login_failed.emit("Connection Error", "Timed out connecting to the server.")
+        except LoginError:
+            self.login_failed.emit("Login Failed", "Unable to connect.")
+        except Exception as e:
+            self.login_failed.emit("Connection Error", str(e))
+        else:
+            self.logged_in.emit(res)
+            self.loop.run_forever()
+        self.loop.close()
+
+    def forward_event(self, event):
+        if isinstance(event, Disconnected):
+            self.connection_lost.emit(event.reason)
+        elif isinstance(event, Reconnected):
+            self.message_received.emit({"type": "system", "message": "Reconnected."})
+        else:
+            self.message_received.emit(event.raw)
 
-                    try:
-                        obj, idx = decoder.raw_decode(buffer)
-                    except json.JSONDecodeError:
-                        # Not enough data yet to decode a full JSON object
-                        break
+    def send(self, msg):
+        # Never blocks the caller; the write happens on the client's loop.
+        self.loop.call_soon_threadsafe(self.client.send_nowait, msg)
 
-                    # We got one complete JSON object
-                    self.message_received.emit(obj)
-                    buffer = buffer[idx:]
-            except Exception as e:
-                print(f"[LISTENER ERROR] {e}")
-                break
+    def answer(self, choice, clicked_at):
+        # The client converts the click time to the server's clock.
+        asyncio.run_coroutine_threadsafe(self.client.answer(choice, clicked_at), self.loop)
 
+    def stop(self):
+        if self.loop is None or not self.loop.is_running():
+            return
+        done = asyncio.run_coroutine_threadsafe(self.client.close(), self.loop)
+        try:
+            done.result(1)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.wait(1000)
 
 
 # ───────────────────────────────────────────────
 # CHAT + GAME WINDOW
 # ───────────────────────────────────────────────
 class ChatWindow(QWidget):
-    def __init__(self, conn, username, is_host=False):
+    def __init__(self, net, username, is_host=False):
         super().__init__()
         self.setWindowTitle("Trivia Game")
         self.setFixedSize(750, 500)
 
-        self.conn = conn
+        self.net = net
         self.username = username
         self.is_host = is_host
         self.game_active = False
@@ -132,7 +159,6 @@ class ChatWindow(QWidget):
 
         # Timer / visual state
         self.timer_remaining = 0
-        self.blink_state = False
 
         # Root layout
         layout = QHBoxLayout()
@@ -158,82 +184,25 @@ class ChatWindow(QWidget):
         top_bar.setFixedHeight(26)  # keeps it pinned; won't shift with timer changes
         left.addWidget(top_bar)
 
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
+        self.chat_display = ChatLog()
         left.addWidget(self.chat_display)
 
         self.chat_input = QLineEdit()
         self.chat_input.returnPressed.connect(self.send_chat)
         left.addWidget(self.chat_input)
 
-        # GAME FRAME
-        self.game_frame = QFrame()
-        self.game_frame.setStyleSheet("""
-            QFrame {
-                background-color: #1e1e1e;
-                border-radius: 12px;
-            }
-        """)
-        game_layout = QVBoxLayout()
-        self.game_frame.setLayout(game_layout)
-        self.game_frame.hide()
-        left.addWidget(self.game_frame)
-
-        # Timer label (floating above question)
-        self.timer_label = QLabel("")
-        self.timer_label.setFixedHeight(160)
-        self.timer_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.timer_label.setStyleSheet("""
-            font-size: 40px;
-            font-weight: bold;
-            color: #00c8ff;
-            margin-top: 5px;
-            margin-bottom: 10px;
-        """)
-        self.timer_label.hide()
-        game_layout.addWidget(self.timer_label)
-
-        # Question label
-        self.question_label = QLabel("QUESTION TEXT")
-        self.question_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.question_label.setWordWrap(True)
-        self.question_label.setStyleSheet("""
-            font-size: 20px;
-            font-weight: bold;
-            color: #00c8ff;
-            margin: 10px;
-        """)
-        game_layout.addWidget(self.question_label)
-
-        # Answer buttons (A–D)
+        # GAME FRAME: built on the first question (see build_game_ui), so
+        # lobby-only sessions never pay for it
+        self.left_layout = left
+        self.game_frame = None
+        self.timer_label = None
+        self.question_label = None
         self.answer_buttons = []
-        for i in range(4):
-            btn = QPushButton(f"Choice {i+1}")
-            btn.setFixedHeight(45)
-            btn.choice_letter = chr(65 + i)  # 'A', 'B', 'C', 'D'
-            btn.clicked.connect(self.handle_answer)
-            btn.setStyleSheet("""
-                QPushButton {
-                    border: 2px solid #00c8ff;
-                    border-radius: 20px;
-                    padding: 10px;
-                    background-color: #2b2b2b;
-                    color: #00c8ff;
-                    font-size: 16px;
-                    text-align: left;
-                }
-                QPushButton:hover { background-color: #3a3a3a; }
-                QPushButton:pressed { background-color: #444444; }
-                QPushButton:disabled { border-color: #555555; color: #555555; }
-            """)
-            btn.setEnabled(False)
-            game_layout.addWidget(btn)
-            self.answer_buttons.append(btn)
 
         # ───────────────────────────────────────
         # RIGHT: SCORES + HOST/PLAYER CONTROLS
         # ───────────────────────────────────────
-        self.player_list = QListWidget()
+        self.player_list = Scoreboard()
         right.addWidget(QLabel("Scores:"))
         right.addWidget(self.player_list)
 
@@ -265,19 +234,59 @@ class ChatWindow(QWidget):
         layout.addLayout(left, 3)
         layout.addLayout(right, 1)
 
-        # Blink timer for last 5 seconds
-        self.blink_timer = QTimer()
-        self.blink_timer.timeout.connect(self.update_blink)
-
-        # Listener thread
-        self.listener = ListenerThread(self.conn)
-        self.listener.message_received.connect(self.handle_server_message)
-        self.listener.start()
+        # The network thread owns the connection; the GUI thread never blocks on it
+        self.net.message_received.connect(self.handle_server_message)
+        self.net.connection_lost.connect(self.on_connection_lost)
         
         if self.is_host:
             QTimer.singleShot(0, self.auto_create_game_on_houst_login)
             
 
+    # ───────────────────────────────────────────────
+    # GAME UI (lazy)
+    # ───────────────────────────────────────────────
+    def build_game_ui(self):
+        if self.game_frame is not None:
+            return
+        from game_view import GAME_FRAME_STYLE, NORMAL, CountdownLabel
+
+        self.game_frame = QFrame()
+        # One sheet for the whole frame, including every answer-button state
+        self.game_frame.setStyleSheet(GAME_FRAME_STYLE)
+        game_layout = QVBoxLayout()
+        self.game_frame.setLayout(game_layout)
+        self.game_frame.hide()
+        self.left_layout.addWidget(self.game_frame)
+
+        # Timer label (floating above question)
+        self.timer_label = CountdownLabel()
+        self.timer_label.setFixedHeight(160)
+        self.timer_label.hide()
+        game_layout.addWidget(self.timer_label)
+
+        # Question label
+        self.question_label = QLabel("QUESTION TEXT")
+        self.question_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.question_label.setWordWrap(True)
+        self.question_label.setStyleSheet("""
+            font-size: 20px;
+            font-weight: bold;
+            color: #00c8ff;
+            margin: 10px;
+        """)
+        game_layout.addWidget(self.question_label)
+
+        # Answer buttons (A–D)
+        for i in range(4):
+            btn = QPushButton(f"Choice {i+1}")
+            btn.setFixedHeight(45)
+            btn.choice_letter = chr(65 + i)  # 'A', 'B', 'C', 'D'
+            btn.clicked.connect(self.handle_answer)
+            btn.setProperty("answerState", NORMAL)
+            btn.setEnabled(False)
+            game_layout.addWidget(btn)
+            self.answer_buttons.append(btn)
+
     # ───────────────────────────────────────────────
     # HOST: START / END GAME
     # ───────────────────────────────────────────────
@@ -359,7 +368,10 @@ class ChatWindow(QWidget):
     # NETWORK ACTIONS
     # ───────────────────────────────────────────────
     def send_json(self, msg: dict):
-        self.conn.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+        self.net.send(msg)
+
+    def on_connection_lost(self, reason):
+        self.chat_display.append(f"[System] Connection lost: {reason}. Reconnecting...")
     
     def send_chat(self):
         txt = self.chat_input.text().strip()
@@ -376,17 +388,9 @@ class ChatWindow(QWidget):
         if not file_path:
             return
 
-        questions = []
         try:
-            with open(file_path, newline="", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    if len(row) >= 6:
-                        questions.append({
-                            "question": row[0],
-                            "choices": row[1:5],
-                            "answer": row[5]
-                        })
+            import question_import
+            questions = question_import.read_csv_rows(file_path)
             msg = {"action": "upload_questions", "questions": questions}
             self.send_json(msg)
             self.start_btn.setEnabled(True)
@@ -430,102 +434,48 @@ class ChatWindow(QWidget):
         if self.has_answered:
             return
 
+        # Stamp the click before anything else so queueing can't delay it
+        clicked_at = time.time()
         sender = self.sender()
         choice_letter = sender.choice_letter
 
-        msg = {"action": "answer", "choice": choice_letter}
-        self.send_json(msg)
+        self.net.answer(choice_letter, clicked_at)
 
         self.has_answered = True
 
-        # Highlight selected
-        sender.setStyleSheet("""
-            QPushButton {
-                border: 2px solid #00c8ff;
-                border-radius: 20px;
-                padding: 10px;
-                background-color: #005f7f;
-                color: #00c8ff;
-                font-size: 16px;
-                text-align: left;
-            }
-        """)
-
-        # Dim others and disable all
+        # Highlight selected, dim others and disable all
+        from game_view import SELECTED, DIMMED, set_answer_state
         for b in self.answer_buttons:
-            if b is not sender:
-                b.setStyleSheet("""
-                    QPushButton {
-                        border: 2px solid #444444;
-                        border-radius: 20px;
-                        padding: 10px;
-                        background-color: #1c1c1c;
-                        color: #444444;
-                        font-size: 16px;
-                        text-align: left;
-                    }
-                """)
+            set_answer_state(b, SELECTED if b is sender else DIMMED)
             b.setEnabled(False)
 
     # ───────────────────────────────────────────────
     # SCOREBOARD
     # ───────────────────────────────────────────────
     def update_scores(self, players):
-        self.player_list.clear()
-        for p in players:
-            self.player_list.addItem(f"{p['username']}: {p['score']}")
+        # Diffed against the rows already shown; no clear-and-rebuild.
+        self.player_list.apply(players)
 
     # ───────────────────────────────────────────────
     # TIMER HELPERS
     # ───────────────────────────────────────────────
-    def get_font_size_for_timer(self, remaining: int) -> int:
-        if remaining <= 1:
-            return 140
-        if remaining == 2:
-            return 120
-        if remaining == 3:
-            return 100
-        if remaining == 4:
-            return 80
-        if remaining == 5:
-            return 60
-        return 40
-
-    def set_timer_style(self, size: int, color: str):
-        self.timer_label.setStyleSheet(f"""
-            font-size: {size}px;
-            font-weight: bold;
-            color: {color};
-            margin-top: 40px;
-            margin-bottom: 0px;
-        """)
-
-    def start_blinking(self):
-        if not self.blink_timer.isActive():
-            self.blink_state = False
-            self.blink_timer.start(350)
-
+    # Sizes, colours and the blink live in CountdownLabel as cached fonts,
+    # palettes and property animations; nothing here touches a stylesheet.
     def stop_blinking(self):
-        if self.blink_timer.isActive():
-            self.blink_timer.stop()
-        self.blink_state = False
-
-    def update_blink(self):
-        size = self.get_font_size_for_timer(self.timer_remaining)
-        color = "#ff3b3b" if self.blink_state else "#ffd93b"
-        self.set_timer_style(size, color)
-        self.blink_state = not self.blink_state
+        if self.timer_label is not None:
+            self.timer_label.stop_blinking()
 
     def reset_timer_display(self):
-        self.stop_blinking()
-        self.timer_label.hide()
-        self.timer_label.setText("")
-        self.set_timer_style(40, "#00c8ff")
+        if self.timer_label is not None:
+            self.timer_label.reset()
+            self.timer_label.hide()
 
     # ───────────────────────────────────────────────
     # QUESTION UI
     # ───────────────────────────────────────────────
     def show_question(self, question, choices):
+        from game_view import NORMAL, set_answer_state
+        self.build_game_ui()
         self.has_answered = False
 
         # Reset timer visuals
@@ -546,25 +496,13 @@ class ChatWindow(QWidget):
         for i, b in enumerate(self.answer_buttons):
             b.setText(padded[i])
             b.setEnabled(bool(padded[i]))
-            b.setStyleSheet("""
-                QPushButton {
-                    border: 2px solid #00c8ff;
-                    border-radius: 20px;
-                    padding: 10px;
-                    background-color: #2b2b2b;
-                    color: #00c8ff;
-                    font-size: 16px;
-                    text-align: left;
-                }
-                QPushButton:hover { background-color: #3a3a3a; }
-                QPushButton:pressed { background-color: #444444; }
-                QPushButton:disabled { border-color: #555555; color: #555555; }
-            """)
+            set_answer_state(b, NORMAL)
 
         self.game_frame.show()
 
     def hide_question(self):
-        self.game_frame.hide()
+        if self.game_frame is not None:
+            self.game_frame.hide()
         self.chat_display.show()
         self.chat_input.show()
 
@@ -585,6 +523,12 @@ class ChatWindow(QWidget):
         elif t == "chat":
             self.chat_display.append(f"{msg.get('username')}: {msg.get('message')}")
 
+        elif t == "chat_batch":
+            # Server folds chat bursts into one frame when it's under pressure
+            lines = [f"{m.get('username')}: {m.get('message')}" for m in msg.get("messages", [])]
+            if lines:
+                self.chat_display.append("\n".join(lines))
+
         elif t == "join_ok":
             # If you joined a new room while any game UI is up, force lobby view
             self.hide_question()
@@ -631,16 +575,10 @@ class ChatWindow(QWidget):
         elif t == "timer":
             remaining = int(msg.get("remaining", 0))
             self.timer_remaining = remaining
-            self.timer_label.setText(str(remaining))
+            self.build_game_ui()
+            self.timer_label.set_remaining(remaining)
             self.timer_label.show()
 
-            if remaining <= 5:
-                self.start_blinking()
-            else:
-                self.stop_blinking()
-                size = self.get_font_size_for_timer(remaining)
-                self.set_timer_style(size, "#00c8ff")
-
         elif t == "round_end":
             correct = msg.get("correct", "")
             players = msg.get("players", [])
@@ -661,15 +599,7 @@ class ChatWindow(QWidget):
             
     def closeEvent(self, event):
         try:
-            self.send_json({"action": "disconnect"})
-        except:
-            pass
-        try:
-            self.conn.shutdown(socket.SHUT_RDWR)
-        except:
-            pass
-        try:
-            self.conn.close()
+            self.net.stop()
         except:
             pass
         event.accept()
@@ -684,4 +614,6 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     login = LoginWindow()
     login.show()
+    if startup.enabled():
+        QTimer.singleShot(0, lambda: startup.report_and_quit(app, "login window shown"))
     sys.exit(app.exec())
@@ -0,0 +1,237 @@
+import socket
+import threading
+from collections import deque
+
+import wire
+
+# Player chat goes in the low lane, so a busy room can't delay question
+# delivery. Everything else the server sends (game frames, its own system
+# messages, answer acks) shares the high lane and keeps the order it was
+# sent in: "Game over!" still arrives before end_game.
+CHAT_TYPES = {"chat", "chat_batch"}
+
+HIGH = 0
+LOW = 1
+
+# Once this many chat frames are queued for a client that supports it
+# (wire.CHAT_BATCH), consecutive chat messages are folded into a single
+# "chat_batch" frame.
+CHAT_BATCH_THRESHOLD = 8
+
+# Upper bound on low-priority frames written per pass, so control frames
+# queued behind a chat burst only ever wait for one small write.
+LOW_PASS_LIMIT = 32
+
+# Bounds for a client that reads slower than we write. Past MAX_CHAT_FRAMES
+# queued chat frames the oldest are dropped (the client is told how many);
+# past MAX_HIGH_BYTES of queued game frames the client has fallen too far
+# behind to play, and the connection is closed.
+MAX_CHAT_FRAMES = 256
+MAX_HIGH_BYTES = 4 << 20
+SKIPPED_MESSAGE = "⚠️ {count} chat messages were skipped because your connection fell behind."
+
+# How long the writer lingers for more chat before flushing a chat-only
+# queue. Control frames never wait.
+FLUSH_WINDOW = 0.002
+
+
+def priority_for(message):
+    return LOW if message.get("type") in CHAT_TYPES else HIGH
+
+
+class Outbox:
+    """Per-client outbound queue with a dedicated writer thread.
+
+    Callers never touch the socket; they enqueue into one of two lanes and the
+    writer drains the control lane completely before each chat write.
+    """
+
+    def __init__(self, conn, wire_format=wire.JSON, compress=None, features=()):
+        self.conn = conn
+        self.wire = wire_format
+        self.compress = compress
+        self.features = set(features)
+        # Recipients with the same variant can share one encoded frame.
+        self.variant = (wire_format, compress)
+        self.high = deque()
+        self.high_bytes = 0
+        self.low = deque()
+        self.skipped = 0      # chat frames dropped since the last chat write
+        self.cond = threading.Condition()
+        self.closed = False
+        self.corked = 0
+        self.sending = False  # a sendall is in progress
+        # Frames queued vs. socket writes issued, to see how well we coalesce.
+        self.frames = 0
+        self.writes = 0
+        self.thread = self._start_writer()
+
+    def _start_writer(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return thread
+
+    def put(self, message, data=None, priority=None):
+        if priority is None:
+            priority = priority_for(message)
+        if data is None:
+            data = wire.encode(message, self.wire, self.compress)
+        with self.cond:
+            if self.closed:
+                return
+            if priority == HIGH:
+                self.high.append((message, data))
+                self.high_bytes += len(data)
+                overflow = self.high_bytes > MAX_HIGH_BYTES
+            else:
+                self.low.append((message, data))
+                if len(self.low) > MAX_CHAT_FRAMES:
+                    self.low.popleft()
+                    self.skipped += 1
+                overflow = False
+            self.frames += 1
+            if not self.corked:
+                self.cond.notify()
+        if overflow:
+            self.hang_up()
+
+    def hang_up(self):
+        # Drops the queue and shuts the socket, so the client's handler sees
+        # the connection end and cleans up.
+        self.close()
+        with self.cond:
+            self.high.clear()
+            self.low.clear()
+            self.high_bytes = 0
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except (OSError, AttributeError):
+            pass
+
+    def cork(self):
+        # Hold writes until the matching uncork(), so everything produced in
+        # between leaves in a single sendall.
+        with self.cond:
+            self.corked += 1
+
+    def uncork(self):
+        with self.cond:
+            self.corked -= 1
+            if not self.corked:
+                self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def detach(self, timeout=None):
+        # Stop the writer but leave the socket open, for handing it to
+        # another process. Returns the bytes still queued, for the new
+        # owner to send first.
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: not self.sending, timeout)
+            pending = b"".join(data for lane in (self.high, self.low) for _, data in lane)
+            self.high.clear()
+            self.high_bytes = 0
+            self.low.clear()
+        return pending
+
+    def _take(self):
+        # Called with self.cond held. Returns the bytes for the next write.
+        if self.high:
+            chunk = b"".join(data for _, data in self.high)
+            self.high.clear()
+            self.high_bytes = 0
+            return chunk
+
+        notice = b""
+        if self.skipped:
+            notice = wire.encode({"type": "system", "message": SKIPPED_MESSAGE.format(count=self.skipped)},
+                                 self.wire, self.compress)
+            self.skipped = 0
+        return notice + self._take_chat()
+
+    def _take_chat(self):
+        if wire.CHAT_BATCH not in self.features:
+            count = min(len(self.low), LOW_PASS_LIMIT)
+            return b"".join(self.low.popleft()[1] for _ in range(count))
+
+        if len(self.low) < CHAT_BATCH_THRESHOLD:
+            chunk = b"".join(data for _, data in self.low)
+            self.low.clear()
+            return chunk
+
+        # Under pressure: coalesce runs of chat into chat_batch frames.
+        parts = []
+        batch = []
+        taken = 0
+        while self.low and taken < LOW_PASS_LIMIT:
+            message, data = self.low.popleft()
+            taken += 1
+            if message.get("type") == "chat":
+                batch.append({"username": message.get("username"), "message": message.get("message")})
+                continue
+            if batch:
+                parts.append(wire.encode({"type": "chat_batch", "messages": batch}, self.wire, self.compress))
+                batch = []
+            parts.append(data)
+        if batch:
+            parts.append(wire.encode({"type": "chat_batch", "messages": batch}, self.wire, self.compress))
+        return b"".join(parts)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.sending:
+                    self.sending = False
+                    self.cond.notify_all()  # detach() may be waiting
+                while (self.corked or not (self.high or self.low)) and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                if not self.high:
+                    self.cond.wait(FLUSH_WINDOW)
+                    if self.closed:
+                        return
+                    if self.corked:
+                        continue
+                chunk = self._take()
+                self.writes += 1
+                self.sending = True
+            try:
+                self.conn.sendall(chunk)
+            except OSError:
+                self.sending = False
+                self.close()
+                return
+
+
+class DirectOutbox(Outbox):
+    """Outbox for connections whose sendall never blocks (simulate.py's
+    in-memory pipes): frames go out as they are put, or at the last uncork(),
+    on the caller's thread.
+    """
+
+    def _start_writer(self):
+        return None
+
+    def put(self, message, data=None, priority=None):
+        super().put(message, data, priority)
+        self._flush()
+
+    def uncork(self):
+        super().uncork()
+        self._flush()
+
+    def _flush(self):
+        with self.cond:
+            while not self.corked and not self.closed and (self.high or self.low):
+                chunk = self._take()
+                self.writes += 1
+                try:
+                    self.conn.sendall(chunk)
+                except OSError:
+                    self.closed = True
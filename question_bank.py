@@ -0,0 +1,423 @@
+import hashlib
+import os
+import random
+import sys
+import threading
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from itertools import islice
+
+import bankfile
+import wire
+
+# A question list as uploaded by a host, plus everything the server would
+# otherwise rebuild every round: the question message, its encoded frame per
+# wire variant, and the packed body that gets sealed for prefetch.
+#
+# Banks are shared by content: rooms that upload the same questions get the
+# same QuestionBank object, so each frame is encoded once for all of them.
+#
+# Questions may also carry "category", "difficulty" and "weight". A host can
+# have each game draw N of them (select()) instead of playing the upload in
+# order; the indexes and sampling tables for that are built ahead of time
+# (prepare(), prepare_selection()) or on first use.
+#
+# A bank can also be a compiled library file (bankfile.py) on the server,
+# memory-mapped and shared by every room that uses it; questions are only
+# decoded as they come up.
+
+_banks = weakref.WeakValueDictionary()
+_libraries = weakref.WeakValueDictionary()  # real path -> QuestionBank
+
+# Banks bigger than this aren't pre-encoded at upload; their frames are made
+# as questions come up.
+WARM_LIMIT = 2000
+
+# Selection: draws rejected (already picked or recently seen) before falling
+# back to a scan of what's left in the pool.
+MAX_REJECTS = 16
+
+# Sampling pools (one per category/difficulty filter a room asks for) kept
+# per bank, least recently used dropped first. A pool is up to a few bytes
+# per matching question, so a big library is bounded by bytes as well.
+MAX_POOLS = 256
+MAX_POOL_BYTES = 32 << 20
+
+
+def load(questions):
+    questions = list(questions or ())
+    digest = hashlib.blake2b(wire.pack(questions), digest_size=16).hexdigest()
+    bank = _banks.get(digest)
+    if bank is None:
+        bank = _banks[digest] = QuestionBank(questions, digest)
+    return bank
+
+
+def load_library(path):
+    path = os.path.realpath(path)
+    bank = _libraries.get(path)
+    if bank is None:
+        bank = _libraries[path] = QuestionBank(bankfile.BankFile(path), path, source=path)
+    return bank
+
+
+def dump(bank):
+    # For journal records and snapshots: libraries by path, anything else
+    # as its question list.
+    source = getattr(bank, "source", None)
+    return {"library": source} if source else list(bank)
+
+
+def restore(data):
+    return load_library(data["library"]) if isinstance(data, dict) else load(data)
+
+
+class QuestionBank:
+    def __init__(self, questions, digest, source=None):
+        self.questions = questions  # list of dicts, or a bankfile.BankFile
+        self.digest = digest
+        self.source = source        # library path
+        self._messages = {}   # index -> question message
+        self._templates = {}  # (index, variant) -> wire.Template
+        self._sealable = {}   # index -> packed question + choices
+        self._indexes = {}    # field -> {value: array of indexes}
+        self._pools = OrderedDict()  # (categories, difficulty) -> (_Pool, bytes), LRU order
+        self._pool_bytes = 0
+        self._pool_lock = threading.Lock()
+        self._weights = None
+        self._size = None     # bytes of the question dicts, see footprint()
+        self._cached = 0      # bytes of everything above built so far
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def message(self, index):
+        message = self._messages.get(index)
+        if message is None:
+            q = self.questions[index]
+            message = self._messages[index] = {"type": "question", "question": q["question"],
+                                               "choices": q["choices"]}
+            self._cached += sys.getsizeof(message)
+        return message
+
+    def warm(self, variants, indexes=None):
+        # Encode questions for the given (wire, compress) variants now, at
+        # upload time, rather than on the first round that needs them.
+        if indexes is None:
+            if len(self.questions) > WARM_LIMIT:
+                return
+            indexes = range(len(self.questions))
+        for variant in variants:
+            for index in indexes:
+                self._template(index, variant)
+
+    def _template(self, index, variant):
+        template = self._templates.get((index, variant))
+        if template is None:
+            template = self._templates[(index, variant)] = wire.Template(self.message(index), *variant)
+            self._cached += sys.getsizeof(template.fixed)
+        return template
+
+    def frame(self, index, variant, timing):
+        # Only the round's deadline/duration get encoded here.
+        return self._template(index, variant).render(timing)
+
+    def sealable(self, index):
+        body = self._sealable.get(index)
+        if body is None:
+            q = self.questions[index]
+            body = self._sealable[index] = wire.pack({"question": q["question"], "choices": q["choices"]})
+            self._cached += sys.getsizeof(body)
+        return body
+
+    def key(self, index):
+        # Identifies the question across banks and uploads, for SeenSet. Only
+        # stable within one server process (str hashes are salted), which is
+        # as long as seen-sets live.
+        return hash(self.questions[index]["question"]) & 0xFFFFFFFFFFFFFFFF
+
+    def subset(self, indexes):
+        return BankView(self, indexes)
+
+    def footprint(self):
+        # Rough bytes held: the question dicts (nothing for a library, which
+        # is mapped) plus the messages, frames and indexes cached so far.
+        if self._size is None:
+            self._size = 0 if self.source else _deep_size(self.questions)
+        return self._size + self._cached
+
+    # -------- selection --------
+    def _attribute_index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            codes = getattr(self.questions, "codes", None)
+            if codes:
+                # Library: group by the stored codes, no text decoded.
+                names, column = codes(field)
+                by_code = [array("l") for _ in names]
+                for i, code in enumerate(column):
+                    by_code[code].append(i)
+                for name, indexes in zip(names, by_code):
+                    if indexes:
+                        index.setdefault(_norm(name), array("l")).extend(indexes)
+            else:
+                for i, q in enumerate(self.questions):
+                    index.setdefault(_norm(q.get(field)), array("l")).append(i)
+            self._cached += sum(map(sys.getsizeof, index.values()))
+            self._indexes[field] = index  # only once complete; see prepare()
+        return index
+
+    def prepare(self):
+        # Builds the attribute indexes now (they take a while on a big
+        # library), so the first select() under the server lock doesn't.
+        for field in ("category", "difficulty"):
+            self._attribute_index(field)
+        self._weight_column()
+
+    def _weight_column(self):
+        # None when every question weighs the same.
+        if self._weights is None:
+            weights = getattr(self.questions, "weights", None)
+            weights = weights() if weights else [_weight(q) for q in self.questions]
+            self._weights = weights if len(weights) and min(weights) != max(weights) else ()
+            if isinstance(self._weights, list):
+                self._cached += sys.getsizeof(self._weights)
+        return self._weights or None
+
+    def categories(self):
+        return sorted(c for c in self._attribute_index("category") if c)
+
+    def _pool(self, categories, difficulty):
+        # categories: tuple of normalised names, () for any. Built without
+        # the pool lock, so callers can build ahead of time (prepare_selection)
+        # while others draw.
+        key = (categories, difficulty)
+        with self._pool_lock:
+            entry = self._pools.get(key)
+            if entry is not None:
+                self._pools.move_to_end(key)
+                return entry[0]
+        pool = self._build_pool(categories, difficulty)
+        size = sum(map(sys.getsizeof, (pool.indexes, pool.prob or (), pool.alias or ())))
+        with self._pool_lock:
+            entry = self._pools.get(key)
+            if entry is not None:  # built meanwhile by another thread
+                return entry[0]
+            self._pools[key] = (pool, size)
+            self._pool_bytes += size
+            self._cached += size
+            while len(self._pools) > 1 and (len(self._pools) > MAX_POOLS or self._pool_bytes > MAX_POOL_BYTES):
+                _, (_, dropped) = self._pools.popitem(last=False)
+                self._pool_bytes -= dropped
+                self._cached -= dropped
+        return pool
+
+    def _build_pool(self, categories, difficulty):
+        by_difficulty = self._attribute_index("difficulty").get(difficulty, ()) if difficulty else None
+        if categories:
+            by_category = self._attribute_index("category")
+            indexes = set().union(*(by_category.get(c, ()) for c in categories))
+            if by_difficulty is not None:
+                indexes.intersection_update(by_difficulty)
+            indexes = array("l", sorted(indexes))
+        elif by_difficulty is not None:
+            indexes = array("l", by_difficulty)
+        else:
+            indexes = array("l", range(len(self.questions)))
+        all_weights = self._weight_column()
+        weights = [max(all_weights[i], 0.0) for i in indexes] if all_weights else None
+        return _Pool(indexes, weights)
+
+    def _selection_pools(self, categories, difficulty, mix):
+        categories = tuple(sorted({_norm(c) for c in categories} - {""}))
+        difficulty = _norm(difficulty)
+        if mix:
+            return [self._pool((c,), difficulty) for c in (categories or self.categories())]
+        return [self._pool(categories, difficulty)]
+
+    def prepare_selection(self, categories=(), difficulty=None, mix=False):
+        # Builds the pools select() draws from for these settings now, so
+        # the select() under the server lock finds them ready.
+        self._selection_pools(categories, difficulty, mix)
+
+    def select(self, count, categories=(), difficulty=None, mix=False, exclude=None, rng=random):
+        # Up to `count` distinct question indexes, weighted by each question's
+        # optional "weight". mix: take turns between the categories (all of
+        # them if none are given). exclude(index) -> True skips a question.
+        pools = self._selection_pools(categories, difficulty, mix)
+        if mix:
+            rng.shuffle(pools)
+        pools = [p for p in pools if p.indexes]
+
+        chosen = []
+        taken = set()
+        slot = 0
+        while len(chosen) < count and pools:
+            pool = pools[slot % len(pools)]
+            index = _draw(pool, taken, exclude, rng)
+            if index is None:
+                pools.remove(pool)
+                continue
+            chosen.append(index)
+            taken.add(index)
+            slot += 1
+        return chosen
+
+
+class BankView:
+    """Some of a bank's questions in a chosen order, for one game.
+
+    Same interface as QuestionBank; frames and sealed bodies come from (and
+    are cached in) the underlying bank.
+    """
+
+    def __init__(self, bank, indexes):
+        self.bank = bank
+        self.indexes = list(indexes)
+        self.questions = [bank.questions[i] for i in self.indexes]
+        self.digest = bank.digest
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def message(self, index):
+        return self.bank.message(self.indexes[index])
+
+    def warm(self, variants):
+        self.bank.warm(variants, self.indexes)
+
+    def frame(self, index, variant, timing):
+        return self.bank.frame(self.indexes[index], variant, timing)
+
+    def sealable(self, index):
+        return self.bank.sealable(self.indexes[index])
+
+    def key(self, index):
+        return self.bank.key(self.indexes[index])
+
+    def footprint(self):
+        # Just the view; the questions belong to the bank.
+        return sys.getsizeof(self.indexes) + sys.getsizeof(self.questions)
+
+
+def _deep_size(questions):
+    size = sys.getsizeof(questions)
+    for q in questions:
+        size += sys.getsizeof(q)
+        for value in q.values():
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(map(sys.getsizeof, value))
+    return size
+
+
+def _norm(value):
+    return "" if value is None else str(value).strip().lower()
+
+
+def _weight(question):
+    try:
+        return max(float(question.get("weight", 1.0)), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class _Pool:
+    # Weighted draws (with replacement) from a fixed set of question indexes
+    # in O(1) each: Vose's alias method. weights None (all equal) skips the
+    # tables.
+    __slots__ = ("indexes", "prob", "alias")
+
+    def __init__(self, indexes, weights):
+        self.indexes = indexes
+        self.prob = self.alias = None
+        n = len(indexes)
+        if not n or not weights or not sum(weights) or min(weights) == max(weights):
+            return
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        prob = array("d", [1.0]) * n
+        alias = array("l", range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large[-1]
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            if scaled[g] < 1.0:
+                large.pop()
+                small.append(g)
+        self.prob, self.alias = prob, alias
+
+    def draw(self, rng):
+        i = int(rng.random() * len(self.indexes))
+        if self.prob is not None and rng.random() >= self.prob[i]:
+            i = self.alias[i]
+        return self.indexes[i]
+
+
+def _draw(pool, taken, exclude, rng):
+    # Without replacement: redraw on repeats. Once the pool is mostly used
+    # up, pick (unweighted) from whatever is left; None when nothing is.
+    for _ in range(MAX_REJECTS):
+        index = pool.draw(rng)
+        if index not in taken and not (exclude and exclude(index)):
+            return index
+    left = [i for i in pool.indexes if i not in taken and not (exclude and exclude(i))]
+    return rng.choice(left) if left else None
+
+
+class SeenSet:
+    """Questions a group was asked in its last few games.
+
+    One Bloom filter per game, BITS bits each (16 per question at the largest
+    selection), so remembering a game costs 1 KB whatever the bank size. A
+    false positive only means a question is skipped that needn't have been.
+    """
+
+    BITS = 8192
+    HASHES = 4
+
+    def __init__(self, games):
+        self.games = deque(maxlen=games)  # newest last
+
+    def add_game(self, keys):
+        bloom = bytearray(self.BITS // 8)
+        for key in keys:
+            for byte, bit in self._positions(key):
+                bloom[byte] |= bit
+        self.games.append(bloom)
+
+    def seen(self, key, games):
+        # In any of the last `games` games?
+        positions = self._positions(key)
+        for bloom in islice(reversed(self.games), games):
+            for byte, bit in positions:
+                if not bloom[byte] & bit:
+                    break
+            else:
+                return True
+        return False
+
+    def _positions(self, key):
+        # Double hashing from the two halves of the 64-bit key.
+        h1 = key & 0xFFFFFFFF
+        h2 = (key >> 32) | 1
+        mask = self.BITS - 1
+        return [(p >> 3, 1 << (p & 7)) for p in ((h1 + i * h2) & mask for i in range(self.HASHES))]
@@ -0,0 +1,66 @@
+import csv
+
+# Question file readers shared by both clients. Kept out of the client modules
+# so their (heavy) dependencies are only imported when a host uploads a file.
+#
+# Optional extra columns after the answer: category, difficulty. The server
+# uses them when the host asks for a selection instead of the whole file.
+
+
+def _with_meta(question, category="", difficulty=""):
+    if category:
+        question["category"] = category
+    if difficulty:
+        question["difficulty"] = difficulty
+    return question
+
+
+def read_csv_rows(file_path):
+    return list(iter_csv_rows(file_path))
+
+
+def iter_csv_rows(file_path):
+    # Headerless layout: question, choice1..choice4, answer
+    with open(file_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            if len(row) >= 6:
+                yield _with_meta({
+                    "question": row[0],
+                    "choices": row[1:5],
+                    "answer": row[5]
+                }, *(c.strip() for c in row[6:8]))
+
+
+def read_csv_with_header(file_path):
+    return list(iter_csv_with_header(file_path))
+
+
+def iter_csv_with_header(file_path):
+    # Header layout: question, choice1..choice4, answer (and optionally
+    # category, difficulty) columns by name
+    with open(file_path, newline="", encoding="utf-8-sig") as csvfile:
+        for row in csv.DictReader(csvfile):
+            q = row.get("question", "").strip()
+            choices = [row.get(f"choice{i}", "").strip() for i in range(1, 5)]
+            answer = row.get("answer", "").strip()
+            if q and all(choices) and answer:
+                yield _with_meta({"question": q, "choices": choices, "answer": answer},
+                                 (row.get("category") or "").strip(),
+                                 (row.get("difficulty") or "").strip())
+
+
+def read_xlsx(file_path):
+    # pandas (and openpyxl under it) take a long time to import, so only pay
+    # for them when an Excel file is actually picked.
+    import pandas as pd
+
+    questions = []
+    df = pd.read_excel(file_path, header=None)
+    for _, row in df.iterrows():
+        q = str(row.iloc[0]).strip() if not pd.isna(row.iloc[0]) else ""
+        choices = [str(row.iloc[i]).strip() for i in range(1, 5) if not pd.isna(row.iloc[i])]
+        answer = str(row.iloc[5]).strip() if len(row) > 5 and not pd.isna(row.iloc[5]) else ""
+        meta = [str(row.iloc[i]).strip() if len(row) > i and not pd.isna(row.iloc[i]) else "" for i in (6, 7)]
+        if q and len(choices) == 4 and answer:
+            questions.append(_with_meta({"question": q, "choices": choices, "answer": answer}, *meta))
+    return questions
@@ -0,0 +1,193 @@
+import sys
+from array import array
+from collections import deque
+
+import question_bank
+
+# Server-side room state. Per-player data lives in columns indexed by a seat
+# number (one small int per player) rather than a dict per player; seats of
+# players who leave are reused. Usernames are interned by the server at
+# login, so clients, user_game and every room share the same string objects.
+
+NO_CHOICE = -1
+LETTERS = "ABCD"
+
+
+def choice_index(question, choice, prefer_text=False):
+    # Players send a letter ("B"); older clients send the choice text. The
+    # answer column is normally the text, so that's tried first for it.
+    if choice is None:
+        return NO_CHOICE
+    text = str(choice).strip()
+    choices = [str(c).strip().lower() for c in question.get("choices", [])]
+    by_letter = LETTERS.find(text.upper()) if len(text) == 1 else -1
+    if by_letter >= len(choices):
+        by_letter = -1
+    by_text = choices.index(text.lower()) if text.lower() in choices else -1
+    first, second = (by_text, by_letter) if prefer_text else (by_letter, by_text)
+    return first if first != -1 else second
+
+
+class Player:
+    __slots__ = ("name", "seat")
+
+    def __init__(self, name, seat):
+        self.name = name
+        self.seat = seat
+
+
+_PLAYER_SIZE = sys.getsizeof(Player("", 0))
+
+
+class Room:
+    __slots__ = (
+        "code", "host", "players", "seats", "free_seats",
+        "scores", "answered", "choices", "elapsed",
+        "bank", "questions", "index", "active", "settings",
+        "answered_count", "round_done", "intake",
+        "started_at", "deadline", "duration", "prefetch", "resume_index",
+        "next_at", "last_active", "tournament",
+    )
+
+    def __init__(self, code, host, settings):
+        self.code = code
+        self.host = host
+        self.players = {}       # username -> Player
+        self.seats = []         # seat -> username, None when free
+        self.free_seats = []
+
+        # Columns, one entry per seat
+        self.scores = array("q")
+        self.answered = bytearray()
+        self.choices = array("b")
+        self.elapsed = array("d")
+
+        self.bank = []          # question_bank.QuestionBank once uploaded
+        self.questions = []     # what this game plays: the bank or a selection from it
+        self.index = 0
+        self.active = False
+        self.settings = settings
+        self.resume_index = None  # set on rooms restored mid-game
+        self.last_active = 0.0  # see touch()
+        self.tournament = None  # tournament code; host is None for its rooms
+
+        # Current round
+        self.answered_count = 0
+        self.round_done = None  # threading.Event, set to end the round early
+        self.intake = deque()
+        self.started_at = None
+        self.deadline = None
+        self.duration = None
+        self.prefetch = None
+        self.next_at = None     # between rounds: when the next question goes out
+
+    def members(self):
+        return [self.host] + list(self.players)
+
+    def touch(self, now):
+        # Someone used the room at `now` (the server clock's monotonic());
+        # idle rooms get closed (server.py, ROOM LIFECYCLE). A plain store,
+        # so it needs no lock.
+        self.last_active = now
+
+    def footprint(self):
+        # Rough bytes held by the room itself. The question bank is shared
+        # between rooms and counted on its own; a selection from it is not.
+        size = sum(map(sys.getsizeof, (self.scores, self.answered, self.choices, self.elapsed,
+                                       self.players, self.seats, self.free_seats,
+                                       self.settings, self.intake)))
+        size += len(self.players) * _PLAYER_SIZE
+        if isinstance(self.questions, question_bank.BankView):
+            size += self.questions.footprint()
+        return size
+
+    # -------- seats --------
+    def add_player(self, name):
+        player = self.players.get(name)
+        if player:
+            return player
+        if self.free_seats:
+            seat = self.free_seats.pop()
+            self.seats[seat] = name
+        else:
+            seat = len(self.seats)
+            self.seats.append(name)
+            self.scores.append(0)
+            self.answered.append(0)
+            self.choices.append(NO_CHOICE)
+            self.elapsed.append(0.0)
+        player = self.players[name] = Player(name, seat)
+        return player
+
+    def remove_player(self, name):
+        player = self.players.pop(name, None)
+        if player is None:
+            return None
+        seat = player.seat
+        if self.answered[seat]:
+            self.answered_count -= 1
+        self.seats[seat] = None
+        self.scores[seat] = 0
+        self.answered[seat] = 0
+        self.choices[seat] = NO_CHOICE
+        self.free_seats.append(seat)
+        return player
+
+    # -------- rounds --------
+    def reset_answers(self):
+        n = len(self.seats)
+        self.answered[:] = bytes(n)
+        self.choices[:] = array("b", [NO_CHOICE]) * n
+        self.answered_count = 0
+
+    def record_answer(self, seat, choice, elapsed):
+        self.answered[seat] = 1
+        self.choices[seat] = choice
+        self.elapsed[seat] = elapsed
+        self.answered_count += 1
+
+    def score_round(self, correct, points):
+        # points(elapsed) -> score for a correct answer
+        if correct == NO_CHOICE:
+            return
+        choices, elapsed, scores = self.choices, self.elapsed, self.scores
+        for seat in range(len(self.seats)):
+            if choices[seat] == correct:
+                scores[seat] += points(elapsed[seat])
+
+    def score_list(self):
+        scores = self.scores
+        return [{"username": name, "score": scores[p.seat]} for name, p in self.players.items()]
+
+    def set_score(self, name, score):
+        player = self.players.get(name)
+        if player:
+            self.scores[player.seat] = score
+
+    # -------- persistence (journal snapshots) --------
+    def to_state(self):
+        return {
+            "code": self.code,
+            "host": self.host,
+            "players": [[name, self.scores[p.seat]] for name, p in self.players.items()],
+            "questions": question_bank.dump(self.questions),
+            "bank": None if self.bank is self.questions else question_bank.dump(self.bank),
+            "index": self.index,
+            "active": self.active,
+            "resume_index": self.resume_index,
+            "settings": dict(self.settings),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        room = cls(state["code"], state["host"], state["settings"])
+        for name, score in state["players"]:
+            room.add_player(name)
+            room.set_score(name, score)
+        if state["questions"]:
+            room.questions = question_bank.restore(state["questions"])
+        room.bank = question_bank.restore(state["bank"]) if state.get("bank") else room.questions
+        room.index = state["index"]
+        room.active = state["active"]
+        room.resume_index = state.get("resume_index")
+        return room
@@ -0,0 +1,193 @@
+import threading
+from bisect import bisect_left
+
+from PyQt6.QtWidgets import QTreeView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, pyqtSignal
+
+# Above this many changed rows in one update, a single layout change is
+# cheaper for the view than signalling every move individually.
+MOVE_LIMIT = 8
+
+
+# ───────────────────────────────────────────────
+# MODEL: rows keyed by username, sorted by score
+# ───────────────────────────────────────────────
+class ScoreboardModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # keys[i] is (-score, username) for row i; kept sorted at all times.
+        self.keys = []
+        self.scores = {}
+        self.hosts = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        neg_score, username = self.keys[index.row()]
+        label = f"{username}: {-neg_score}"
+        if username in self.hosts:
+            label += " (HOST)"
+        return label
+
+    def row_of(self, username):
+        score = self.scores.get(username)
+        if score is None:
+            return -1
+        return bisect_left(self.keys, (-score, username))
+
+    def apply(self, players):
+        # Diff a full player list from the server against what we show.
+        incoming = {p["username"]: p.get("score", 0) for p in players}
+        hosts = {p["username"] for p in players if p.get("is_host")}
+
+        scores = self.scores
+        for username in [u for u in scores if u not in incoming]:
+            self._remove(username)
+
+        changed = [(u, s) for u, s in incoming.items() if scores.get(u, s) != s]
+        added = [(u, s) for u, s in incoming.items() if u not in scores]
+
+        if len(changed) + len(added) > MOVE_LIMIT:
+            self._bulk_update(changed, added)
+        else:
+            for username, score in changed:
+                self._move(username, score)
+            for username, score in added:
+                self._insert(username, score)
+
+        if hosts != self.hosts:
+            self.hosts = hosts
+            self._touch_all()
+
+    def clear(self):
+        self.beginResetModel()
+        self.keys = []
+        self.scores = {}
+        self.hosts = set()
+        self.endResetModel()
+
+    # -------- single-row operations --------
+    def _insert(self, username, score):
+        key = (-score, username)
+        row = bisect_left(self.keys, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.keys.insert(row, key)
+        self.scores[username] = score
+        self.endInsertRows()
+
+    def _remove(self, username):
+        row = self.row_of(username)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.keys[row]
+        del self.scores[username]
+        self.endRemoveRows()
+
+    def _move(self, username, score):
+        old = self.row_of(username)
+        key = (-score, username)
+        # pos is the insertion point in pre-move coordinates, which is also
+        # what Qt expects as the move destination.
+        pos = bisect_left(self.keys, key)
+        new = pos - 1 if pos > old else pos
+
+        moving = new != old
+        if moving:
+            self.beginMoveRows(QModelIndex(), old, old, QModelIndex(), pos)
+        del self.keys[old]
+        self.keys.insert(new, key)
+        self.scores[username] = score
+        if moving:
+            self.endMoveRows()
+
+        idx = self.index(new)
+        self.dataChanged.emit(idx, idx)
+
+    # -------- many rows at once --------
+    def _bulk_update(self, changed, added):
+        if len(added) > MOVE_LIMIT:
+            # Typically the first list after joining a big room.
+            self.beginResetModel()
+            for username, score in changed + added:
+                self.scores[username] = score
+            self.keys = sorted((-s, u) for u, s in self.scores.items())
+            self.endResetModel()
+            return
+
+        old_keys = self.keys
+        old_persistent = self.persistentIndexList()
+
+        # Rows that didn't change are still in order; sorting them together
+        # with the (sorted) changed rows is a single linear merge for Timsort.
+        moved = {u for u, _ in changed}
+        for username, score in changed:
+            self.scores[username] = score
+        kept = [k for k in old_keys if k[1] not in moved]
+        new_keys = sorted(kept + sorted((-s, u) for u, s in changed))
+
+        if not old_persistent:
+            # Nothing holds on to rows, so the reorder can be announced as a
+            # data change; the view only repaints the rows on screen instead
+            # of relaying out all of them.
+            self.keys = new_keys
+            self._touch_all()
+        else:
+            self.layoutAboutToBeChanged.emit()
+            self.keys = new_keys
+            rows = {k[1]: i for i, k in enumerate(new_keys)}
+            new_persistent = [self.index(rows[old_keys[i.row()][1]]) for i in old_persistent]
+            self.changePersistentIndexList(old_persistent, new_persistent)
+            self.layoutChanged.emit()
+
+        for username, score in added:
+            self._insert(username, score)
+
+    def _touch_all(self):
+        if self.keys:
+            self.dataChanged.emit(self.index(0), self.index(len(self.keys) - 1))
+
+
+# ───────────────────────────────────────────────
+# VIEW
+# ───────────────────────────────────────────────
+class Scoreboard(QTreeView):
+    _apply_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.score_model = ScoreboardModel(self)
+        self.setModel(self.score_model)
+
+        # A flat tree with uniform rows only lays out and paints what's
+        # visible, and relayouts after moves far cheaper than QListView.
+        self.setUniformRowHeights(True)
+        self.setRootIsDecorated(False)
+        self.setHeaderHidden(True)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+
+        # apply() may be called from any thread. Each list is a full snapshot,
+        # so only the newest one pending at the next event-loop cycle is used.
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._apply_requested.connect(self._apply_pending, Qt.ConnectionType.QueuedConnection)
+
+    def apply(self, players):
+        with self._pending_lock:
+            first = self._pending is None
+            self._pending = list(players)
+        if first:
+            self._apply_requested.emit()
+
+    def clear(self):
+        with self._pending_lock:
+            self._pending = None
+        self.score_model.clear()
+
+    def _apply_pending(self):
+        with self._pending_lock:
+            players, self._pending = self._pending, None
+        if players is not None:
+            self.score_model.apply(players)
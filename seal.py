@@ -0,0 +1,57 @@
+import hashlib
+import hmac
+import os
+
+# Seals a question payload so it can be pushed to clients before the round
+# starts and only opened once the short "reveal" frame delivers the key.
+#
+# Stream cipher: keyed BLAKE2b in counter mode. Integrity: a separate keyed
+# BLAKE2b tag over nonce + ciphertext. Each key seals exactly one payload,
+# so this only has to keep the question hidden for a few seconds.
+
+KEY_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+_BLOCK = 64
+
+
+class SealError(ValueError):
+    pass
+
+
+def new_key():
+    return os.urandom(KEY_SIZE)
+
+
+def _keystream(key, nonce, length):
+    blocks = []
+    for counter in range((length + _BLOCK - 1) // _BLOCK):
+        blocks.append(hashlib.blake2b(nonce + counter.to_bytes(8, "big"), key=key,
+                                      person=b"trivia-seal-ks").digest())
+    return b"".join(blocks)[:length]
+
+
+def _xor(data, stream):
+    n = len(data)
+    return (int.from_bytes(data, "big") ^ int.from_bytes(stream, "big")).to_bytes(n, "big")
+
+
+def _tag(key, nonce, ciphertext):
+    return hashlib.blake2b(nonce + ciphertext, key=key, digest_size=TAG_SIZE,
+                           person=b"trivia-seal-tag").digest()
+
+
+def seal(key, plaintext):
+    nonce = os.urandom(NONCE_SIZE)
+    ciphertext = _xor(plaintext, _keystream(key, nonce, len(plaintext)))
+    return nonce + ciphertext + _tag(key, nonce, ciphertext)
+
+
+def open_sealed(key, blob):
+    if len(blob) < NONCE_SIZE + TAG_SIZE:
+        raise SealError("sealed payload too short")
+    nonce = blob[:NONCE_SIZE]
+    ciphertext = blob[NONCE_SIZE:-TAG_SIZE]
+    if not hmac.compare_digest(blob[-TAG_SIZE:], _tag(key, nonce, ciphertext)):
+        raise SealError("sealed payload failed authentication")
+    return _xor(ciphertext, _keystream(key, nonce, len(ciphertext)))
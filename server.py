@@ -1,113 +1,1142 @@
+import argparse
+import math
+import os
+import select
 import socket
+import struct
+import sys
 import threading
-import json
 import time
 import random  # for random game codes
+from contextlib import contextmanager
+import wire
+import seal
+import bankfile
+import question_bank
+import tournament
+from clock import RealClock
+from history import HistoryLog
+from journal import Journal
+from outbox import HIGH, DirectOutbox, Outbox
+from room import Room, choice_index
 
 HOST = "0.0.0.0"
 PORT = 65432
 
+# Default round settings; each room keeps its own copy ("settings") that the
+# host can change with the room_settings action.
+ROUND_SECONDS = 15
+ROUND_GAP = 3.0
+EARLY_FINISH = True  # end the round as soon as every player has answered
+SETTING_LIMITS = {"duration": (3, 120), "gap": (0.0, 30.0),  # type follows the bounds
+                  "count": (0, 500), "fresh_games": (0, 20)}
+MAX_CATEGORIES = 50
+
+# A client's click time (already converted to our clock) is only trusted if it
+# falls inside the round and at most this long before the answer arrived;
+# otherwise the arrival time is used.
+MAX_ANSWER_LAG = 1.0
+
+# Speed-weighted scoring: a correct answer is worth between half and all of
+# SPEED_POINTS depending on how quickly it came in. Off = 1 point each.
+SPEED_SCORING = False
+SPEED_POINTS = 1000
+
+# Answers are queued per room and applied in bulk by the round's timer
+# thread at least this often (sooner when everyone may have answered).
+INTAKE_INTERVAL = 0.25
+
+# Graceful upgrade (--upgrade-socket): how long every connection gets to reach
+# a safe point before the upgrade is called off, and how many sockets go in
+# one SCM_RIGHTS message (Linux allows 253).
+UPGRADE_PARK_TIMEOUT = 5.0
+FDS_PER_MESSAGE = 250
+
+# Room lifecycle: a room nobody has used for ROOM_IDLE_TTL seconds is closed,
+# and so is the least recently used idle room while there are more than
+# MAX_ROOMS rooms or their question banks take more than MAX_BANK_BYTES.
+# Rooms with a game running are never closed this way. Tournaments that
+# aren't running (not started yet, or over) go the same way: after
+# ROOM_IDLE_TTL unused, or least recently used first while there are more than
+# MAX_TOURNAMENTS or memory is short; their banks count towards MAX_BANK_BYTES.
+ROOM_IDLE_TTL = 30 * 60
+MAX_ROOMS = 5000
+MAX_TOURNAMENTS = 100
+MAX_BANK_BYTES = 256 << 20
+LIFECYCLE_INTERVAL = 30
+
+# Tournaments: standings go out at most this often, shortly after the rounds
+# that changed them.
+STANDINGS_INTERVAL = 1.0
+
 clients = {}
 games = {}
 user_game = {}
 lock = threading.Lock()
 
+# Time, timers and round threads, and the randomness behind game codes and
+# question selection. simulate.py replaces both to play games on a virtual
+# clock with a fixed seed.
+clock = RealClock()
+rng = random.Random()
+
+# Set by open_journal() when the server runs with --journal DIR.
+journal = None
+
+# Game history files, when the server runs with --history DIR.
+history = None
+
+# Compiled question libraries (bankfile.py) hosts can pick by name, when the
+# server runs with --library DIR.
+library_dir = None
+
+# Host -> question_bank.SeenSet: what that host's group was asked lately, so
+# selections can avoid repeats (the "fresh_games" setting).
+group_seen = {}
+
+# Rooms closed by each lifecycle policy, their players, and roughly how many
+# bytes that gave back.
+EVICTION_POLICIES = ("idle", "rooms", "tournaments", "memory")
+evictions = {policy: {"rooms": 0, "players": 0, "bytes": 0} for policy in EVICTION_POLICIES}
+
+# Tournament code -> tournament.Tournament, see the TOURNAMENTS section.
+tournaments = {}
+
+# Upgrade handoff, see the UPGRADE section.
+upgrading = threading.Event()
+upgrade_wake = None        # pipe (read fd, write fd) once upgrades are enabled
+park_cond = threading.Condition()
+live = set()               # sockets whose thread must park before a handoff
+parked = {}                # socket -> session, filled in while upgrading
+listener = None
+
 
-def broadcast(game_code, message):
+def broadcast(game_code, message, alt=None, encoder=None):
+    # alt: optional (usernames, message) pair; those members get the
+    # alternative message instead (e.g. a reveal instead of the full question).
+    # encoder: optional variant -> frame function for `message`.
     if game_code not in games:
         return
 
-    data = (json.dumps(message) + "\n").encode("utf-8")
+    recipients = games[game_code].members()
+    if alt:
+        alt_users, alt_message = alt
+        send_many([u for u in recipients if u in alt_users], alt_message)
+        recipients = [u for u in recipients if u not in alt_users]
+    send_many(recipients, message, encoder)
+
+
+def send_many(usernames, message, encoder=None):
+    # Encoded (and compressed) once per wire variant; each recipient's writer
+    # thread does the actual send.
+    frames = {}
+    for u in usernames:
+        outbox = clients.get(u)
+        if outbox:
+            data = frames.get(outbox.variant)
+            if data is None:
+                if encoder:
+                    data = encoder(outbox.variant)
+                else:
+                    data = wire.encode(message, outbox.wire, outbox.compress)
+                frames[outbox.variant] = data
+            outbox.put(message, data)
+
+
+@contextmanager
+def room_batch(game_code):
+    # Everything sent to the room inside the block goes out as one write per
+    # client instead of one sendall per message.
+    game = games.get(game_code)
+    members = game.members() if game else []
+    outboxes = [o for o in (clients.get(u) for u in members) if o]
+    for o in outboxes:
+        o.cork()
+    try:
+        yield
+    finally:
+        for o in outboxes:
+            o.uncork()
 
-    game = games[game_code]
-    recipients = [game["host"]] + list(game["players"].keys())
 
-    for u in recipients:
-        conn = clients.get(u)
-        if conn:
-            try:
-                conn.sendall(data)
-            except:
-                pass
+def answer_elapsed(game, clicked_at, received):
+    started = game.started_at or received
+    if (isinstance(clicked_at, (int, float)) and started <= clicked_at <= received
+            and received - clicked_at <= MAX_ANSWER_LAG):
+        return clicked_at - started
+    return received - started
+
 
+def default_settings():
+    # count 0 plays every uploaded question in order; otherwise each game
+    # draws `count` of them, filtered by categories / difficulty.
+    return {"duration": ROUND_SECONDS, "gap": ROUND_GAP, "early_finish": EARLY_FINISH,
+            "count": 0, "categories": [], "difficulty": "", "mix": False, "fresh_games": 0}
+
+
+def apply_limits(target, msg, limits):
+    # Copies the numbers msg gives for `limits` into target. Out-of-range
+    # numbers are clamped, junk (including NaN and infinities) is ignored.
+    for key, (low, high) in limits.items():
+        try:
+            value = float(msg[key])
+            if math.isfinite(value):
+                target[key] = min(max(type(low)(value), low), high)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            pass
 
 
-def start_question_timer(game_code):
-    # 15-second countdown; respects 'active' flag so End Game can interrupt.
-    for t in range(15, 0, -1):
+def update_settings(settings, msg):
+    # Applies the round settings given in msg.
+    for key, value in default_settings().items():
+        settings.setdefault(key, value)  # rooms from older journals
+    apply_limits(settings, msg, SETTING_LIMITS)
+    if "early_finish" in msg:
+        settings["early_finish"] = bool(msg["early_finish"])
+    if "mix" in msg:
+        settings["mix"] = bool(msg["mix"])
+    if isinstance(msg.get("categories"), list):
+        settings["categories"] = [str(c) for c in msg["categories"][:MAX_CATEGORIES]]
+    if "difficulty" in msg:
+        settings["difficulty"] = str(msg["difficulty"] or "")
+
+
+def select_questions(game):
+    # This game's questions, per the room's selection settings. Called with
+    # the lock held; returns the chosen bank indexes, or None for all of them.
+    settings = game.settings
+    count = settings.get("count", 0)
+    if not count:
+        game.questions = game.bank
+        return None
+
+    bank = game.bank
+    fresh = settings.get("fresh_games", 0)
+    seen = group_seen.get(game.host)
+    exclude = (lambda i: seen.seen(bank.key(i), fresh)) if seen and fresh else None
+    picked = bank.select(count, settings.get("categories", ()), settings.get("difficulty"),
+                         settings.get("mix", False), exclude, rng)
+    if picked:
+        group_seen.setdefault(game.host, question_bank.SeenSet(SETTING_LIMITS["fresh_games"][1])) \
+            .add_game(bank.key(i) for i in picked)
+    game.questions = bank.subset(picked)
+    return picked
+
+
+BANK_IN_USE_MESSAGE = "The questions can't be changed while a game is running."
+
+
+def set_bank(game, bank):
+    # Gives the room a new question bank (an upload or a library). Called
+    # with the lock held, not during a game; returns (wire variants to warm
+    # the bank for, rooms closed to stay within the limits).
+    game.bank = game.questions = bank
+    game.touch(clock.monotonic())
+    record("upload", code=game.code, questions=question_bank.dump(bank))
+    variants = {clients[u].variant for u in game.members() if u in clients}
+    return variants, enforce_limits(keep=game)
+
+
+def prepare_selection(bank, settings):
+    # Builds the sampling pools these settings draw from, outside the lock,
+    # so select_questions() under it only draws.
+    if settings.get("count") and isinstance(bank, question_bank.QuestionBank):
+        bank.prepare_selection(settings.get("categories", ()), settings.get("difficulty"),
+                               settings.get("mix", False))
+
+
+def begin_game(game, select=True):
+    # Starts the room's game. Called with the lock held; returns the
+    # announcement, or None if no questions match the selection. select
+    # False plays game.questions as they are (tournament rooms).
+    code = game.code
+    # Players restored from the journal who never came back
+    for u in [u for u in game.players if u not in clients]:
+        leave_room(game, u)
+        user_game.pop(u, None)
+        record("leave", code=code, username=u)
+        log_event(code, "leave", u)
+
+    if game.resume_index is not None and game.resume_index < len(game.questions):
+        game.index = game.resume_index
+        announce = f"Resuming from question {game.index + 1}."
+    else:
+        if select:
+            picked = select_questions(game)
+            record("select", code=code, indexes=picked)
+        if not game.questions:
+            return None
+        game.index = 0  # start from first question
+        announce = "Game starting!"
+    game.active = True
+    game.resume_index = None
+    log_event(code, "start", game.index, len(game.questions))
+    # Note: scores are NOT reset here; can change later if desired.
+    return announce
+
+
+def leave_current_room(username):
+    # Called with the lock held.
+    old = user_game.get(username)
+    if old and old in games:
+        leave_room(games[old], username)
+        record("leave", code=old, username=username)
+        log_event(old, "leave", username)
+
+
+def open_library(name):
+    # A compiled bank from --library by name: (bank, None), or (None, why not).
+    path = os.path.join(library_dir, name + bankfile.SUFFIX) if library_dir else None
+    if not path or os.path.basename(name) != name or not os.path.isfile(path):
+        return None, f"No question library called '{name}'."
+    try:
+        bank = question_bank.load_library(path)
+    except (OSError, bankfile.BankFileError) as e:
+        return None, f"Can't open library '{name}': {e}"
+    bank.prepare()  # outside the lock
+    return bank, None
+
+
+def points_for(elapsed, duration=ROUND_SECONDS):
+    if not SPEED_SCORING or elapsed is None:
+        return 1
+    frac = min(max(elapsed / duration, 0.0), 1.0)
+    return round(SPEED_POINTS * (1 - frac / 2))
+
+
+def stop_round(game):
+    # Wakes the round's timer thread so it notices the game has moved on.
+    if game.round_done:
+        game.round_done.set()
+
+
+def round_complete(game):
+    # O(1): the round's answer counter against the player count.
+    return bool(game.settings["early_finish"] and game.players
+                and game.answered_count >= len(game.players))
+
+
+def maybe_finish_round(game):
+    if game.round_done and round_complete(game):
+        game.round_done.set()
+
+
+def queue_answer(game, username, msg, received):
+    # Called without the lock: deque.append is atomic and only the round's
+    # timer thread pops. Entries carry the round they were meant for.
+    done = game.round_done
+    intake = game.intake
+    intake.append((done, username, msg.get("choice"), msg.get("clicked_at"), received))
+    # Wake the timer early if this might have been the last answer it needs.
+    if (done and game.settings["early_finish"]
+            and len(intake) + game.answered_count >= len(game.players)):
+        done.set()
+
+
+def drain_answers(game, done):
+    # Applies everything queued so far; returns (username, ack) pairs to send
+    # once the lock is released. Called with the lock held.
+    intake = game.intake
+    players = game.players
+    question = game.questions[game.index]
+    correct = choice_index(question, question["answer"], prefer_text=True) if history else None
+    acks = []
+    for _ in range(len(intake)):
+        rnd, username, choice, clicked_at, received = intake.popleft()
+        player = players.get(username)
+        if player is None:
+            continue
+        if rnd is not done:
+            acks.append((username, "Too late, that question is over."))
+        elif game.answered[player.seat]:
+            acks.append((username, "Already answered."))
+        else:
+            index = choice_index(question, choice)
+            elapsed = answer_elapsed(game, clicked_at, received)
+            game.record_answer(player.seat, index, elapsed)
+            log_event(game.code, "answer", game.index, username, index, elapsed, index == correct)
+            acks.append((username, f"Answer '{choice}' submitted."))
+    return acks
+
+
+def send_acks(acks):
+    for username, text in acks:
+        send(username, {"type": "system", "message": text})
+
+
+def leave_room(game, username):
+    game.remove_player(username)
+    if game.active:
+        maybe_finish_round(game)
+
+
+def round_is_current(game, done):
+    # Each round owns its "done" event; a timer thread whose round was ended
+    # (End Game, room closed, a new game started) must not touch the room.
+    return game is not None and game.active and game.round_done is done
+
+
+def start_question_timer(game_code, done):
+    # Owns the round: counts down to the deadline, applies queued answers
+    # every INTAKE_INTERVAL, and scores. Clients that draw their own
+    # countdown get no ticks. `done` is set to wake it early: someone may
+    # have been the last to answer, or the game was ended.
+    with lock:
+        game = games.get(game_code)
+        if not round_is_current(game, done):
+            return
+        duration = game.duration
+        deadline = game.deadline
+        gap = game.settings["gap"]
+
+    # Less than the full duration when the round was handed over mid-way.
+    remaining = min(duration, max(0, math.ceil(deadline - clock.time())))
+    while True:
+        tick = None
         with lock:
             game = games.get(game_code)
-            if not game or not game.get("active", True):
+            if not round_is_current(game, done):
                 return
-        broadcast(game_code, {"type": "timer", "remaining": t})
-        time.sleep(1)
+            done.clear()
+            acks = drain_answers(game, done)
+            finished = round_complete(game) or clock.time() >= deadline
+            if not finished and clock.time() >= deadline - remaining:
+                tick = remaining
+                remaining -= 1
+                ticking = [u for u in game.members()
+                           if clients.get(u) and wire.CLIENT_TIMER not in clients[u].features]
+        send_acks(acks)
+        if finished:
+            break
+        if tick:
+            send_many(ticking, {"type": "timer", "remaining": tick})
+        now = clock.time()
+        done.wait(max(0.0, min(deadline - remaining, now + INTAKE_INTERVAL) - now))
 
     with lock:
         game = games.get(game_code)
-        if not game or not game.get("active", True):
+        if not round_is_current(game, done):
             return
-
-        q = game["questions"][game["index"]]
-        correct = q["answer"].strip().lower()
-
-        # score answers
-        for uname, pdata in game["players"].items():
-            if pdata["choice"] and pdata["choice"].lower() == correct:
-                game["scores"][uname] += 1
-
-        score_list = [{"username": u, "score": s} for u, s in game["scores"].items()]
-        broadcast(game_code, {
-            "type": "round_end",
-            "correct": q["answer"],
-            "players": score_list
-        })
-
-        # hide question UI after each round
-        broadcast(game_code, {"type": "end_question"})
-
-        # advance to next question or end
-        game["index"] += 1
-        if game["index"] < len(game["questions"]):
-            # schedule next question outside the lock
-            next_question = True
-        else:
-            # natural end of game
-            game["active"] = False
-            broadcast(game_code, {"type": "system", "message": "🎉 Game over! Thanks for playing."})
-            broadcast(game_code, {"type": "end_game"})
-            next_question = False
+        acks = drain_answers(game, done)
+
+        q = game.questions[game.index]
+
+        # score answers (compared as choice indexes, so letters and text both work)
+        correct = choice_index(q, q["answer"], prefer_text=True)
+        game.score_round(correct, lambda elapsed: points_for(elapsed, duration))
+
+        score_list = game.score_list()
+        scores = [[s["username"], s["score"]] for s in score_list]
+        log_event(game_code, "round_end", game.index, scores)
+        with room_batch(game_code):
+            send_acks(acks)
+            broadcast(game_code, {
+                "type": "round_end",
+                "correct": q["answer"],
+                "players": score_list
+            })
+
+            # hide question UI after each round
+            broadcast(game_code, {"type": "end_question"})
+
+            # advance to next question or end
+            game.index += 1
+            if game.index < len(game.questions):
+                # schedule next question outside the lock
+                next_question = True
+                game.next_at = clock.time() + gap
+                prefetch_question(game_code)
+            else:
+                # natural end of game
+                game.active = False
+                log_event(game_code, "end", "finished")
+                broadcast(game_code, {"type": "system", "message": "🎉 Game over! Thanks for playing."})
+                broadcast(game_code, {"type": "end_game"})
+                next_question = False
+
+            record("round_end", code=game_code, index=game.index, active=game.active, scores=scores)
+            if game.tournament:
+                tournament_round_end(game, scores)
 
     if next_question:
-        time.sleep(3)
-        send_next_question(game_code)
+        next_question_after(game_code, done, gap)
 
 
-def send_next_question(game_code):
+def next_question_after(game_code, done, delay):
+    clock.sleep(delay)
+    send_next_question(game_code, after=done)
+
+
+def prefetch_question(game_code):
+    # Push the upcoming question sealed during the gap between rounds; at
+    # round start those clients only need the key. Called with the lock held.
+    game = games[game_code]
+    recipients = [u for u in game.members() if clients.get(u) and wire.PREFETCH in clients[u].features]
+    if not recipients:
+        return
+
+    key = seal.new_key()
+    sealed = seal.seal(key, game.questions.sealable(game.index))
+    # Outboxes, not names: a player who reconnects in the gap never saw it.
+    game.prefetch = {"index": game.index, "key": key, "to": {u: clients[u] for u in recipients}}
+    send_many(recipients, {"type": "prefetch", "qid": game.index, "sealed": sealed})
+
+
+def send_next_question(game_code, after=None):
+    # after: the round this follows; skipped if the game moved on meanwhile.
     with lock:
         game = games.get(game_code)
-        if not game or not game.get("active", True):
+        if not game or not game.active:
             return
-        if game["index"] >= len(game["questions"]):
+        if after is not None and game.round_done is not after:
+            return
+        if game.index >= len(game.questions):
             # nothing more to ask
-            game["active"] = False
-            broadcast(game_code, {"type": "system", "message": "🎉 Game over! Thanks for playing."})
-            broadcast(game_code, {"type": "end_game"})
+            game.active = False
+            record("end", code=game_code)
+            log_event(game_code, "end", "finished")
+            with room_batch(game_code):
+                broadcast(game_code, {"type": "system", "message": "🎉 Game over! Thanks for playing."})
+                broadcast(game_code, {"type": "end_game"})
             return
 
-        q = game["questions"][game["index"]]
-        for p in game["players"].values():
-            p["choice"] = None
-            p["answered"] = False
-
-        question_payload = {
-            "type": "question",
-            "question": q["question"],
-            "choices": q["choices"]
-        }
+        bank = game.questions
+        index = game.index
+        record("round_start", code=game_code, index=index)
+        q = bank[index]
+        log_event(game_code, "question", index, q["question"], q["choices"], q["answer"])
+        game.reset_answers()
+        game.next_at = None
+        done = game.round_done = clock.event()
+
+        # Deadline is on the server clock; synced clients count down to it.
+        # Settings changed mid-round apply from the next question.
+        duration = game.duration = game.settings["duration"]
+        game.started_at = clock.time()
+        game.deadline = game.started_at + duration
+        timing = {"deadline": game.deadline, "duration": duration}
+
+        # Frames come pre-encoded from the bank; only the timing is added.
+        question_payload = bank.message(index)
+        encode_question = lambda variant: bank.frame(index, variant, timing)
+
+        # Clients holding the sealed copy only get the key; anyone else
+        # (older clients, late joiners) gets the full question.
+        reveal = None
+        pre, game.prefetch = game.prefetch, None
+        if pre and pre["index"] == game.index:
+            holders = {u for u, o in pre["to"].items() if clients.get(u) is o}
+            reveal = (holders, {"type": "reveal", "qid": pre["index"], "key": pre["key"], **timing})
 
     # send question and start timer thread
-    broadcast(game_code, question_payload)
-    threading.Thread(target=start_question_timer, args=(game_code,), daemon=True).start()
+    game.touch(clock.monotonic())
+    broadcast(game_code, question_payload, reveal, encode_question)
+    clock.spawn(start_question_timer, game_code, done)
+
+
+# ───────────────────────────────────────────────
+# ROOM LIFECYCLE (idle and LRU eviction)
+# ───────────────────────────────────────────────
+EVICTION_MESSAGES = {
+    "idle": "💤 This room was closed after {minutes} minutes without activity.",
+    "rooms": "🧹 This room was closed to make space for new rooms.",
+    "memory": "🧹 This room was closed to free memory for other rooms.",
+}
+TOURNAMENT_EVICTION_MESSAGES = {
+    "idle": "💤 Tournament {code} was called off after {minutes} minutes without activity.",
+    "tournaments": "🧹 Tournament {code} was called off to make space for new tournaments.",
+    "memory": "🧹 Tournament {code} was called off to free memory for other rooms.",
+}
+
+
+def close_room(game, message):
+    # Tells everyone, detaches them and deletes the room. Called with the
+    # lock held.
+    code = game.code
+    with room_batch(code):
+        broadcast(code, {"type": "system", "message": message})
+        broadcast(code, {"type": "end_question"})
+        broadcast(code, {"type": "end_game"})
+    for u in game.members():
+        if user_game.get(u) == code:
+            del user_game[u]
+    stop_round(game)
+    record("close", code=code)
+    del games[code]
+    log_event(code, "close")
+
+
+def room_banks(game):
+    # id -> QuestionBank for the banks this room keeps alive.
+    return {id(b): b for b in (game.bank, game.questions) if isinstance(b, question_bank.QuestionBank)}
+
+
+def tournament_banks(t):
+    return {id(t.bank): t.bank} if isinstance(t.bank, question_bank.QuestionBank) else {}
+
+
+def bank_refs():
+    # id -> [bank, rooms and tournaments using it]
+    refs = {}
+    holders = [room_banks(game) for game in games.values()]
+    holders += [tournament_banks(t) for t in tournaments.values()]
+    for banks in holders:
+        for key, bank in banks.items():
+            refs.setdefault(key, [bank, 0])[1] += 1
+    return refs
+
+
+def release_banks(banks, refs):
+    # Drops one user of each bank from refs; returns the bytes of the banks
+    # nobody uses any more.
+    freed = 0
+    for key in banks:
+        entry = refs[key]
+        entry[1] -= 1
+        if not entry[1]:
+            freed += entry[0].footprint()
+            del refs[key]
+    return freed
+
+
+def evict_room(game, policy, refs, message=None):
+    # Closes an idle room for `policy`; refs (from bank_refs()) is kept up
+    # to date. Returns the bank bytes freed. Called with the lock held.
+    freed = game.footprint()
+    bank_bytes = release_banks(room_banks(game), refs)
+    # A host who is gone won't be asking for fresh questions.
+    if game.host not in clients:
+        seen = group_seen.pop(game.host, None)
+        if seen:
+            freed += len(seen.games) * seen.BITS // 8
+    counts = evictions[policy]
+    counts["rooms"] += 1
+    counts["players"] += len(game.players)
+    counts["bytes"] += freed + bank_bytes
+    close_room(game, message or EVICTION_MESSAGES[policy].format(minutes=max(1, ROOM_IDLE_TTL // 60)))
+    return bank_bytes
+
+
+def drop_tournament(t, policy, refs):
+    # Forgets a tournament that isn't running. One that never started is
+    # called off: its organiser is told and its rooms are closed. Returns
+    # the bank bytes freed. Called with the lock held.
+    freed = 0
+    if not t.started:
+        message = TOURNAMENT_EVICTION_MESSAGES[policy].format(code=t.code, minutes=max(1, ROOM_IDLE_TTL // 60))
+        send(t.organizer, {"type": "system", "message": message})
+        for code in t.rooms:
+            if code in games:
+                freed += evict_room(games[code], policy, refs, message)
+    bank_bytes = release_banks(tournament_banks(t), refs)
+    evictions[policy]["bytes"] += bank_bytes
+    del tournaments[t.code]
+    return freed + bank_bytes
+
+
+def enforce_limits(keep=None, headroom=0, tournament_headroom=0):
+    # Applies the policies: idle rooms and tournaments first, then least
+    # recently used ones until the room and tournament counts (plus the
+    # headroom about to be created) and bank memory are within bounds.
+    # `keep` (a room or tournament) is never closed. Called with the lock
+    # held; returns [(code, policy), ...] of the rooms and tournaments closed.
+    now = clock.monotonic()
+    refs = bank_refs()
+    closed = []
+
+    def evict(game, policy):
+        closed.append((game.code, policy))
+        return evict_room(game, policy, refs)
+
+    def drop(t, policy):
+        if not t.started:
+            closed.extend((code, policy) for code in t.rooms if code in games)
+        closed.append((t.code, policy))
+        return drop_tournament(t, policy, refs)
+
+    # Tournaments first, as calling one off closes its rooms too.
+    dormant = sorted((t for t in tournaments.values()
+                      if not (t.started and t.finished_at is None) and t is not keep),
+                     key=lambda t: t.last_active)
+    while dormant and now - dormant[0].last_active >= ROOM_IDLE_TTL:
+        drop(dormant.pop(0), "idle")
+    excess = len(tournaments) + tournament_headroom - MAX_TOURNAMENTS
+    while dormant and excess > 0:
+        drop(dormant.pop(0), "tournaments")
+        excess -= 1
+
+    idle = sorted((g for g in games.values() if not g.active and g is not keep),
+                  key=lambda g: g.last_active)
+    while idle and now - idle[0].last_active >= ROOM_IDLE_TTL:
+        evict(idle.pop(0), "idle")
+    excess = len(games) + headroom - MAX_ROOMS
+    while idle and excess > 0:
+        evict(idle.pop(0), "rooms")
+        excess -= 1
+    # Memory: only what holds the last reference to a bank gives any back.
+    total = sum(bank.footprint() for bank, _ in refs.values())
+    for item in sorted(idle + dormant, key=lambda item: item.last_active):
+        if total <= MAX_BANK_BYTES:
+            break
+        if isinstance(item, tournament.Tournament):
+            holders = [tournament_banks(item)]
+            if not item.started:  # its rooms close with it
+                holders += [room_banks(games[code]) for code in item.rooms if code in games]
+            if bytes_freed_by(holders, refs):
+                total -= drop(item, "memory")
+        elif item.code in games and bytes_freed_by([room_banks(item)], refs):
+            total -= evict(item, "memory")
+    return closed
+
+
+def bytes_freed_by(holders, refs):
+    # The bank bytes that closing every holder (a room_banks() or
+    # tournament_banks() dict each) would free, going by refs.
+    drops = {}
+    for banks in holders:
+        for key in banks:
+            drops[key] = drops.get(key, 0) + 1
+    return sum(refs[key][0].footprint() for key, n in drops.items() if refs[key][1] <= n)
+
+
+def new_room_code(keep=None):
+    # A free room code, once idle rooms are closed if the server is at
+    # MAX_ROOMS (never `keep`, see enforce_limits). Called with the lock
+    # held. Returns (code, rooms closed); code is None when the server is full.
+    closed = enforce_limits(keep, headroom=1) if len(games) >= MAX_ROOMS else []
+    if len(games) >= MAX_ROOMS:
+        return None, closed
+    while True:
+        code = str(rng.randint(1000, 9999))
+        if code not in games:
+            return code, closed
+
+
+def new_tournament_code():
+    # new_room_code() for tournaments and MAX_TOURNAMENTS.
+    closed = enforce_limits(tournament_headroom=1) if len(tournaments) >= MAX_TOURNAMENTS else []
+    if len(tournaments) >= MAX_TOURNAMENTS:
+        return None, closed
+    while True:
+        code = f"T{rng.randint(1000, 9999)}"
+        if code not in tournaments:
+            return code, closed
+
+
+def report_evictions(closed):
+    for code, policy in closed:
+        kind = "tournament" if code.startswith("T") else "room"
+        print(f"[ROOMS] Closed {kind} {code} ({policy}).")
+    if closed:
+        totals = ", ".join(f"{policy} {c['rooms']} rooms / {c['players']} players / "
+                           f"{c['bytes'] / 1e6:.1f} MB" for policy, c in evictions.items())
+        print(f"[ROOMS] {len(games)} rooms open; reclaimed so far: {totals}")
+
+
+def lifecycle_loop():
+    while True:
+        time.sleep(LIFECYCLE_INTERVAL)
+        with lock:
+            closed = enforce_limits()
+        report_evictions(closed)
+
+
+# ───────────────────────────────────────────────
+# TOURNAMENTS (many rooms, one quiz, shared standings)
+# ───────────────────────────────────────────────
+# An organiser creates a tournament with one question bank and one set of
+# round settings; players join it with its code and are seated in rooms of
+# room_size (no host: the tournament runs them). start_tournament starts the
+# rooms in waves of wave_size, wave_gap seconds apart, the starts shared out
+# between `workers` threads, so hundreds of rooms don't all send their first
+# question at the same instant. After each room's rounds the standings are
+# merged (tournament.py) and a top-N digest goes to every player and the
+# organiser. Tournaments are not journaled, and an upgrade calls them off.
+TOURNAMENT_UPGRADE_MESSAGE = "🔧 The server is restarting; tournament {code} has been called off."
+
+
+def new_tournament_room(t):
+    # Called with the lock held. Returns (Room, rooms closed to make space);
+    # the Room is None when the server is full.
+    code, closed = new_room_code(keep=t)
+    if not code:
+        return None, closed
+    game = games[code] = Room(code, None, dict(t.settings))
+    game.tournament = t.code
+    game.bank = game.questions = t.bank
+    game.touch(clock.monotonic())
+    t.rooms.append(code)
+    log_event(code, "create", t.organizer)
+    return game, closed
+
+
+def tournament_worker(t, share, start_at):
+    # Starts this worker's share of the rooms, each at its wave's time.
+    for wave, code in share:
+        clock.sleep(max(0.0, start_at + wave * t.options["wave_gap"] - clock.time()))
+        with lock:
+            game = games.get(code)
+            if game and game.players and not game.active:
+                announce = begin_game(game, select=False)
+            else:
+                announce = None
+                t.room_over(code)  # closed, or everyone left before the start
+        if announce:
+            with room_batch(code):
+                broadcast(code, {"type": "system", "message": f"Tournament {t.code}: {announce}"})
+                send_next_question(code)
+    with lock:
+        if t.over() and not t.push_pending:
+            t.push_pending = True
+            clock.spawn(push_standings, t)
+
+
+def tournament_round_end(game, scores):
+    # Called with the lock held, after the room scored a round.
+    t = tournaments.get(game.tournament)
+    if t is None:
+        return
+    t.update(game.code, scores, over=not game.active)
+    if not t.push_pending:
+        t.push_pending = True
+        clock.spawn(push_standings, t)
+
+
+def push_standings(t):
+    # Rounds ending within STANDINGS_INTERVAL of each other share one push.
+    clock.sleep(STANDINGS_INTERVAL)
+    with lock:
+        t.push_pending = False
+        digest = t.digest()
+        recipients = [t.organizer, *t.players]
+        if digest["final"] and t.finished_at is None:
+            t.finished_at = clock.time()
+            t.last_active = clock.monotonic()
+            winner = digest["top"][0] if digest["top"] else None
+            final = (f"🏆 Tournament {t.code} is over! Winner: {winner[0]} with {winner[1]}."
+                     if winner else f"Tournament {t.code} is over.")
+        else:
+            final = None
+    send_many(recipients, digest)
+    if final:
+        send_many(recipients, {"type": "system", "message": final})
+
+
+# ───────────────────────────────────────────────
+# JOURNAL (crash recovery)
+# ───────────────────────────────────────────────
+def record(kind, **fields):
+    # Journal a room state change. Called with the lock held, so records are
+    # in the same order as the changes and line up with snapshots. Tournament
+    # rooms are left out, like in snapshots.
+    game = games.get(fields["code"])
+    if journal and not (game and game.tournament):
+        journal.append({"type": kind, **fields})
+
+
+def log_event(code, kind, *values):
+    # Game history (see history.FIELDS for the values of each kind). Only
+    # queues; never waits on disk.
+    if history:
+        history.log(code, kind, *values)
+
+
+def apply_record(rec):
+    kind = rec["type"]
+    code = rec["code"]
+    if kind == "create":
+        games[code] = Room(code, rec["host"], rec["settings"])
+        return
+    game = games.get(code)
+    if game is None:
+        return
+    if kind == "close":
+        del games[code]
+    elif kind == "join":
+        game.add_player(rec["username"])
+    elif kind == "leave":
+        game.remove_player(rec["username"])
+    elif kind == "upload":
+        game.bank = game.questions = question_bank.restore(rec["questions"])
+    elif kind == "select":
+        game.questions = game.bank.subset(rec["indexes"]) if rec["indexes"] is not None else game.bank
+    elif kind == "settings":
+        game.settings = rec["settings"]
+    elif kind == "round_start":
+        game.active = True
+        game.index = rec["index"]
+    elif kind == "round_end":
+        game.active = rec["active"]
+        game.index = rec["index"]
+        for name, score in rec["scores"]:
+            game.set_score(name, score)
+    elif kind == "end":
+        game.active = False
+        game.index = 0
+        game.resume_index = None
+
+
+def snapshot_state():
+    # Tournament rooms aren't journaled; see the TOURNAMENTS section.
+    return {"rooms": [game.to_state() for game in games.values() if not game.tournament]}
+
+
+def open_journal(directory):
+    global journal
+    journal = Journal(directory)
+    state, records = journal.load()
+    with lock:
+        for room_state in (state["rooms"] if state else ()):
+            games[room_state["code"]] = Room.from_state(room_state)
+        for rec in records:
+            apply_record(rec)
+        for code, game in games.items():
+            game.touch(clock.monotonic())
+            user_game[game.host] = code
+            for u in game.players:
+                user_game[u] = code
+            if game.active:
+                # The interrupted question is asked again when the host
+                # starts the game; players rejoin when their clients reconnect.
+                game.active = False
+                game.resume_index = game.index
+        # Start the new run from a compact snapshot.
+        journal.snapshot(snapshot_state())
+    threading.Thread(target=snapshot_loop, daemon=True).start()
+    print(f"[JOURNAL] {len(games)} rooms restored from {directory} ({len(records)} records replayed)")
+
+
+def snapshot_loop():
+    while True:
+        time.sleep(1)
+        if journal.snapshot_due():
+            with lock:
+                journal.snapshot(snapshot_state())
+
+
+# ───────────────────────────────────────────────
+# UPGRADE (hand the running server to a new process)
+# ───────────────────────────────────────────────
+# The running server listens on a Unix socket (--upgrade-socket PATH). A new
+# process started with --takeover connects there and gets the rooms, then the
+# listening socket and every client socket (SCM_RIGHTS). Clients stay
+# connected; rounds only pause while the handoff is in progress.
+def enable_upgrades():
+    global upgrade_wake
+    upgrade_wake = os.pipe()
+
+
+def upgrade_poller(sock):
+    # None unless upgrades are enabled; sockets are read the plain blocking
+    # way then.
+    if upgrade_wake is None:
+        return None
+    poller = select.poll()
+    poller.register(sock, select.POLLIN)
+    poller.register(upgrade_wake[0], select.POLLIN)
+    return poller
+
+
+def wait_readable(poller, sock, session):
+    # Blocks until sock has something to read. If an upgrade starts first,
+    # parks here instead (session() describes the connection to the new
+    # process) and returns False should the upgrade be called off.
+    ready = poller.poll()
+    if upgrading.is_set():
+        with park_cond:
+            parked[sock] = session()
+            park_cond.notify_all()
+            park_cond.wait_for(lambda: not upgrading.is_set())
+        return False
+    return any(fd != upgrade_wake[0] for fd, _ in ready)
+
+
+def spawn_handler(conn, addr, session=None):
+    # Registered before the thread starts, so a handoff can't miss it.
+    with park_cond:
+        live.add(conn)
+    threading.Thread(target=handle_client, args=(conn, addr, session), daemon=True).start()
+
+
+def round_state(game):
+    # The live part of a round that Room.to_state() leaves out.
+    pre = game.prefetch
+    if pre:
+        pre = {"index": pre["index"], "key": pre["key"],
+               "to": [u for u, o in pre["to"].items() if clients.get(u) is o]}
+    return {
+        "started_at": game.started_at,
+        "deadline": game.deadline,
+        "duration": game.duration,
+        "next_at": game.next_at,
+        "answers": [[name, game.choices[p.seat], game.elapsed[p.seat]]
+                    for name, p in game.players.items() if game.answered[p.seat]],
+        "prefetch": pre,
+    }
+
+
+def resume_round(game, rnd):
+    # Picks up a round where the old process left it. Called with the lock held.
+    game.started_at = rnd["started_at"]
+    game.deadline = rnd["deadline"]
+    game.duration = rnd["duration"]
+    for name, choice, elapsed in rnd["answers"]:
+        player = game.players.get(name)
+        if player:
+            game.record_answer(player.seat, choice, elapsed)
+    pre = rnd["prefetch"]
+    if pre:
+        game.prefetch = {"index": pre["index"], "key": pre["key"],
+                         "to": {u: clients[u] for u in pre["to"] if u in clients}}
+
+    done = game.round_done = clock.event()
+    if rnd["next_at"] is None:
+        clock.spawn(start_question_timer, game.code, done)
+    else:
+        game.next_at = rnd["next_at"]
+        clock.spawn(next_question_after, game.code, done, max(0.0, game.next_at - clock.time()))
+
+
+def hand_off(peer):
+    # Old process. Returns (upgrade called off) if some connection doesn't
+    # reach a safe point in time; otherwise sends everything and exits.
+    with park_cond:
+        parked.clear()
+        upgrading.set()
+        os.write(upgrade_wake[1], b"!")
+        if not park_cond.wait_for(lambda: all(s in parked for s in live), UPGRADE_PARK_TIMEOUT):
+            upgrading.clear()
+            os.read(upgrade_wake[0], 1)
+            park_cond.notify_all()
+            print("[UPGRADE] Connections did not settle; upgrade called off.")
+            return
+
+    # Handlers and the accept loop are parked, and timer threads need the
+    # lock to touch a room, so nothing changes from here until we exit.
+    lock.acquire()
+    try:
+        # Tournaments aren't handed over (see TOURNAMENTS): their rooms are
+        # closed here, so their players reach the new process in the lobby.
+        for t in tournaments.values():
+            send(t.organizer, {"type": "system", "message": TOURNAMENT_UPGRADE_MESSAGE.format(code=t.code)})
+        for game in [g for g in games.values() if g.tournament]:
+            close_room(game, TOURNAMENT_UPGRADE_MESSAGE.format(code=game.tournament))
+        tournaments.clear()
+
+        rooms = []
+        for game in games.values():
+            room_state = game.to_state()
+            if game.active and game.round_done:
+                # Answers still queued: this round's, or late ones in the gap.
+                done = game.round_done if game.next_at is None else object()
+                send_acks(drain_answers(game, done))
+                room_state["round"] = round_state(game)
+            rooms.append(room_state)
+
+        socks = [listener]
+        sessions = []
+        for sock, session in parked.items():
+            if sock is listener or sock.fileno() < 0:
+                continue
+            outbox = clients.get(session["username"]) if session["username"] else None
+            if outbox and outbox.conn is sock:
+                session["outbox"] = {"compress": outbox.compress, "features": sorted(outbox.features),
+                                     "pending": outbox.detach(1.0)}
+            socks.append(sock)
+            sessions.append(session)
+
+        if journal:
+            journal.sync(UPGRADE_PARK_TIMEOUT)
+        history_files = history.close() if history else {}
+
+        body = wire.pack({"rooms": rooms, "user_game": list(user_game.items()), "sessions": sessions,
+                          "history": history_files})
+        peer.sendall(struct.pack(">Q", len(body)) + body)
+        for i in range(0, len(socks), FDS_PER_MESSAGE):
+            socket.send_fds(peer, [b"F"], [s.fileno() for s in socks[i:i + FDS_PER_MESSAGE]])
+        print(f"[UPGRADE] Handed over {len(rooms)} rooms and {len(sessions)} connections.", flush=True)
+        os._exit(0)
+    except Exception as e:
+        # Outboxes are already detached; there is no going back.
+        print(f"[UPGRADE] Handoff failed: {e}", flush=True)
+        os._exit(1)
+
+
+def recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(n - len(buf), 1 << 20))
+        if not chunk:
+            raise ConnectionError("old server went away during the handoff")
+        buf += chunk
+    return bytes(buf)
+
+
+def take_over(path, journal_dir=None):
+    # New process. Receives the old one's state and sockets, puts the rooms
+    # back, carries on their rounds and returns the listening socket.
+    global journal
+    peer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    peer.connect(path)
+    (size,) = struct.unpack(">Q", recv_exact(peer, 8))
+    state = wire.unpack(recv_exact(peer, size))
+    fds = []
+    while len(fds) < len(state["sessions"]) + 1:
+        data, got, _, _ = socket.recv_fds(peer, 1, FDS_PER_MESSAGE)
+        if not data:
+            raise ConnectionError("old server went away during the handoff")
+        fds.extend(got)
+    peer.close()
+
+    # The old process synced its journal and stopped writing before sending.
+    if journal_dir:
+        journal = Journal(journal_dir)
+
+    if history:
+        history.adopt(state["history"])
+
+    handlers = []
+    with lock:
+        for room_state in state["rooms"]:
+            game = games[room_state["code"]] = Room.from_state(room_state)
+            game.touch(clock.monotonic())
+        for username, code in state["user_game"]:
+            user_game[sys.intern(username)] = code
+        for session, fd in zip(state["sessions"], fds[1:]):
+            conn = socket.socket(fileno=fd)
+            out = session.pop("outbox", None)
+            if out:
+                username = session["username"] = sys.intern(session["username"])
+                outbox = clients[username] = Outbox(conn, session["wire"], out["compress"], out["features"])
+                if out["pending"]:
+                    outbox.put({}, out["pending"], HIGH)
+            handlers.append((conn, session))
+        if journal:
+            journal.snapshot(snapshot_state())
+        for room_state in state["rooms"]:
+            if "round" in room_state:
+                resume_round(games[room_state["code"]], room_state["round"])
+
+    for conn, session in handlers:
+        spawn_handler(conn, None, session)
+    if journal:
+        threading.Thread(target=snapshot_loop, daemon=True).start()
+    print(f"[UPGRADE] Took over {len(games)} rooms and {len(handlers)} connections.")
+    return socket.socket(fileno=fds[0])
+
+
+def serve_upgrades(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    ctl = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    ctl.bind(path)
+    os.chmod(path, 0o600)
+    ctl.listen(1)
+    print(f"[UPGRADE] Accepting upgrades on {path}")
+    while True:
+        peer, _ = ctl.accept()
+        with peer:
+            hand_off(peer)
 
 
 def update_scores(game_code):
@@ -115,46 +1144,62 @@ def update_scores(game_code):
         game = games.get(game_code)
         if not game:
             return
-        score_list = [{"username": u, "score": s} for u, s in game["scores"].items()]
+        score_list = game.score_list()
     broadcast(game_code, {"type": "player_list", "players": score_list})
 
 
-def handle_client(conn, addr):
+def handle_client(conn, addr, session=None):
+    # session: a connection handed over by the previous server process; this
+    # carries on where that one's handler stopped.
     username = None
     try:
-        buffer = ""
+        decoder = wire.Decoder()
+        if session:
+            username = session["username"]
+            decoder.wire = session["wire"]
+            decoder.feed(session["pending"])
+        poller = upgrade_poller(conn)
 
         while True:
-            data = conn.recv(4096)
-            if not data:
-                break
-
-            buffer += data.decode("utf-8")
-
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                line = line.strip()
-                if not line:
-                    continue
+            while True:
+                msg = decoder.next()
+                if msg is None:
+                    break
 
-                msg = json.loads(line)
                 act = msg.get("action")
 
                 if act == "login":
-                    username = msg["username"]
+                    # Interned: the same string object is shared by clients,
+                    # user_game and the room it joins.
+                    username = sys.intern(str(msg["username"]))
                     
                     # If username already exists, drop old connection/state
                     old = clients.get(username)
-                    if old and old is not conn:
-                        try: old.close()
+                    if old and old.conn is not conn:
+                        old.close()
+                        try: old.conn.close()
                         except: pass
                         
-                    clients[username] = conn
+                    # Reply in JSON so old clients can read it, then switch
+                    # both directions to the negotiated format.
+                    fmt = wire.negotiate(msg.get("wire"))
+                    compress = wire.negotiate_compress(msg.get("compress"), fmt)
+                    features = wire.negotiate_features(msg.get("features"), fmt)
+                    conn.sendall(wire.encode({"status": "success", "wire": fmt, "compress": compress,
+                                              "features": features}))
+                    decoder.wire = fmt
+                    # In-memory connections (simulate.py) never block, so
+                    # they need no writer thread.
+                    outbox_type = DirectOutbox if getattr(conn, "in_memory", False) else Outbox
+                    clients[username] = outbox_type(conn, fmt, compress, features)
                     
-                    # Optional but very helpful: reset mapping on login
-                    user_game.pop(username, None)
+                    # Optional but very helpful: reset mapping on login. A host
+                    # whose room is still here (e.g. restored from the journal)
+                    # keeps it.
+                    code = user_game.get(username)
+                    if not (code in games and games[code].host == username):
+                        user_game.pop(username, None)
     
-                    conn.sendall((json.dumps({"status": "success"}) + "\n").encode("utf-8"))
                     print(f"[LOGIN] {username} connected.")
 
                 elif act == "create_game":
@@ -164,43 +1209,28 @@ def handle_client(conn, addr):
                         with lock:
                             old_game = games.get(old_code)
                             # Only the host should be able to "replace" their room
-                            if old_game and old_game.get("host") == username:
-                                # Tell everyone in the old room it's over
-                                broadcast(old_code, {"type": "system", "message": "🚪 Host started a new room. This room is now closed."})
-                                broadcast(old_code, {"type": "end_question"})
-                                broadcast(old_code, {"type": "end_game"})
-
-                                # Detach players from old room
-                                for p in list(old_game["players"].keys()):
-                                    user_game.pop(p, None)
-
-                                # Detach host and delete the room
-                                user_game.pop(username, None)
-                                del games[old_code]
+                            if old_game and old_game.host == username:
+                                close_room(old_game, "🚪 Host started a new room. This room is now closed.")
 
                     # Now create the new room like you already do...
-                    while True:
-                        game_code = str(random.randint(1000, 9999))
-                        if game_code not in games:
-                            break
-                    games[game_code] = {
-                        "host": username,
-                        "players": {},
-                        "questions": [],
-                        "index": 0,
-                        "scores": {},
-                        "active": False
-                    }
-                    user_game[username] = game_code
+                    with lock:
+                        game_code, closed = new_room_code()
+                        if game_code:
+                            games[game_code] = Room(game_code, username, default_settings())
+                            games[game_code].touch(clock.monotonic())
+                            user_game[username] = game_code
+                            record("create", code=game_code, host=username, settings=dict(games[game_code].settings))
+                            log_event(game_code, "create", username)
+                    report_evictions(closed)
+                    if not game_code:
+                        send(username, {"type": "system", "message": "The server is full right now. Try again in a little while."})
+                        continue
                     send(username, {"type": "system", "message": f"Game code: {game_code}"})
 
                 elif act == "join_game":
                     # If user was in an old room, detach them first (good)
-                    old = user_game.get(username)
-                    if old and old in games:
-                        with lock:
-                            games[old]["players"].pop(username, None)
-                            games[old]["scores"].pop(username, None)
+                    with lock:
+                        leave_current_room(username)
 
                     code = str(msg.get("game_code", "")).strip()
 
@@ -210,50 +1240,214 @@ def handle_client(conn, addr):
                             send(username, {"type": "join_fail", "reason": "Invalid game code."})
                             continue
 
+                        # Tournament rooms are seated by join_tournament; only
+                        # a player already seated here may come back this way.
+                        if game.tournament:
+                            t = tournaments.get(game.tournament)
+                            if not t or t.players.get(username) != code:
+                                send(username, {"type": "join_fail", "reason":
+                                                f"This room is part of tournament {game.tournament}; join the tournament instead."})
+                                continue
+
                         # (Optional) prevent joining an active game mid-round if you want
-                        if game.get("active"):
+                        if game.active:
                             send(username, {"type": "join_fail", "reason": "Game already started."})
                             continue
 
-                        game["players"][username] = {"answered": False, "choice": None}
-                        game["scores"][username] = 0
+                        game.add_player(username)
+                        game.touch(clock.monotonic())
                         user_game[username] = code
+                        record("join", code=code, username=username)
+                        log_event(code, "join", username)
 
-                    # ✅ Tell ONLY this user the join succeeded
-                    send(username, {"type": "join_ok", "game_code": code})
+                    with room_batch(code):
+                        # ✅ Tell ONLY this user the join succeeded
+                        send(username, {"type": "join_ok", "game_code": code})
 
-                    # ✅ Tell everyone in the room that user joined
-                    broadcast(code, {"type": "system", "message": f"{username} joined!"})
-                    update_scores(code)
+                        # ✅ Tell everyone in the room that user joined
+                        broadcast(code, {"type": "system", "message": f"{username} joined!"})
+                        update_scores(code)
 
                 elif act == "upload_questions":
                     code = user_game.get(username)
                     if not code:
                         continue
+                    # Shared with any room that uploaded the same questions.
+                    bank = question_bank.load(msg["questions"])
+                    bank.footprint()  # sized now, not under the lock
                     with lock:
                         game = games.get(code)
-                        if not game:
+                        if not game or game.tournament:
                             continue
-                        game["questions"] = msg["questions"]
+                        if game.active:
+                            send(username, {"type": "system", "message": BANK_IN_USE_MESSAGE})
+                            continue
+                        variants, closed = set_bank(game, bank)
+                    report_evictions(closed)
+                    bank.warm(variants)
+                    prepare_selection(bank, game.settings)
                     send(username, {"type": "system", "message": f"{len(msg['questions'])} questions uploaded."})
 
+                elif act == "list_libraries":
+                    names = sorted(n[:-len(bankfile.SUFFIX)] for n in os.listdir(library_dir)
+                                   if n.endswith(bankfile.SUFFIX)) if library_dir else []
+                    send(username, {"type": "system", "message": "Question libraries: " + (", ".join(names) or "none")})
+
+                elif act == "use_library":
+                    # A compiled bank on the server instead of an upload. Mapped
+                    # once and shared by every room using it.
+                    code = user_game.get(username)
+                    name = str(msg.get("name", ""))
+                    if not code:
+                        continue
+                    bank, error = open_library(name)
+                    if error:
+                        send(username, {"type": "system", "message": error})
+                        continue
+                    with lock:
+                        game = games.get(code)
+                        if not game or game.host != username:
+                            continue
+                        if game.active:
+                            send(username, {"type": "system", "message": BANK_IN_USE_MESSAGE})
+                            continue
+                        variants, closed = set_bank(game, bank)
+                    report_evictions(closed)
+                    bank.warm(variants)
+                    prepare_selection(bank, game.settings)
+                    send(username, {"type": "system", "message": f"Using library '{name}' ({len(bank)} questions)."})
+
+                elif act == "create_tournament":
+                    # One question bank (an upload or a library) and one set
+                    # of round settings for every room of the tournament.
+                    if msg.get("library"):
+                        bank, error = open_library(str(msg["library"]))
+                        if error:
+                            send(username, {"type": "system", "message": error})
+                            continue
+                    else:
+                        bank = question_bank.load(msg.get("questions"))
+                    if not len(bank):
+                        send(username, {"type": "system", "message": "A tournament needs questions."})
+                        continue
+                    settings = default_settings()
+                    update_settings(settings, msg)
+                    options = dict(tournament.DEFAULTS)
+                    apply_limits(options, msg, tournament.LIMITS)
+                    prepare_selection(bank, settings)
+                    with lock:
+                        tcode, closed = new_tournament_code()
+                        if tcode:
+                            t = tournaments[tcode] = tournament.Tournament(tcode, username, bank, settings, options)
+                            t.last_active = clock.monotonic()
+                            closed += enforce_limits(keep=t)
+                    report_evictions(closed)
+                    if not tcode:
+                        send(username, {"type": "system", "message": "The server is full right now. Try again in a little while."})
+                        continue
+                    send(username, {"type": "system", "message": f"Tournament code: {tcode}"})
+
+                elif act == "join_tournament":
+                    tcode = str(msg.get("tournament", "")).strip().upper()
+                    closed = []
+                    with lock:
+                        t = tournaments.get(tcode)
+                        if not t or t.started:
+                            reason = "The tournament has already started." if t else "Invalid tournament code."
+                            send(username, {"type": "join_fail", "reason": reason})
+                            continue
+                        leave_current_room(username)
+                        # Back in the same room if they were seated before.
+                        code = t.players.get(username)
+                        if code not in games:
+                            code = t.room_for_next_player(
+                                lambda c: len(games[c].players) if c in games else t.options["room_size"])
+                        game = games.get(code) if code else None
+                        if game is None:
+                            game, closed = new_tournament_room(t)
+                        if game is None:
+                            send(username, {"type": "join_fail", "reason": "The server is full right now."})
+                            continue
+                        code = t.players[username] = game.code
+                        t.last_active = clock.monotonic()
+                        game.add_player(username)
+                        game.touch(clock.monotonic())
+                        user_game[username] = code
+                        log_event(code, "join", username)
+                    report_evictions(closed)
+
+                    with room_batch(code):
+                        send(username, {"type": "join_ok", "game_code": code})
+                        send(username, {"type": "system", "message": f"Tournament {tcode}, room {code}."})
+                        broadcast(code, {"type": "system", "message": f"{username} joined!"})
+                        update_scores(code)
+
+                elif act == "start_tournament":
+                    tcode = str(msg.get("tournament", "")).strip().upper()
+                    with lock:
+                        t = tournaments.get(tcode)
+                        if not t or t.organizer != username:
+                            send(username, {"type": "system", "message": "Only the organiser can start a tournament."})
+                            continue
+                        if t.started or not t.rooms:
+                            reason = "already started" if t.started else "has no players yet"
+                            send(username, {"type": "system", "message": f"Tournament {tcode} {reason}."})
+                            continue
+                        # Every room plays the same questions in the same order.
+                        settings = t.settings
+                        questions = t.bank
+                        if settings.get("count"):
+                            questions = t.bank.subset(t.bank.select(
+                                settings["count"], settings.get("categories", ()), settings.get("difficulty"),
+                                settings.get("mix", False), None, rng))
+                        if not len(questions):
+                            send(username, {"type": "system", "message": "No questions match the selection."})
+                            continue
+                        for code in t.rooms:
+                            game = games.get(code)
+                            if game:
+                                game.questions = questions
+                        t.started = True
+                        shares = t.plan()
+                        start_at = clock.time()
+                    for share in shares:
+                        clock.spawn(tournament_worker, t, share, start_at)
+                    send(username, {"type": "system", "message":
+                                    f"Tournament {tcode}: {len(t.players)} players in {len(t.rooms)} rooms, "
+                                    f"starting in {t.waves()} waves."})
+
+                elif act == "tournament_standings":
+                    tcode = str(msg.get("tournament", "")).strip().upper()
+                    with lock:
+                        t = tournaments.get(tcode)
+                        digest = t.digest() if t else None
+                    send(username, digest or {"type": "system", "message": "Invalid tournament code."})
+
                 elif act == "start_game":
                     code = user_game.get(username)
                     if not code:
                         continue
+                    game = games.get(code)
+                    if game:
+                        prepare_selection(game.bank, game.settings)
                     with lock:
                         game = games.get(code)
                         if not game:
                             continue
-                        if not game["questions"]:
+                        if game.tournament:
+                            send(username, {"type": "system", "message": "The tournament starts this game."})
+                            continue
+                        if not game.bank:
                             send(username, {"type": "system", "message": "No questions uploaded."})
                             continue
-                        game["active"] = True
-                        game["index"] = 0  # start from first question
-                        # Note: scores are NOT reset here; can change later if desired.
+                        announce = begin_game(game)
+                        if announce is None:
+                            send(username, {"type": "system", "message": "No questions match the selection."})
+                            continue
 
-                    broadcast(code, {"type": "system", "message": "Game starting!"})
-                    send_next_question(code)
+                    with room_batch(code):
+                        broadcast(code, {"type": "system", "message": announce})
+                        send_next_question(code)
 
                 elif act == "end_game":
                     code = user_game.get(username)
@@ -264,92 +1458,195 @@ def handle_client(conn, addr):
                         game = games.get(code)
                         if not game:
                             continue
-                        if username != game["host"]:
+                        if username != game.host:
                             send(username, {"type": "system", "message": "Only the host can end the game."})
                             continue
 
                         # ✅ Stop the round, but KEEP the room and membership
-                        game["active"] = False
-                        game["index"] = 0
+                        game.active = False
+                        game.touch(clock.monotonic())
+                        game.index = 0
 
                         # Optional: clear per-round answer state
-                        for p in game["players"].values():
-                            p["choice"] = None
-                            p["answered"] = False
+                        game.reset_answers()
+                        stop_round(game)
+                        game.resume_index = None
+                        record("end", code=code)
+                        log_event(code, "end", "host")
 
                     # Tell everyone to return to lobby/chat
-                    broadcast(code, {"type": "system", "message": "Game ended by host."})
-                    broadcast(code, {"type": "end_question"})
-                    broadcast(code, {"type": "end_game"})
-
-
-
+                    with room_batch(code):
+                        broadcast(code, {"type": "system", "message": "Game ended by host."})
+                        broadcast(code, {"type": "end_question"})
+                        broadcast(code, {"type": "end_game"})
 
-                elif act == "answer":
+                elif act == "room_settings":
                     code = user_game.get(username)
                     if not code:
                         continue
                     with lock:
                         game = games.get(code)
-                        if not game or not game.get("active", True):
-                            send(username, {"type": "system", "message": "No active game."})
+                        if not game:
                             continue
-                        if username in game["players"] and not game["players"][username]["answered"]:
-                            game["players"][username]["answered"] = True
-                            game["players"][username]["choice"] = msg["choice"]
-                            send(username, {"type": "system", "message": f"Answer '{msg['choice']}' submitted."})
-                        else:
-                            send(username, {"type": "system", "message": "Already answered."})
+                        if username != game.host:
+                            send(username, {"type": "system", "message": "Only the host can change round settings."})
+                            continue
+
+                        game.touch(clock.monotonic())
+                        settings = game.settings
+                        update_settings(settings, msg)
+                        record("settings", code=code, settings=dict(settings))
+                        summary = (f"Round settings: {settings['duration']} s per question, "
+                                   f"{settings['gap']:g} s between questions, "
+                                   f"early finish {'on' if settings['early_finish'] else 'off'}.")
+                        if settings.get("count"):
+                            summary += (f" Each game picks {settings['count']} questions"
+                                        f" ({', '.join(settings['categories']) or 'any category'}"
+                                        f"{', mixed' if settings['mix'] else ''}"
+                                        f", {settings['difficulty'] or 'any difficulty'})")
+                            if settings.get("fresh_games"):
+                                summary += f", none from the last {settings['fresh_games']} games"
+                            summary += "."
+                        bank = game.bank
+                    broadcast(code, {"type": "system", "message": summary})
+                    prepare_selection(bank, settings)
+
+                elif act == "ping":
+                    # Clock sync: the client works out offset and RTT from
+                    # its own send/receive times around our timestamp.
+                    send(username, {"type": "pong", "sent_at": msg.get("sent_at"), "server_time": clock.time()})
+
+                elif act == "answer":
+                    received = clock.time()
+                    code = user_game.get(username)
+                    if not code:
+                        continue
+                    # No global lock here; the round's timer thread applies
+                    # and acknowledges queued answers in bulk.
+                    game = games.get(code)
+                    if not game or not game.active:
+                        send(username, {"type": "system", "message": "No active game."})
+                        continue
+                    queue_answer(game, username, msg, received)
 
                 elif act == "chat":
                     code = user_game.get(username)
                     if not code:
                         continue
+                    game = games.get(code)
+                    if game:
+                        game.touch(clock.monotonic())
                     broadcast(code, {"type": "chat", "username": username, "message": msg["message"]})
                     
                 elif act == "disconnect":
                     break
 
+            if poller and not wait_readable(poller, conn, lambda: {
+                    "username": username, "wire": decoder.wire, "pending": bytes(decoder.buffer)}):
+                continue
+            data = conn.recv(4096)
+            if not data:
+                break
+
+            decoder.feed(data)
 
     except Exception as e:
         print(f"[ERROR] {e}")
 
     finally:
-        if username:
+        # Skip cleanup if this username has already logged in again on a new
+        # connection (e.g. a client reconnecting); that session owns the state.
+        outbox = clients.get(username) if username else None
+        if outbox and outbox.conn is conn:
             code = user_game.pop(username, None)
             clients.pop(username, None)
+            outbox.close()
             if code and code in games:
+                left = False
                 with lock:
                     game = games[code]
-                    if username == game["host"]:
+                    if username == game.host:
                         broadcast(code, {"type": "system", "message": "Host disconnected. Game closed."})
+                        stop_round(game)
                         del games[code]
+                        record("close", code=code)
+                        log_event(code, "close")
                     else:
-                        game["players"].pop(username, None)
-                        game["scores"].pop(username, None)
+                        leave_room(game, username)
+                        record("leave", code=code, username=username)
+                        log_event(code, "leave", username)
+                        left = True
+                # update_scores takes the lock itself
+                if left:
+                    with room_batch(code):
                         broadcast(code, {"type": "system", "message": f"{username} left."})
                         update_scores(code)
-            conn.close()
+        conn.close()
+        with park_cond:
+            live.discard(conn)
+            park_cond.notify_all()
 
 
 def send(username, message):
-    conn = clients.get(username)
-    if conn:
-        try:
-            conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
-        except:
-            pass
-
-
-def start_server():
-    print(f"[SERVER] Trivia running on {HOST}:{PORT}")
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen()
+    outbox = clients.get(username)
+    if outbox:
+        outbox.put(message)
+
+
+def start_server(listening=None):
+    # listening: the socket handed over by the previous process on an upgrade
+    global listener
+    if listening is None:
+        print(f"[SERVER] Trivia running on {HOST}:{PORT}")
+        listening = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # A restarted server must be able to rebind while old connections
+        # are still in TIME_WAIT.
+        listening.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listening.bind((HOST, PORT))
+        listening.listen()
+    listener = listening
+    poller = upgrade_poller(listening)
+    if poller:
+        with park_cond:
+            live.add(listening)
+    with listening as s:
         while True:
+            if poller and not wait_readable(poller, s, lambda: None):
+                continue
             conn, addr = s.accept()
-            threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+            spawn_handler(conn, addr)
 
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="Trivia server")
+    parser.add_argument("--journal", metavar="DIR",
+                        help="journal room state to DIR and restore it on startup")
+    parser.add_argument("--history", metavar="DIR",
+                        help="write a history file per room to DIR (see history.py)")
+    parser.add_argument("--library", metavar="DIR",
+                        help="offer the compiled question banks (*.tqb) in DIR to hosts")
+    parser.add_argument("--upgrade-socket", metavar="PATH",
+                        help="accept graceful upgrades on this Unix socket")
+    parser.add_argument("--takeover", action="store_true",
+                        help="take over from the server running with the same --upgrade-socket")
+    args = parser.parse_args()
+    if args.takeover and not args.upgrade_socket:
+        parser.error("--takeover needs --upgrade-socket")
+
+    listening = None
+    library_dir = args.library
+    if args.history:
+        history = HistoryLog(args.history)
+    if args.journal and not args.takeover:
+        open_journal(args.journal)
+    if args.upgrade_socket:
+        enable_upgrades()
+        if args.takeover:
+            listening = take_over(args.upgrade_socket, args.journal)
+        threading.Thread(target=serve_upgrades, args=(args.upgrade_socket,), daemon=True).start()
+    threading.Thread(target=lifecycle_loop, daemon=True).start()
+    try:
+        start_server(listening)
+    finally:
+        if history:
+            history.close()
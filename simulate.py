@@ -0,0 +1,323 @@
+import argparse
+import contextlib
+import hashlib
+import os
+import random
+import time
+
+import server
+import tournament
+import wire
+from clock import SIM_EPOCH, SimClock
+from room import LETTERS
+
+# Plays whole games against the real server code (handle_client, the round
+# timer, scoring) on a virtual clock (clock.SimClock) over in-memory
+# connections. A 50-question game takes a few milliseconds, and runs with the
+# same seed play out identically: game codes, answers, timings and scores.
+#
+#     python simulate.py --games 1000 --players 4 --questions 20 --seed 7
+#
+# Tests can script exact timings with a Simulation, e.g. an answer landing
+# 1 ms before the deadline:
+#
+#     sim = Simulation(seed=1)
+#     def script():
+#         host = sim.connect("host")
+#         ...
+#         sim.clock.sleep(duration - 0.001)
+#         player.send("answer", choice="A")
+#     sim.run(script)
+
+
+class MemoryConn:
+    """One end of an in-memory socket pair (see pipe()). Reads block on the
+    simulation clock, writes never block."""
+
+    in_memory = True  # server.py: no writer thread needed
+
+    def __init__(self, clock):
+        self.peer = None
+        self.buffer = bytearray()
+        self.readable = clock.event()
+        self.eof = False
+        self.closed = False
+
+    def sendall(self, data):
+        if self.closed or self.peer.closed:
+            raise BrokenPipeError("in-memory connection closed")
+        self.peer.buffer += data
+        self.peer.readable.set()
+
+    def recv(self, n):
+        while not self.buffer and not self.eof:
+            self.readable.clear()
+            self.readable.wait()
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.peer.eof = True
+            self.peer.readable.set()
+
+
+def pipe(clock):
+    a, b = MemoryConn(clock), MemoryConn(clock)
+    a.peer, b.peer = b, a
+    return a, b
+
+
+class SimClient:
+    """A logged-in connection to the simulated server, used from a
+    simulated thread."""
+
+    def __init__(self, sim, username, wire_format=wire.JSON, features=(wire.CLIENT_TIMER,)):
+        self.sim = sim
+        self.username = username
+        self.conn, server_end = pipe(sim.clock)
+        sim.clock.spawn(server.handle_client, server_end, ("sim", username))
+        self.decoder = wire.Decoder()
+        self.wire = wire.JSON
+        self.send("login", username=username, wire=[wire_format], features=list(features))
+        reply = self.next()
+        if not reply or reply.get("status") != "success":
+            raise RuntimeError(f"{username}: login failed: {reply}")
+        self.wire = self.decoder.wire = reply["wire"]
+
+    def send(self, action, **fields):
+        self.conn.sendall(wire.encode({"action": action, **fields}, self.wire))
+
+    def next(self):
+        # The next message from the server; None once it hangs up.
+        while True:
+            msg = self.decoder.next()
+            if msg is not None:
+                return msg
+            data = self.conn.recv(65536)
+            if not data:
+                return None
+            self.decoder.feed(data)
+
+    def wait_for(self, kind, match=None):
+        # Skips ahead to the next message of type `kind` (for which
+        # match(msg) holds); None if the connection closes first.
+        while True:
+            msg = self.next()
+            if msg is None or (msg.get("type") == kind and (match is None or match(msg))):
+                return msg
+
+    def close(self):
+        self.send("disconnect")
+        self.conn.close()
+
+
+class Simulation:
+    """The server's module state on a fresh virtual clock and seed. One at a
+    time per process: it replaces server.clock and server.rng."""
+
+    def __init__(self, seed=0, wire_format=wire.JSON):
+        self.seed = seed
+        self.wire_format = wire_format
+        self.clock = SimClock()
+        server.clock = self.clock
+        server.rng = random.Random(seed)
+        for table in (server.clients, server.games, server.user_game, server.group_seen,
+                      server.tournaments):
+            table.clear()
+        for counts in server.evictions.values():
+            counts.update(dict.fromkeys(counts, 0))
+
+    def connect(self, username, **options):
+        options.setdefault("wire_format", self.wire_format)
+        return SimClient(self, username, **options)
+
+    def spawn(self, target, *args):
+        return self.clock.spawn(target, *args)
+
+    def random(self, name):
+        # Independent, reproducible randomness for one bot or purpose.
+        return random.Random(f"{self.seed}:{name}")
+
+    def elapsed(self):
+        return self.clock.now - SIM_EPOCH
+
+    def run(self, main, *args):
+        result = self.clock.run(main, *args)
+        if self.clock.errors:
+            raise self.clock.errors[0]
+        return result
+
+
+# ───────────────────────────────────────────────
+# BOT GAMES
+# ───────────────────────────────────────────────
+def make_bank(count, rnd):
+    # Returns (questions, {question text: index of the right choice}).
+    questions, key = [], {}
+    for i in range(count):
+        choices = [f"Answer {i}{letter}" for letter in LETTERS]
+        right = rnd.randrange(len(choices))
+        questions.append({"question": f"Question {i}", "choices": choices, "answer": choices[right]})
+        key[questions[-1]["question"]] = right
+    return questions, key
+
+
+def play_bot(sim, username, key, accuracy, join):
+    # join: the join action, e.g. {"action": "join_game", "game_code": ...}
+    rnd = sim.random(username)
+    bot = sim.connect(username)
+    bot.send(**join)
+    while True:
+        msg = bot.next()
+        if msg is None or msg.get("type") in ("end_game", "join_fail"):
+            break
+        if msg.get("type") == "question":
+            sim.clock.sleep(rnd.uniform(0.1, 0.9) * msg["duration"])
+            right = key[msg["question"]]
+            if rnd.random() >= accuracy:
+                right = rnd.choice([i for i in range(len(LETTERS)) if i != right])
+            bot.send("answer", choice=LETTERS[right], clicked_at=sim.clock.time())
+    bot.close()
+
+
+def play_game(sim, n, players, questions, key, settings, accuracy):
+    # One room from creation to game over. Returns (code, game seconds,
+    # rounds, final scores).
+    host = sim.connect(f"host{n}")
+    host.send("create_game")
+    reply = host.wait_for("system", lambda m: m["message"].startswith(("Game code:", "The server is full")))
+    if not reply or not reply["message"].startswith("Game code:"):
+        raise RuntimeError(f"host{n}: no room: {reply}")
+    code = reply["message"].split()[-1]
+    host.send("upload_questions", questions=questions)
+    host.send("room_settings", **settings)
+    for i in range(players):
+        sim.spawn(play_bot, sim, f"p{n}-{i}", key, accuracy, {"action": "join_game", "game_code": code})
+    for _ in range(players):
+        host.wait_for("system", lambda m: m["message"].endswith(" joined!"))
+
+    host.send("start_game")
+    started = sim.clock.time()
+    rounds, scores = 0, []
+    while True:
+        msg = host.next()
+        if msg is None or msg.get("type") == "end_game":
+            break
+        if msg.get("type") == "round_end":
+            rounds += 1
+            scores = msg["players"]
+    result = (code, sim.clock.time() - started, rounds,
+              sorted((p["username"], p["score"]) for p in scores))
+    host.close()
+    return result
+
+
+def run_games(sim, games, players, questions, concurrency, settings, accuracy):
+    # Keeps `concurrency` rooms going until `games` have been played.
+    questions, key = make_bank(questions, sim.random("bank"))
+    numbers = iter(range(games))
+    results = []
+
+    def worker(done):
+        for n in numbers:
+            results.append(play_game(sim, n, players, questions, key, settings, accuracy))
+        done.set()
+
+    workers = [sim.clock.event() for _ in range(min(concurrency, games))]
+    for done in workers:
+        sim.spawn(worker, done)
+    for done in workers:
+        done.wait()
+    return results
+
+
+def run_tournament(sim, players, questions, settings, options, accuracy):
+    # One tournament of `players` bots, run until its final standings.
+    # Returns (the final standings frame, standings frames received).
+    questions, key = make_bank(questions, sim.random("bank"))
+    organizer = sim.connect("organizer")
+    organizer.send("create_tournament", questions=questions, **settings, **options)
+    reply = organizer.wait_for("system", lambda m: m["message"].startswith("Tournament code:"))
+    code = reply["message"].split()[-1]
+    for i in range(players):
+        sim.spawn(play_bot, sim, f"p{i}", key, accuracy, {"action": "join_tournament", "tournament": code})
+    while True:
+        organizer.send("tournament_standings", tournament=code)
+        if organizer.wait_for("standings")["players"] >= players:
+            break
+        sim.clock.sleep(0.1)
+
+    organizer.send("start_tournament", tournament=code)
+    pushes = 0
+    while True:
+        standings = organizer.wait_for("standings")
+        if standings is None:
+            raise RuntimeError("organizer disconnected")
+        pushes += 1
+        if standings["final"]:
+            break
+    organizer.close()
+    return standings, pushes
+
+
+def digest(results):
+    # Identifies a run's outcome; equal for equal seeds and options.
+    text = repr(sorted((code, round(seconds, 6), rounds, scores) for code, seconds, rounds, scores in results))
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Trivia games on a virtual clock")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4, help="players per room")
+    parser.add_argument("--questions", type=int, default=20, help="questions per game")
+    parser.add_argument("--concurrency", type=int, default=20, help="rooms playing at once")
+    parser.add_argument("--duration", type=int, default=server.ROUND_SECONDS, help="seconds per question")
+    parser.add_argument("--gap", type=float, default=server.ROUND_GAP, help="seconds between questions")
+    parser.add_argument("--no-early-finish", action="store_true",
+                        help="always wait out the full round")
+    parser.add_argument("--accuracy", type=float, default=0.6, help="chance a bot answers right")
+    parser.add_argument("--wire", choices=wire.SUPPORTED, default=wire.JSON)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the server's log")
+    group = parser.add_argument_group("tournament", "play one tournament instead of separate games")
+    group.add_argument("--tournament", type=int, metavar="PLAYERS", help="players in the tournament")
+    for option, default in tournament.DEFAULTS.items():
+        group.add_argument(f"--{option.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    sim = Simulation(args.seed, args.wire)
+    settings = {"duration": args.duration, "gap": args.gap, "early_finish": not args.no_early_finish}
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(None if args.verbose else devnull):
+        if args.tournament:
+            options = {option: getattr(args, option) for option in tournament.DEFAULTS}
+            standings, pushes = sim.run(run_tournament, sim, args.tournament, args.questions, settings,
+                                        options, args.accuracy)
+        else:
+            results = sim.run(run_games, sim, args.games, args.players, args.questions, args.concurrency,
+                              settings, args.accuracy)
+    wall = time.perf_counter() - started
+
+    simulated = sim.elapsed()
+    if args.tournament:
+        print(f"tournament of {standings['players']} players in {standings['rooms']} rooms, "
+              f"{args.questions} questions, {pushes} standings updates")
+        print(f"{simulated / 60:.1f} min of game time in {wall:.2f} s "
+              f"({sim.clock.switches:,} thread switches)")
+        for rank, (name, score) in enumerate(standings["top"], 1):
+            print(f"{rank:>4}. {name:<20} {score}")
+    else:
+        lengths = sorted(seconds for _, seconds, _, _ in results)
+        print(f"{len(results)} games of {args.questions} questions, {args.players} players each, "
+              f"{args.concurrency} at a time")
+        print(f"{simulated / 3600:.2f} h of game time in {wall:.2f} s "
+              f"({simulated / max(wall, 1e-9):,.0f}x real time, {sim.clock.switches:,} thread switches)")
+        if lengths:
+            print(f"game length: min {lengths[0]:.1f} s, median {lengths[len(lengths) // 2]:.1f} s, "
+                  f"max {lengths[-1]:.1f} s")
+        print(f"digest {digest(results)} (seed {args.seed})")
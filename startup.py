@@ -0,0 +1,30 @@
+import sys
+import time
+
+# Imported first by the clients so START is as close to process start as we
+# can get without touching the interpreter flags.
+START = time.perf_counter()
+
+FLAG = "--startup-report"
+
+# Modules that should NOT be loaded by the time the login window is up.
+DEFERRED = ("pandas", "openpyxl", "numpy", "question_import", "game_view")
+
+
+def enabled():
+    return FLAG in sys.argv
+
+
+def report(stage):
+    if not enabled():
+        return
+    elapsed = (time.perf_counter() - START) * 1000
+    loaded = [m for m in DEFERRED if m in sys.modules]
+    print(f"[STARTUP] {stage}: {elapsed:.0f} ms, {len(sys.modules)} modules imported")
+    print(f"[STARTUP] deferred modules already loaded: {', '.join(loaded) or 'none'}")
+    print("[STARTUP] for a per-module breakdown run: python -X importtime <client>.py")
+
+
+def report_and_quit(app, stage):
+    report(stage)
+    app.quit()
@@ -0,0 +1,65 @@
+import os
+
+import analytics
+import history
+
+
+def play(log, code, question, answers):
+    # One finished game: (username, choice index, correct) per answer.
+    log.log(code, "start", 0, 1)
+    log.log(code, "question", 0, question, ["a", "b", "c", "d"], "a")
+    for username, choice, correct in answers:
+        log.log(code, "answer", 0, username, choice, 1.0, correct)
+    log.log(code, "end", "finished")
+
+
+def write(directory, games, paths=None):
+    log = history.HistoryLog(str(directory))
+    if paths:
+        log.adopt(paths)
+    for question, answers in games:
+        play(log, "1000", question, answers)
+    return log.close()
+
+
+def counting_records(monkeypatch):
+    read = []
+    records = history.records
+
+    def counted(*args, **kwargs):
+        for record in records(*args, **kwargs):
+            read.append(record[1])
+            yield record
+    monkeypatch.setattr(history, "records", counted)
+    return read
+
+
+def test_update_only_reads_new_records(tmp_path, monkeypatch):
+    read = counting_records(monkeypatch)
+    paths = write(tmp_path, [("Q1", [("p", 0, True), ("q", 1, False)])])
+    stats = analytics.QuestionStats()
+    assert stats.update([str(tmp_path)]) == 1
+    assert stats.update([str(tmp_path)]) == 0
+
+    del read[:]
+    write(tmp_path, [("Q2", [("p", 2, False)])], paths)
+    assert stats.update([str(tmp_path)]) == 1
+    assert read == ["start", "question", "answer", "end"]
+    rows = {row["question"]: row for row in stats.report()}
+    assert rows["Q1"]["answers"] == 2 and rows["Q2"]["answers"] == 1
+
+
+def test_state_round_trips_and_a_shorter_file_starts_over(tmp_path):
+    paths = write(tmp_path / "history", [("Q1", [("p", 0, True)]), ("Q2", [("p", 0, True)])])
+    stats = analytics.QuestionStats()
+    assert stats.update([str(tmp_path / "history")]) == 2
+    stats.save(str(tmp_path / "stats.npz"))
+    stats = analytics.QuestionStats.load(str(tmp_path / "stats.npz"))
+    assert stats.update([str(tmp_path / "history")]) == 0
+
+    (path,) = paths.values()
+    os.remove(path)
+    write(tmp_path / "history", [("Q3", [("p", 1, False)])], paths)
+    assert stats.update([str(tmp_path / "history")]) == 1
+    rows = {row["question"]: row for row in stats.report()}
+    assert rows["Q3"]["answers"] == 1 and rows["Q1"]["answers"] == 1
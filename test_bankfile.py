@@ -0,0 +1,86 @@
+import pytest
+
+import bankfile
+import question_bank
+import server
+import simulate
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "library_dir", str(tmp_path))
+    source = tmp_path / "source.csv"
+    source.write_text("question,choice1,choice2,choice3,choice4,answer,category\nQ?,1,2,3,4,4,Sport\n", encoding="utf-8")
+    bankfile.compile_bank([str(source)], str(tmp_path / ("good" + bankfile.SUFFIX)))
+    return tmp_path
+
+
+def corrupt(library, name, data):
+    (library / (name + bankfile.SUFFIX)).write_bytes(data)
+    question_bank._libraries.clear()
+
+
+def test_good_library_opens(library):
+    bank, error = server.open_library("good")
+    assert error is None and len(bank) == 1
+
+
+@pytest.mark.parametrize("how", ["empty", "short", "names", "utf8"])
+def test_broken_libraries_are_refused(library, how):
+    good = (library / ("good" + bankfile.SUFFIX)).read_bytes()
+    names = bankfile.HEADER.unpack_from(good)[-1]
+    data = {"empty": b"", "short": good[:10],
+            "names": good[:names] + b"{not json", "utf8": good[:names] + b"\xff\xfe"}[how]
+    corrupt(library, "bad", data)
+    with pytest.raises(bankfile.BankFileError):
+        bankfile.BankFile(str(library / ("bad" + bankfile.SUFFIX)))
+    bank, error = server.open_library("bad")
+    assert bank is None and error.startswith("Can't open library 'bad'")
+
+
+def host_room(sim, name, questions=None):
+    host = sim.connect(name)
+    host.send("create_game")
+    code = host.wait_for("system", lambda m: m["message"].startswith("Game code:"))["message"].split()[-1]
+    if questions:
+        host.send("upload_questions", questions=questions)
+        host.wait_for("system", lambda m: m["message"].endswith("questions uploaded."))
+    return host, code
+
+
+def test_using_a_library_keeps_the_memory_limit(library, monkeypatch):
+    sim = simulate.Simulation(1)
+
+    def script():
+        other, other_code = host_room(sim, "other", simulate.make_bank(20, sim.random("bank"))[0])
+        sim.clock.sleep(1)
+        host, code = host_room(sim, "host")
+        monkeypatch.setattr(server, "MAX_BANK_BYTES", 1)
+        host.send("use_library", name="good")
+        host.wait_for("system", lambda m: m["message"].startswith("Using library"))
+        return other_code, code
+
+    other_code, code = sim.run(script)
+    assert other_code not in server.games and server.games[code].bank.source
+
+
+def test_the_bank_cannot_change_during_a_game(library):
+    sim = simulate.Simulation(1)
+    questions, _ = simulate.make_bank(3, sim.random("bank"))
+
+    def script():
+        host, code = host_room(sim, "host", questions)
+        host.send("room_settings", duration=30)
+        player = sim.connect("player")
+        player.send("join_game", game_code=code)
+        host.wait_for("system", lambda m: m["message"].endswith(" joined!"))
+        host.send("start_game")
+        host.wait_for("question")
+        bank = server.games[code].questions
+        host.send("use_library", name="good")
+        refused = host.wait_for("system", lambda m: "can't be changed" in m["message"])
+        host.send("upload_questions", questions=questions[:1])
+        refused_upload = host.wait_for("system", lambda m: "can't be changed" in m["message"])
+        return bool(refused and refused_upload), server.games[code].questions is bank
+
+    assert sim.run(script) == (True, True)
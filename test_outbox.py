@@ -0,0 +1,74 @@
+import socket
+
+import outbox as outbox_module
+import wire
+from outbox import DirectOutbox
+
+
+class Conn:
+    def __init__(self):
+        self.decoder = wire.Decoder()
+
+    def sendall(self, data):
+        self.decoder.feed(data)
+
+    def types(self):
+        messages = []
+        while (msg := self.decoder.next()) is not None:
+            messages.append(msg.get("type"))
+        return messages
+
+
+def test_server_messages_keep_their_order_and_chat_waits():
+    conn = Conn()
+    outbox = DirectOutbox(conn)
+    outbox.cork()
+    outbox.put({"type": "chat", "username": "a", "message": "hi"})
+    outbox.put({"type": "system", "message": "Game starting!"})
+    outbox.put({"type": "question", "question": "Q0"})
+    outbox.put({"type": "system", "message": "You answered A."})  # an answer ack
+    outbox.put({"type": "round_end"})
+    outbox.put({"type": "system", "message": "🎉 Game over! Thanks for playing."})
+    outbox.put({"type": "end_game"})
+    outbox.uncork()
+    assert conn.types() == ["system", "question", "system", "round_end", "system", "end_game", "chat"]
+
+
+def chat_burst(features):
+    conn = Conn()
+    outbox = DirectOutbox(conn, features=features)
+    outbox.cork()
+    for i in range(20):
+        outbox.put({"type": "chat", "username": "a", "message": str(i)})
+    outbox.uncork()
+    return conn.types()
+
+
+def test_chat_is_only_batched_for_clients_that_asked():
+    assert chat_burst([wire.CHAT_BATCH]) == ["chat_batch"]
+    assert chat_burst([]) == ["chat"] * 20
+
+
+def test_a_slow_reader_loses_the_oldest_chat_first():
+    conn = Conn()
+    outbox = DirectOutbox(conn)
+    outbox.cork()
+    for i in range(outbox_module.MAX_CHAT_FRAMES + 5):
+        outbox.put({"type": "chat", "username": "a", "message": str(i)})
+    outbox.uncork()
+    messages = []
+    while (msg := conn.decoder.next()) is not None:
+        messages.append(msg)
+    assert messages[0]["type"] == "system" and messages[0]["message"].startswith("⚠️ 5 chat messages")
+    assert [m["message"] for m in messages[1:]] == [str(i) for i in range(5, outbox_module.MAX_CHAT_FRAMES + 5)]
+
+
+def test_a_stalled_reader_is_hung_up_on(monkeypatch):
+    monkeypatch.setattr(outbox_module, "MAX_HIGH_BYTES", 1000)
+    conn = Conn()
+    conn.shutdown = lambda how: setattr(conn, "shut", how)
+    outbox = DirectOutbox(conn)
+    outbox.cork()
+    for i in range(100):
+        outbox.put({"type": "timer", "remaining": i})
+    assert outbox.closed and not outbox.high and conn.shut == socket.SHUT_RDWR
@@ -0,0 +1,41 @@
+import random
+
+import question_bank
+
+
+def make_bank(tag, categories=20, per_category=50):
+    return question_bank.load([
+        {"question": f"{tag} {c}-{i}", "choices": ["a", "b", "c", "d"], "answer": "a",
+         "category": f"cat{c}", "difficulty": "hard" if i % 2 else "easy", "weight": 1 + i % 3}
+        for c in range(categories) for i in range(per_category)])
+
+
+def test_pool_cache_is_bounded_and_counted(monkeypatch):
+    monkeypatch.setattr(question_bank, "MAX_POOLS", 4)
+    bank = make_bank("bounded")
+    bank.prepare()  # indexes and weights, counted separately
+    base = bank.footprint()
+    for c in range(10):
+        bank.select(3, [f"cat{c}"], rng=random.Random(c))
+    assert len(bank._pools) == 4
+    assert [key[0] for key in bank._pools] == [(f"cat{c}",) for c in range(6, 10)]
+    assert bank.footprint() == base + bank._pool_bytes > base
+
+
+def test_pool_cache_is_bounded_by_bytes(monkeypatch):
+    bank = make_bank("bytes")
+    bank.select(3, ["cat0", "cat1"])
+    one = bank._pool_bytes
+    monkeypatch.setattr(question_bank, "MAX_POOL_BYTES", one * 2)
+    for c in range(2, 10):
+        bank.select(3, [f"cat{c}", f"cat{c + 1}"])
+    assert bank._pool_bytes <= one * 2 and len(bank._pools) <= 2
+
+
+def test_prepared_pools_are_used_by_select(monkeypatch):
+    bank = make_bank("prepared")
+    bank.prepare_selection(["cat3", "cat4"], "Hard", mix=True)
+    built = dict(bank._pools)
+    monkeypatch.setattr(bank, "_build_pool", None)  # select() must not build
+    picked = bank.select(6, ["cat4", "cat3"], "hard", mix=True, rng=random.Random(1))
+    assert len(picked) == 6 and dict(bank._pools) == built
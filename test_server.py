@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+import question_bank
+import server
+import tournament
+
+
+@pytest.mark.parametrize("junk", [math.nan, math.inf, -math.inf, "nan", "inf", "-inf", "junk", None])
+def test_apply_limits_ignores_non_finite(junk):
+    settings = server.default_settings()
+    before = dict(settings)
+    server.apply_limits(settings, {key: junk for key in server.SETTING_LIMITS}, server.SETTING_LIMITS)
+    assert settings == before
+
+
+def test_apply_limits_ignores_non_finite_tournament_options():
+    options = dict(tournament.DEFAULTS)
+    server.apply_limits(options, {key: math.nan for key in tournament.LIMITS}, tournament.LIMITS)
+    server.apply_limits(options, {key: math.inf for key in tournament.LIMITS}, tournament.LIMITS)
+    assert options == tournament.DEFAULTS
+
+
+def test_apply_limits_clamps():
+    settings = server.default_settings()
+    server.apply_limits(settings, {"duration": 1000, "gap": -5, "count": "12"}, server.SETTING_LIMITS)
+    assert settings["duration"] == 120 and settings["gap"] == 0.0 and settings["count"] == 12
+    assert type(settings["duration"]) is int and type(settings["gap"]) is float
+
+
+@pytest.fixture
+def rooms(monkeypatch):
+    for table in ("games", "user_game", "tournaments", "clients"):
+        monkeypatch.setattr(server, table, {})
+    monkeypatch.setattr(server, "evictions",
+                        {policy: {"rooms": 0, "players": 0, "bytes": 0} for policy in server.EVICTION_POLICIES})
+
+    def make(code, bank, active=False):
+        game = server.games[code] = server.Room(code, f"host{code}", server.default_settings())
+        game.bank = game.questions = bank
+        game.active = active
+        game.touch(server.clock.monotonic())
+        return game
+    return make
+
+
+def bank_of(count, tag):
+    return question_bank.load([{"question": f"{tag} {i}", "choices": ["a", "b", "c", "d"], "answer": "a"}
+                               for i in range(count)])
+
+
+def test_memory_pass_skips_rooms_sharing_a_bank_with_a_running_game(rooms, monkeypatch):
+    shared = bank_of(50, "shared")
+    rooms("1000", shared, active=True)
+    for code in ("1001", "1002", "1003"):
+        rooms(code, shared)
+    monkeypatch.setattr(server, "MAX_BANK_BYTES", shared.footprint() - 1)
+    with server.lock:
+        assert server.enforce_limits() == []
+    assert len(server.games) == 4
+
+
+def test_memory_pass_closes_the_last_holder_of_a_bank(rooms, monkeypatch):
+    shared, own = bank_of(50, "shared"), bank_of(50, "own")
+    rooms("1000", shared, active=True)
+    rooms("1001", shared)
+    rooms("1002", own)
+    monkeypatch.setattr(server, "MAX_BANK_BYTES", shared.footprint() + own.footprint() - 1)
+    with server.lock:
+        assert server.enforce_limits() == [("1002", "memory")]
+    assert server.evictions["memory"]["bytes"] >= own.footprint()
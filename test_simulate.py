@@ -0,0 +1,161 @@
+import server
+import simulate
+import tournament
+
+SETTINGS = {"duration": 10, "gap": 1.0, "early_finish": True}
+
+
+def play_games(seed):
+    sim = simulate.Simulation(seed)
+    return simulate.digest(sim.run(simulate.run_games, sim, 6, 3, 5, 3, SETTINGS, 0.6))
+
+
+def play_tournament(seed):
+    sim = simulate.Simulation(seed)
+    options = dict(tournament.DEFAULTS, room_size=3, wave_size=2, wave_gap=0.5)
+    standings, pushes = sim.run(simulate.run_tournament, sim, 10, 5, SETTINGS, options, 0.6)
+    return standings, pushes
+
+
+def test_games_repeat_with_the_same_seed():
+    assert play_games(3) == play_games(3)
+
+
+def test_tournaments_repeat_with_the_same_seed():
+    first = play_tournament(3)
+    assert first[0]["final"] and first[0]["players"] == 10
+    assert play_tournament(3) == first
+
+
+def test_seed_changes_the_games():
+    assert play_games(3) != play_games(4)
+
+
+def test_idle_rooms_close_on_the_simulated_clock():
+    sim = simulate.Simulation(1)
+
+    def script():
+        host = sim.connect("host")
+        host.send("create_game")
+        code = host.wait_for("system", lambda m: m["message"].startswith("Game code:"))["message"].split()[-1]
+        sim.clock.sleep(server.ROOM_IDLE_TTL - 1)
+        with server.lock:
+            assert server.enforce_limits() == []
+        sim.clock.sleep(1)
+        with server.lock:
+            return code, server.enforce_limits()
+
+    code, closed = sim.run(script)
+    assert closed == [(code, "idle")]
+
+
+def create_tournament(sim, organizer, **options):
+    questions, _ = simulate.make_bank(3, sim.random("bank"))
+    organizer.send("create_tournament", questions=questions, **options)
+    reply = organizer.wait_for("system", lambda m: m["message"].startswith(("Tournament code:", "The server is full")))
+    return reply["message"].split()[-1] if reply["message"].startswith("Tournament code:") else None
+
+
+def test_unstarted_tournaments_are_called_off_when_idle():
+    sim = simulate.Simulation(1)
+
+    def script():
+        organizer = sim.connect("organizer")
+        code = create_tournament(sim, organizer)
+        player = sim.connect("player")
+        player.send("join_tournament", tournament=code)
+        room = player.wait_for("join_ok")["game_code"]
+        sim.clock.sleep(server.ROOM_IDLE_TTL)
+        with server.lock:
+            closed = server.enforce_limits()
+        return code, room, closed, organizer.wait_for("system"), player.wait_for("end_game")
+
+    code, room, closed, notice, end = sim.run(script)
+    assert sorted(closed) == sorted([(code, "idle"), (room, "idle")])
+    assert code in notice["message"] and end is not None
+    assert code not in server.tournaments and room not in server.games
+
+
+def test_tournament_count_is_capped(monkeypatch):
+    monkeypatch.setattr(server, "MAX_TOURNAMENTS", 2)
+    sim = simulate.Simulation(1)
+
+    def script():
+        organizer = sim.connect("organizer")
+        first = create_tournament(sim, organizer)
+        sim.clock.sleep(1)
+        second = create_tournament(sim, organizer)
+        third = create_tournament(sim, organizer)   # the least recently used one makes way
+        with server.lock:
+            for code in (second, third):
+                server.tournaments[code].started = True  # running: never dropped
+        fourth = create_tournament(sim, organizer)
+        return first, second, third, fourth
+
+    first, second, third, fourth = sim.run(script)
+    assert third and fourth is None
+    assert set(server.tournaments) == {second, third}
+
+
+def test_tournament_banks_count_towards_the_memory_cap(monkeypatch):
+    sim = simulate.Simulation(1)
+
+    def script():
+        organizer = sim.connect("organizer")
+        code = create_tournament(sim, organizer)
+        with server.lock:
+            bank = server.tournaments[code].bank
+            assert id(bank) in server.bank_refs()
+            monkeypatch.setattr(server, "MAX_BANK_BYTES", bank.footprint() - 1)
+            return code, server.enforce_limits()
+
+    code, closed = sim.run(script)
+    assert closed == [(code, "memory")] and server.evictions["memory"]["bytes"] > 0
+
+
+def test_tournament_rooms_are_not_journaled(monkeypatch):
+    records = []
+    monkeypatch.setattr(server, "journal", type("Journal", (), {"append": staticmethod(records.append)})())
+    sim = simulate.Simulation(1)
+    settings = dict(SETTINGS, duration=3)
+    options = dict(tournament.DEFAULTS, room_size=2)
+    sim.run(simulate.run_tournament, sim, 3, 2, settings, options, 0.6)
+    assert records == []
+
+
+def test_seating_a_player_never_drops_their_tournament(monkeypatch):
+    monkeypatch.setattr(server, "MAX_ROOMS", 1)
+    sim = simulate.Simulation(1)
+
+    def script():
+        organizer = sim.connect("organizer")
+        code = create_tournament(sim, organizer, room_size=2)
+        for name in ("p0", "p1"):
+            sim.connect(name).send("join_tournament", tournament=code)
+        sim.clock.sleep(server.ROOM_IDLE_TTL)   # the tournament is idle by now
+        late = sim.connect("late")
+        late.send("join_tournament", tournament=code)
+        return code, late.wait_for("join_ok")
+
+    code, joined = sim.run(script)
+    assert code in server.tournaments and joined["game_code"] in server.tournaments[code].rooms
+
+
+def test_tournament_rooms_only_take_their_own_players_through_join_game():
+    sim = simulate.Simulation(1)
+
+    def script():
+        organizer = sim.connect("organizer")
+        code = create_tournament(sim, organizer)
+        player = sim.connect("player")
+        player.send("join_tournament", tournament=code)
+        room = player.wait_for("join_ok")["game_code"]
+        intruder = sim.connect("intruder")
+        intruder.send("join_game", game_code=room)
+        refused = intruder.wait_for("join_fail")
+        player.send("join_game", game_code=room)   # coming back to their seat
+        return room, refused, player.wait_for("join_ok")
+
+    room, refused, rejoined = sim.run(script)
+    assert "tournament" in refused["reason"] and rejoined["game_code"] == room
+    assert "intruder" not in server.games[room].players
@@ -0,0 +1,79 @@
+import heapq
+from itertools import islice
+
+# Tournament bookkeeping: many rooms playing the same questions at once, and
+# one set of standings across all of them. The server (TOURNAMENTS section)
+# owns the rooms themselves; this only tracks who plays where and the scores.
+#
+# Standings are kept per room as a sorted run of (-score, username), replaced
+# whenever that room finishes a round (a sort of one room's players). The
+# global table is never sorted: its top N come from a lazy k-way merge of the
+# runs, which stops after N entries.
+
+# Options an organiser can set, with their bounds (type follows the bounds).
+LIMITS = {"room_size": (2, 100), "wave_size": (1, 1000), "wave_gap": (0.0, 60.0),
+          "workers": (1, 32), "top": (1, 100)}
+DEFAULTS = {"room_size": 20, "wave_size": 50, "wave_gap": 2.0, "workers": 4, "top": 10}
+
+
+class Tournament:
+    def __init__(self, code, organizer, bank, settings, options):
+        self.code = code
+        self.organizer = organizer
+        self.bank = bank
+        self.settings = settings    # round settings for every room
+        self.options = options      # see LIMITS
+        self.rooms = []             # room codes, in the order they were opened
+        self.players = {}           # username -> room code
+        self.runs = {}              # room code -> sorted [(-score, username), ...]
+        self.rounds = {}            # room code -> rounds played
+        self.finished = set()       # rooms whose game is over
+        self.started = False
+        self.finished_at = None
+        self.last_active = 0.0      # server clock: created, joined or finished
+        self.push_pending = False   # a standings push is scheduled
+
+    def room_for_next_player(self, room_sizes):
+        # The room a new player goes in: the newest one while it has space,
+        # else None (open a new one). room_sizes(code) -> players in it.
+        if self.rooms and room_sizes(self.rooms[-1]) < self.options["room_size"]:
+            return self.rooms[-1]
+        return None
+
+    def plan(self):
+        # Which rooms start in which wave, split between the workers:
+        # [[(wave, room code), ...] per worker]. Rooms of one wave are dealt
+        # out round-robin so each worker starts about the same number.
+        wave_size = self.options["wave_size"]
+        workers = min(self.options["workers"], len(self.rooms)) or 1
+        shares = [[] for _ in range(workers)]
+        for i, code in enumerate(self.rooms):
+            shares[i % workers].append((i // wave_size, code))
+        return shares
+
+    def waves(self):
+        return -(-len(self.rooms) // self.options["wave_size"])
+
+    # -------- standings --------
+    def update(self, room, scores, over=False):
+        # scores: [[username, score], ...] for the room after a round.
+        self.runs[room] = sorted((-score, name) for name, score in scores)
+        self.rounds[room] = self.rounds.get(room, 0) + 1
+        if over:
+            self.finished.add(room)
+
+    def room_over(self, room):
+        self.finished.add(room)
+
+    def over(self):
+        return self.started and len(self.finished) >= len(self.rooms)
+
+    def top(self, n=None):
+        merged = heapq.merge(*self.runs.values())
+        return [[name, -score] for score, name in islice(merged, n or self.options["top"])]
+
+    def digest(self):
+        # The compact standings frame pushed to everyone in the tournament.
+        return {"type": "standings", "tournament": self.code, "top": self.top(),
+                "players": len(self.players), "rooms": len(self.rooms),
+                "finished": len(self.finished), "final": self.over()}
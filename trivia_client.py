@@ -0,0 +1,540 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import seal
+import wire
+
+# Headless, GUI-free Trivia client. Everything runs on one asyncio loop, so a
+# single process can drive thousands of these (bots, load tests, automation).
+#
+#     client = TriviaClient()
+#     await client.login("bot1")
+#     result = await client.join_game("1234")
+#     async for event in client.events(Question, RoundEnd):
+#         ...
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 65432
+LOGIN_TIMEOUT = 5.0
+RECONNECT_DELAYS = (0.5, 1.0, 2.0, 5.0, 10.0)
+EVENT_QUEUE_SIZE = 1000
+
+# Clock sync: a burst of pings after login, then one every SYNC_INTERVAL.
+# The offset comes from the lowest-RTT sample among the last SYNC_HISTORY.
+SYNC_SAMPLES = 4
+SYNC_HISTORY = 8
+SYNC_INTERVAL = 30.0
+PING_TIMEOUT = 2.0
+
+
+class LoginError(Exception):
+    pass
+
+
+# ───────────────────────────────────────────────
+# EVENTS (one class per server message type)
+# ───────────────────────────────────────────────
+@dataclass
+class Event:
+    raw: dict = field(repr=False)
+
+
+@dataclass
+class SystemMessage(Event):
+    message: str = ""
+
+
+@dataclass
+class ChatMessage(Event):
+    username: str = ""
+    message: str = ""
+
+
+@dataclass
+class ChatBatch(Event):
+    messages: list = field(default_factory=list)
+
+
+@dataclass
+class Question(Event):
+    question: str = ""
+    choices: list = field(default_factory=list)
+    deadline: float = None  # server clock
+    duration: int = None
+
+
+@dataclass
+class Timer(Event):
+    remaining: int = 0
+
+
+@dataclass
+class RoundEnd(Event):
+    correct: str = ""
+    players: list = field(default_factory=list)
+
+
+@dataclass
+class EndQuestion(Event):
+    pass
+
+
+@dataclass
+class EndGame(Event):
+    pass
+
+
+@dataclass
+class JoinOk(Event):
+    game_code: str = ""
+
+
+@dataclass
+class JoinFail(Event):
+    reason: str = ""
+
+
+@dataclass
+class PlayerList(Event):
+    players: list = field(default_factory=list)
+
+
+@dataclass
+class Standings(Event):
+    # Top of a tournament's table, across all its rooms.
+    tournament: str = ""
+    top: list = field(default_factory=list)   # [[username, score], ...]
+    players: int = 0
+    rooms: int = 0
+    finished: int = 0
+    final: bool = False
+
+
+@dataclass
+class Unknown(Event):
+    type: str = ""
+
+
+# Local connection events; never sent by the server.
+@dataclass
+class Disconnected(Event):
+    reason: str = ""
+
+
+@dataclass
+class Reconnected(Event):
+    pass
+
+
+EVENT_TYPES = {
+    "system": SystemMessage,
+    "chat": ChatMessage,
+    "chat_batch": ChatBatch,
+    "question": Question,
+    "timer": Timer,
+    "round_end": RoundEnd,
+    "end_question": EndQuestion,
+    "end_game": EndGame,
+    "join_ok": JoinOk,
+    "join_fail": JoinFail,
+    "player_list": PlayerList,
+    "standings": Standings,
+}
+
+_FIELDS = {
+    cls: [f for f in cls.__dataclass_fields__ if f != "raw"]
+    for cls in EVENT_TYPES.values()
+}
+
+
+def parse_event(msg):
+    cls = EVENT_TYPES.get(msg.get("type"))
+    if cls is None:
+        return Unknown(raw=msg, type=msg.get("type", ""))
+    return cls(raw=msg, **{k: msg[k] for k in _FIELDS[cls] if k in msg})
+
+
+# ───────────────────────────────────────────────
+# CLIENT
+# ───────────────────────────────────────────────
+class TriviaClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, *, wire_formats=wire.SUPPORTED,
+                 compressors=wire.COMPRESSORS, features=wire.FEATURES, reconnect=True,
+                 login_timeout=LOGIN_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.wire_formats = list(wire_formats)
+        self.compressors = list(compressors)
+        self.offered_features = list(features)
+        self.reconnect = reconnect
+        self.login_timeout = login_timeout
+
+        self.username = None
+        self.game_code = None
+        self.wire = wire.JSON
+        self.compress = None
+        self.features = []
+        self.offset = 0.0  # server clock minus ours
+        self.rtt = None
+        self.connected = False
+        self.closed = False
+
+        self._reader = None
+        self._writer = None
+        self._decoder = None
+        self._read_task = None
+        self._outbound = []
+        self._flush_scheduled = False
+        self._subscribers = []
+        self._callbacks = []
+        self._waiters = []
+        self._sealed = {}
+        self._samples = deque(maxlen=SYNC_HISTORY)
+        self._pings = {}
+        self._sync_task = None
+        self._countdown = None
+
+    # -------- connection --------
+    async def login(self, username):
+        self.username = username
+        self.closed = False
+        res = await asyncio.wait_for(self._connect(), self.login_timeout)
+        self._read_task = asyncio.ensure_future(self._read_loop())
+        self._sync_task = asyncio.ensure_future(self._sync_loop())
+        return res
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(wire.encode({
+                "action": "login", "username": self.username,
+                "wire": self.wire_formats, "compress": self.compressors,
+                "features": self.offered_features,
+            }))
+            decoder = wire.Decoder()
+            res = None
+            while res is None:
+                data = await reader.read(65536)
+                if not data:
+                    raise LoginError("Server closed the connection.")
+                decoder.feed(data)
+                res = decoder.next()
+            if res.get("status") != "success":
+                raise LoginError(res.get("message", "Login rejected."))
+        except BaseException:
+            writer.close()
+            raise
+
+        self._reader, self._writer = reader, writer
+        self._decoder = decoder
+        self.wire = decoder.wire = res.get("wire", wire.JSON)
+        self.compress = res.get("compress")
+        self.features = res.get("features") or []
+        self._sealed.clear()
+        self.connected = True
+        self._schedule_flush()
+        return res
+
+    async def close(self):
+        self.closed = True
+        if self.connected:
+            self.send_nowait({"action": "disconnect"})
+            self._flush()
+        if self._writer:
+            self._writer.close()
+        self.connected = False
+        self._stop_countdown()
+        for task in (self._read_task, self._sync_task):
+            if task:
+                task.cancel()
+
+    async def _read_loop(self):
+        while not self.closed:
+            reason = "connection closed"
+            try:
+                while True:
+                    # Drain first: frames may have arrived with the login reply
+                    while True:
+                        msg = self._decoder.next()
+                        if msg is None:
+                            break
+                        self._handle(msg)
+                    data = await self._reader.read(65536)
+                    if not data:
+                        break
+                    self._decoder.feed(data)
+            except (OSError, wire.WireError, ValueError) as e:
+                reason = str(e)
+
+            self.connected = False
+            self._stop_countdown()
+            if self.closed:
+                return
+            self._dispatch(Disconnected(raw={}, reason=reason))
+            if not self.reconnect or not await self._reconnect():
+                self.closed = True
+                return
+            self._dispatch(Reconnected(raw={}))
+
+    async def _reconnect(self):
+        for delay in RECONNECT_DELAYS:
+            await asyncio.sleep(delay)
+            if self.closed:
+                return False
+            try:
+                await asyncio.wait_for(self._connect(), self.login_timeout)
+            except (OSError, LoginError, asyncio.TimeoutError):
+                continue
+            # Put the player back where they were; hosts' rooms close with them.
+            if self.game_code:
+                self._outbound.insert(0, {"action": "join_game", "game_code": self.game_code})
+                self._schedule_flush()
+            return True
+        return False
+
+    # -------- sending (pipelined) --------
+    def send_nowait(self, msg):
+        # Queued and written once per loop iteration, so a burst of calls
+        # becomes one write. Safe to call while reconnecting.
+        self._outbound.append(msg)
+        self._schedule_flush()
+
+    async def send(self, msg):
+        self.send_nowait(msg)
+        if self._writer and self.connected:
+            await self._writer.drain()
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled and self._outbound:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self.connected or not self._outbound:
+            return
+        batch, self._outbound = self._outbound, []
+        self._writer.write(b"".join(wire.encode(m, self.wire, self.compress) for m in batch))
+
+    # -------- clock sync --------
+    def server_time(self, local=None):
+        # Our timestamp (now by default) on the server's clock.
+        return (time.time() if local is None else local) + self.offset
+
+    async def ping(self, timeout=PING_TIMEOUT):
+        # One NTP-style exchange; returns the round trip or None on timeout.
+        sent_at = time.time()
+        fut = asyncio.get_running_loop().create_future()
+        self._pings[sent_at] = fut
+        self.send_nowait({"action": "ping", "sent_at": sent_at})
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pings.pop(sent_at, None)
+
+    def _on_pong(self, msg):
+        received = time.time()
+        fut = self._pings.get(msg.get("sent_at"))
+        if fut is None or fut.done():
+            return
+        sent_at = msg["sent_at"]
+        rtt = received - sent_at
+        # Assumes a symmetric path; the lowest-RTT sample has the least room
+        # for asymmetry, so that's the one we trust.
+        self._samples.append((rtt, msg["server_time"] - (sent_at + received) / 2))
+        self.rtt, self.offset = min(self._samples)
+        fut.set_result(rtt)
+
+    async def _sync_loop(self):
+        while not self.closed:
+            if self.connected:
+                for _ in range(1 if self._samples else SYNC_SAMPLES):
+                    await self.ping()
+            await asyncio.sleep(SYNC_INTERVAL if self._samples else 1.0)
+
+    # -------- client-side countdown --------
+    def _start_countdown(self, deadline):
+        self._stop_countdown()
+        self._countdown = asyncio.ensure_future(self._run_countdown(deadline - self.offset))
+
+    def _stop_countdown(self):
+        if self._countdown:
+            self._countdown.cancel()
+            self._countdown = None
+
+    async def _run_countdown(self, local_deadline):
+        # The same Timer events the server used to send, one per second.
+        remaining = math.ceil(local_deadline - time.time())
+        while remaining > 0:
+            self._dispatch(parse_event({"type": "timer", "remaining": remaining}))
+            await asyncio.sleep(max(0.0, local_deadline - (remaining - 1) - time.time()))
+            remaining -= 1
+
+    # -------- incoming frames --------
+    def _handle(self, msg):
+        kind = msg.get("type")
+        if kind == "pong":
+            self._on_pong(msg)
+            return
+        if kind in ("round_end", "end_question", "end_game"):
+            self._stop_countdown()
+        if kind == "prefetch":
+            # Only the upcoming question is ever useful.
+            self._sealed = {msg["qid"]: msg["sealed"]}
+            return
+        if kind == "reveal":
+            sealed = self._sealed.pop(msg.get("qid"), None)
+            if sealed is None:
+                return
+            try:
+                body = wire.unpack(seal.open_sealed(msg["key"], sealed))
+            except (seal.SealError, wire.WireError):
+                return
+            msg = {"type": "question", "question": body.get("question", ""),
+                   "choices": body.get("choices", []),
+                   "deadline": msg.get("deadline"), "duration": msg.get("duration")}
+        self._dispatch(parse_event(msg))
+        if kind in ("question", "reveal") and wire.CLIENT_TIMER in self.features and msg.get("deadline"):
+            self._start_countdown(msg["deadline"])
+
+    # -------- events --------
+    def events(self, *types):
+        # Async iterator over events of the given classes (all if none given).
+        return _Subscription(self, types, EVENT_QUEUE_SIZE)
+
+    def on(self, callback):
+        # Plain callback for every event; used by GUI shells.
+        self._callbacks.append(callback)
+
+    def _dispatch(self, event):
+        if isinstance(event, JoinOk):
+            self.game_code = event.game_code
+        for cb in self._callbacks:
+            cb(event)
+        for sub in self._subscribers:
+            sub.offer(event)
+        if self._waiters:
+            still = []
+            for predicate, fut in self._waiters:
+                if fut.done():
+                    continue
+                if predicate(event):
+                    fut.set_result(event)
+                else:
+                    still.append((predicate, fut))
+            self._waiters = still
+
+    async def wait_for(self, predicate, timeout=None):
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, fut))
+        return await asyncio.wait_for(fut, timeout)
+
+    # -------- actions --------
+    async def create_game(self, timeout=LOGIN_TIMEOUT):
+        waiter = self.wait_for(
+            lambda e: isinstance(e, SystemMessage) and e.message.startswith("Game code: "), timeout)
+        self.send_nowait({"action": "create_game"})
+        event = await waiter
+        self.game_code = None  # hosts don't rejoin their own room
+        return event.message.split(": ", 1)[1]
+
+    async def join_game(self, game_code, timeout=LOGIN_TIMEOUT):
+        waiter = self.wait_for(lambda e: isinstance(e, (JoinOk, JoinFail)), timeout)
+        self.send_nowait({"action": "join_game", "game_code": str(game_code)})
+        return await waiter
+
+    async def upload_questions(self, questions):
+        await self.send({"action": "upload_questions", "questions": questions})
+
+    async def use_library(self, name):
+        # A compiled question bank on the server (see --library) instead of
+        # uploading questions.
+        await self.send({"action": "use_library", "name": name})
+
+    async def list_libraries(self):
+        await self.send({"action": "list_libraries"})
+
+    async def room_settings(self, duration=None, gap=None, early_finish=None, count=None,
+                            categories=None, difficulty=None, mix=None, fresh_games=None):
+        # Host only; unspecified settings are left as they are. count > 0
+        # makes each game draw that many questions from the upload (0 plays
+        # them all in order); fresh_games avoids questions from the host's
+        # last N games.
+        settings = {"duration": duration, "gap": gap, "early_finish": early_finish, "count": count,
+                    "categories": categories, "difficulty": difficulty, "mix": mix,
+                    "fresh_games": fresh_games}
+        await self.send({"action": "room_settings", **{k: v for k, v in settings.items() if v is not None}})
+
+    async def start_game(self):
+        await self.send({"action": "start_game"})
+
+    async def end_game(self):
+        await self.send({"action": "end_game"})
+
+    async def answer(self, choice, clicked_at=None):
+        # clicked_at is our local time; the server gets it on its own clock.
+        clicked_at = self.server_time(clicked_at)
+        await self.send({"action": "answer", "choice": choice, "clicked_at": clicked_at})
+
+    async def chat(self, message):
+        await self.send({"action": "chat", "message": message})
+
+    # -------- tournaments --------
+    async def create_tournament(self, questions=None, library=None, timeout=LOGIN_TIMEOUT, **options):
+        # options: room_size, wave_size, wave_gap, workers, top, plus any
+        # room_settings() setting for every room. Returns the tournament code.
+        waiter = self.wait_for(
+            lambda e: isinstance(e, SystemMessage) and e.message.startswith("Tournament code: "), timeout)
+        msg = {"action": "create_tournament", **{k: v for k, v in options.items() if v is not None}}
+        if library:
+            msg["library"] = library
+        else:
+            msg["questions"] = questions
+        self.send_nowait(msg)
+        event = await waiter
+        return event.message.split(": ", 1)[1]
+
+    async def join_tournament(self, code, timeout=LOGIN_TIMEOUT):
+        # Seats us in one of the tournament's rooms; JoinOk carries its code.
+        waiter = self.wait_for(lambda e: isinstance(e, (JoinOk, JoinFail)), timeout)
+        self.send_nowait({"action": "join_tournament", "tournament": str(code)})
+        return await waiter
+
+    async def start_tournament(self, code):
+        await self.send({"action": "start_tournament", "tournament": str(code)})
+
+    async def tournament_standings(self, code):
+        # The server answers with a Standings event.
+        await self.send({"action": "tournament_standings", "tournament": str(code)})
+
+
+class _Subscription:
+    def __init__(self, client, types, maxsize):
+        self.client = client
+        self.types = tuple(types)
+        self.queue = asyncio.Queue(maxsize)
+        client._subscribers.append(self)
+
+    def offer(self, event):
+        if self.types and not isinstance(event, self.types):
+            return
+        if self.queue.full():
+            # A slow consumer loses the oldest events rather than stalling
+            # the read loop for every other subscriber.
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def close(self):
+        if self in self.client._subscribers:
+            self.client._subscribers.remove(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
@@ -0,0 +1,517 @@
+import json
+import math
+import struct
+import sys
+import time
+import zlib
+
+# Wire formats a connection can speak. Every connection starts in JSON (one
+# object per line) and may switch to BIN1 after the login handshake.
+JSON = "json"
+BIN1 = "bin1"
+SUPPORTED = (BIN1, JSON)
+
+# BIN1 frame: 4-byte big-endian body length, 1 flags byte, then the body.
+# The body is msgpack-compatible, except that map keys found in KEYS and the
+# values of "type"/"action" found in TYPES are sent as small integers.
+HEADER = struct.Struct(">IB")
+MAX_FRAME = 16 * 1024 * 1024
+
+# Flag bits. Compression is only available on BIN1 since JSON has no header.
+FLAG_ZLIB = 0x01
+FLAG_DICT = 0x02
+
+# Compression modes a connection can negotiate. "zlib+d1" primes zlib with
+# ZDICT below; bump the suffix if the dictionary ever changes.
+ZLIB = "zlib"
+ZLIB_DICT = "zlib+d1"
+COMPRESSORS = (ZLIB_DICT, ZLIB)
+
+# Frames smaller than this are sent raw; they rarely shrink enough to pay
+# for the deflate call on both ends.
+COMPRESS_THRESHOLD = 512
+COMPRESS_LEVEL = 6
+
+# Append-only: the index of each entry is part of the protocol.
+KEYS = [
+    "type", "action", "message", "username", "players", "score", "remaining",
+    "question", "choices", "correct", "game_code", "reason", "choice",
+    "questions", "answer", "status", "messages", "wire", "password",
+    "host_request", "compress", "clicked_at", "features", "sealed", "key",
+    "qid", "sent_at", "server_time", "deadline", "duration", "gap",
+    "early_finish",
+]
+TYPES = [
+    "system", "chat", "chat_batch", "question", "timer", "round_end",
+    "end_question", "end_game", "join_ok", "join_fail", "player_list",
+    "login", "create_game", "join_game", "upload_questions", "start_game",
+    "answer", "disconnect", "prefetch", "reveal", "ping", "pong",
+    "room_settings",
+]
+KEY_IDS = {k: i for i, k in enumerate(KEYS)}
+TYPE_IDS = {t: i for i, t in enumerate(TYPES)}
+TAGGED = ("type", "action")
+
+_pack_B = struct.Struct(">B").pack
+_pack_H = struct.Struct(">H").pack
+_pack_I = struct.Struct(">I").pack
+_pack_Q = struct.Struct(">Q").pack
+_pack_b = struct.Struct(">b").pack
+_pack_h = struct.Struct(">h").pack
+_pack_i = struct.Struct(">i").pack
+_pack_q = struct.Struct(">q").pack
+_pack_d = struct.Struct(">d").pack
+
+
+class WireError(ValueError):
+    pass
+
+
+# ───────────────────────────────────────────────
+# ENCODING
+# ───────────────────────────────────────────────
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(_pack_B(n))
+    elif -32 <= n < 0:
+        out.append(_pack_B(n & 0xFF))
+    elif n >= 0:
+        if n <= 0xFF:
+            out.append(b"\xcc" + _pack_B(n))
+        elif n <= 0xFFFF:
+            out.append(b"\xcd" + _pack_H(n))
+        elif n <= 0xFFFFFFFF:
+            out.append(b"\xce" + _pack_I(n))
+        else:
+            out.append(b"\xcf" + _pack_Q(n))
+    else:
+        if n >= -0x80:
+            out.append(b"\xd0" + _pack_b(n))
+        elif n >= -0x8000:
+            out.append(b"\xd1" + _pack_h(n))
+        elif n >= -0x80000000:
+            out.append(b"\xd2" + _pack_i(n))
+        else:
+            out.append(b"\xd3" + _pack_q(n))
+
+
+# Usernames, choices and question text repeat across many frames; keep their
+# encoded form around instead of re-encoding every time.
+_str_cache = {}
+_STR_CACHE_MAX = 4096
+
+
+def _pack_str(s, out):
+    hit = _str_cache.get(s)
+    if hit is not None:
+        out.append(hit)
+        return
+    raw = s.encode("utf-8")
+    n = len(raw)
+    if n < 32:
+        out.append(_pack_B(0xA0 | n))
+    elif n <= 0xFF:
+        out.append(b"\xd9" + _pack_B(n))
+    elif n <= 0xFFFF:
+        out.append(b"\xda" + _pack_H(n))
+    else:
+        out.append(b"\xdb" + _pack_I(n))
+    out.append(raw)
+    if n < 256:
+        if len(_str_cache) >= _STR_CACHE_MAX:
+            _str_cache.clear()
+        _str_cache[s] = out[-2] + raw
+
+
+def _pack_map_header(n, out):
+    if n < 16:
+        out.append(_pack_B(0x80 | n))
+    elif n <= 0xFFFF:
+        out.append(b"\xde" + _pack_H(n))
+    else:
+        out.append(b"\xdf" + _pack_I(n))
+
+
+def _pack_item(k, v, out):
+    kid = KEY_IDS.get(k)
+    if kid is None:
+        _pack_str(k, out)
+    else:
+        out.append(_pack_B(kid))
+    if k in TAGGED and v in TYPE_IDS:
+        out.append(_pack_B(TYPE_IDS[v]))
+    else:
+        _pack(v, out)
+
+
+def _pack(obj, out):
+    t = type(obj)
+    if t is str:
+        _pack_str(obj, out)
+    elif t is int:
+        _pack_int(obj, out)
+    elif t is dict:
+        _pack_map_header(len(obj), out)
+        for k, v in obj.items():
+            _pack_item(k, v, out)
+    elif t is list or t is tuple:
+        n = len(obj)
+        if n < 16:
+            out.append(_pack_B(0x90 | n))
+        elif n <= 0xFFFF:
+            out.append(b"\xdc" + _pack_H(n))
+        else:
+            out.append(b"\xdd" + _pack_I(n))
+        for v in obj:
+            _pack(v, out)
+    elif obj is None:
+        out.append(b"\xc0")
+    elif obj is True:
+        out.append(b"\xc3")
+    elif obj is False:
+        out.append(b"\xc2")
+    elif t is float:
+        out.append(b"\xcb" + _pack_d(obj))
+    elif t is bytes:
+        n = len(obj)
+        if n <= 0xFF:
+            out.append(b"\xc4" + _pack_B(n))
+        elif n <= 0xFFFF:
+            out.append(b"\xc5" + _pack_H(n))
+        else:
+            out.append(b"\xc6" + _pack_I(n))
+        out.append(obj)
+    else:
+        raise WireError(f"cannot encode {t.__name__}")
+
+
+def pack(message):
+    out = []
+    _pack(message, out)
+    return b"".join(out)
+
+
+def compress_body(body, mode):
+    if mode == ZLIB_DICT:
+        c = zlib.compressobj(COMPRESS_LEVEL, zdict=ZDICT)
+        flags = FLAG_ZLIB | FLAG_DICT
+    else:
+        c = zlib.compressobj(COMPRESS_LEVEL)
+        flags = FLAG_ZLIB
+    return c.compress(body) + c.flush(), flags
+
+
+def _frame(body, compress):
+    flags = 0
+    if compress and len(body) >= COMPRESS_THRESHOLD:
+        packed, packed_flags = compress_body(body, compress)
+        if len(packed) < len(body):
+            body, flags = packed, packed_flags
+    return HEADER.pack(len(body), flags) + body
+
+
+def encode(message, wire=JSON, compress=None):
+    if wire == BIN1:
+        return _frame(pack(message), compress)
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+class Template:
+    """A message whose fields are encoded once, for frames that are sent
+    again and again with only a few small fields changing (e.g. a question
+    and its round deadline). render(extra) gives the same bytes as
+    encode({**message, **extra}) without re-encoding the fixed part.
+    """
+
+    def __init__(self, message, wire=JSON, compress=None):
+        self.wire = wire
+        self.compress = compress
+        self.count = len(message)
+        if wire == BIN1:
+            out = []
+            for k, v in message.items():
+                _pack_item(k, v, out)
+            self.fixed = b"".join(out)
+        else:
+            # Everything but the closing brace
+            self.fixed = json.dumps(message)[:-1].encode("utf-8")
+
+    def render(self, extra):
+        if self.wire == BIN1:
+            out = []
+            _pack_map_header(self.count + len(extra), out)
+            out.append(self.fixed)
+            for k, v in extra.items():
+                _pack_item(k, v, out)
+            return _frame(b"".join(out), self.compress)
+        if not extra:
+            return self.fixed + b"}\n"
+        tail = ", ".join(_json_field(k, v) for k, v in extra.items()).encode("utf-8")
+        return self.fixed + (b", " if self.count else b"") + tail + b"}\n"
+
+
+_json_keys = {}
+
+
+def _json_field(k, v):
+    # Same text json.dumps would produce; plain numbers skip the encoder.
+    key = _json_keys.get(k)
+    if key is None:
+        key = _json_keys[k] = json.dumps(k) + ": "
+    if type(v) is int or (type(v) is float and math.isfinite(v)):
+        return key + repr(v)
+    return key + json.dumps(v)
+
+
+# ───────────────────────────────────────────────
+# DECODING
+# ───────────────────────────────────────────────
+_unpack_from = struct.unpack_from
+
+
+def _unpack(buf, i):
+    b = buf[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if 0xA0 <= b <= 0xBF:
+        n = b & 0x1F
+        return buf[i:i + n].decode("utf-8"), i + n
+    if 0x80 <= b <= 0x8F:
+        return _unpack_map(buf, i, b & 0x0F)
+    if 0x90 <= b <= 0x9F:
+        return _unpack_array(buf, i, b & 0x0F)
+    if b >= 0xE0:
+        return b - 0x100, i
+    if b == 0xC0:
+        return None, i
+    if b == 0xC2:
+        return False, i
+    if b == 0xC3:
+        return True, i
+    if b == 0xCC:
+        return buf[i], i + 1
+    if b == 0xCD:
+        return _unpack_from(">H", buf, i)[0], i + 2
+    if b == 0xCE:
+        return _unpack_from(">I", buf, i)[0], i + 4
+    if b == 0xCF:
+        return _unpack_from(">Q", buf, i)[0], i + 8
+    if b == 0xD0:
+        return _unpack_from(">b", buf, i)[0], i + 1
+    if b == 0xD1:
+        return _unpack_from(">h", buf, i)[0], i + 2
+    if b == 0xD2:
+        return _unpack_from(">i", buf, i)[0], i + 4
+    if b == 0xD3:
+        return _unpack_from(">q", buf, i)[0], i + 8
+    if b == 0xCB:
+        return _unpack_from(">d", buf, i)[0], i + 8
+    if b in (0xD9, 0xDA, 0xDB, 0xC4, 0xC5, 0xC6):
+        if b in (0xD9, 0xC4):
+            n, i = buf[i], i + 1
+        elif b in (0xDA, 0xC5):
+            n, i = _unpack_from(">H", buf, i)[0], i + 2
+        else:
+            n, i = _unpack_from(">I", buf, i)[0], i + 4
+        raw = buf[i:i + n]
+        if b >= 0xD9:
+            return raw.decode("utf-8"), i + n
+        return raw, i + n
+    if b == 0xDC:
+        return _unpack_array(buf, i + 2, _unpack_from(">H", buf, i)[0])
+    if b == 0xDD:
+        return _unpack_array(buf, i + 4, _unpack_from(">I", buf, i)[0])
+    if b == 0xDE:
+        return _unpack_map(buf, i + 2, _unpack_from(">H", buf, i)[0])
+    if b == 0xDF:
+        return _unpack_map(buf, i + 4, _unpack_from(">I", buf, i)[0])
+    raise WireError(f"bad type byte 0x{b:02x}")
+
+
+def _unpack_array(buf, i, n):
+    items = []
+    for _ in range(n):
+        v, i = _unpack(buf, i)
+        items.append(v)
+    return items, i
+
+
+def _unpack_map(buf, i, n):
+    obj = {}
+    for _ in range(n):
+        k, i = _unpack(buf, i)
+        if type(k) is int:
+            k = KEYS[k]
+        v, i = _unpack(buf, i)
+        if k in TAGGED and type(v) is int:
+            v = TYPES[v]
+        obj[k] = v
+    return obj, i
+
+
+def unpack(body):
+    obj, i = _unpack(body, 0)
+    if i != len(body):
+        raise WireError("trailing bytes in frame")
+    return obj
+
+
+class Decoder:
+    """Incremental frame decoder for one connection.
+
+    Call feed() with raw bytes, then next() until it returns None. The wire
+    format can be switched between next() calls (e.g. right after login).
+    """
+
+    def __init__(self, wire=JSON):
+        self.wire = wire
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next(self):
+        buf = self.buffer
+        if self.wire == BIN1:
+            if len(buf) < HEADER.size:
+                return None
+            n, flags = HEADER.unpack_from(buf)
+            if n > MAX_FRAME:
+                raise WireError("frame too large")
+            end = HEADER.size + n
+            if len(buf) < end:
+                return None
+            body = bytes(buf[HEADER.size:end])
+            del buf[:end]
+            if flags & FLAG_ZLIB:
+                body = decompress_body(body, flags)
+            return unpack(body)
+
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0:
+                return None
+            line = bytes(buf[:nl]).strip()
+            del buf[:nl + 1]
+            if line:
+                return json.loads(line)
+
+
+def decompress_body(body, flags):
+    if flags & FLAG_DICT:
+        d = zlib.decompressobj(zdict=ZDICT)
+    else:
+        d = zlib.decompressobj()
+    out = d.decompress(body, MAX_FRAME)
+    if d.unconsumed_tail:
+        raise WireError("frame too large")
+    return out
+
+
+def negotiate(offered):
+    # Pick the first format we support from the client's preference list.
+    for w in offered or ():
+        if w in SUPPORTED:
+            return w
+    return JSON
+
+
+def negotiate_compress(offered, wire):
+    if wire != BIN1:
+        return None
+    for c in offered or ():
+        if c in COMPRESSORS:
+            return c
+    return None
+
+
+# Optional protocol features a client can ask for at login. "prefetch" carries
+# raw bytes (sealed questions), so it is only granted on the binary format.
+# "client_timer" clients render the countdown from the question's deadline
+# and get no per-second timer frames. "chat_batch" clients accept runs of
+# chat folded into one frame when their queue backs up; everyone else gets
+# every chat frame as it was sent.
+PREFETCH = "prefetch"
+CLIENT_TIMER = "client_timer"
+CHAT_BATCH = "chat_batch"
+FEATURES = (PREFETCH, CLIENT_TIMER, CHAT_BATCH)
+BINARY_FEATURES = (PREFETCH,)
+
+
+def negotiate_features(offered, wire):
+    offered = offered or ()
+    return [f for f in FEATURES if f in offered and (wire == BIN1 or f not in BINARY_FEATURES)]
+
+
+def _build_zdict():
+    # zlib favours matches near the end of the dictionary, so the most common
+    # material (frame skeletons) goes last.
+    words = [
+        "Which of the following", "What is the", "How many", "Who was the first",
+        "In which year", "What is the capital of", "Which country", "What does",
+        "stand for", "is known as", "the largest", "the smallest", "in the world",
+        "True", "False", "None of the above", "All of the above", "yes", "no",
+    ]
+    sample = [
+        {"type": "question", "question": w, "choices": ["A", "B", "C", "D"]} for w in words
+    ] + [
+        {"question": "?", "choices": ["1", "2", "3", "4"], "answer": "1"},
+        {"type": "player_list", "players": [{"username": "player", "score": 0}] * 4},
+        {"type": "round_end", "correct": "", "players": [{"username": "player", "score": 1}] * 4},
+    ]
+    return b"".join(pack(m) for m in sample)
+
+
+ZDICT = _build_zdict()
+
+
+# ───────────────────────────────────────────────
+# BENCHMARK: python wire.py
+# ───────────────────────────────────────────────
+def _bench(n=20000):
+    players = [{"username": f"player{i}", "score": i % 7} for i in range(30)]
+    samples = {
+        "timer": {"type": "timer", "remaining": 9},
+        "chat": {"type": "chat", "username": "player3", "message": "good luck!"},
+        "question": {"type": "question", "question": "How many fingers are used on the home row of a keyboard?",
+                     "choices": ["2", "5", "8", "10"]},
+        "round_end": {"type": "round_end", "correct": "8", "players": players},
+    }
+    big = {"action": "upload_questions", "questions": [
+        {"question": f"Which of the following is question number {i}?",
+         "choices": [f"Option {c} for {i}" for c in "ABCD"], "answer": f"Option A for {i}"}
+        for i in range(500)]}
+    for c in (None, ZLIB, ZLIB_DICT):
+        print(f"upload_questions x500 ({c or 'raw'}): {len(encode(big, BIN1, c))} bytes")
+    board = {"type": "player_list", "players": [{"username": f"player{i}", "score": i % 7} for i in range(1000)]}
+    for c in (None, ZLIB, ZLIB_DICT):
+        print(f"player_list x1000 ({c or 'raw'}): {len(encode(board, BIN1, c))} bytes")
+
+    print(f"{'frame':<10} {'json B':>7} {'bin1 B':>7} {'json enc':>9} {'bin1 enc':>9} {'json dec':>9} {'bin1 dec':>9}")
+    for name, msg in samples.items():
+        sizes, enc, dec = [], [], []
+        for w in (JSON, BIN1):
+            data = encode(msg, w)
+            sizes.append(len(data))
+            t0 = time.perf_counter()
+            for _ in range(n):
+                encode(msg, w)
+            enc.append((time.perf_counter() - t0) / n * 1e6)
+            d = Decoder(w)
+            t0 = time.perf_counter()
+            for _ in range(n):
+                d.feed(data)
+                d.next()
+            dec.append((time.perf_counter() - t0) / n * 1e6)
+        print(f"{name:<10} {sizes[0]:>7} {sizes[1]:>7} {enc[0]:>7.2f}us {enc[1]:>7.2f}us {dec[0]:>7.2f}us {dec[1]:>7.2f}us")
+
+    # One 15-second round with 30 players, as seen by a single client.
+    round_frames = [samples["question"]] + [{"type": "timer", "remaining": t} for t in range(15, 0, -1)] + \
+                   [samples["round_end"], {"type": "end_question"}]
+    for w in (JSON, BIN1):
+        print(f"bytes per round ({w}): {sum(len(encode(m, w)) for m in round_frames)}")
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)